@@ -1,24 +1,46 @@
-from fastapi import FastAPI, HTTPException, Query
-from web3 import Web3
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from functools import partial
+from web3 import AsyncWeb3, Web3
 from blockchain import (
-    get_latest_record_logic,
-    get_all_records_logic,
-    get_connection_logic,
+    get_latest_record_logic_async,
+    get_all_records_logic_async,
+    iter_all_records_async,
+    get_connection_logic_async,
     get_account_logic,
-    append_data_logic,
-    get_record_history_logic,
-    delete_record_bc_logic,
+    append_data_logic_async,
+    append_batch_logic_async,
+    NonceManager,
+    get_record_history_logic_async,
+    delete_record_bc_logic_async,
+    RecordIndex,
+    RecordLocator,
+    RecordRegistry,
+    RecordSegmentStore,
+    RecordView,
+    ChainFollower,
+    ParallelBlockFetcher,
+    DecodedBlockCache,
+    KeyRangeFilters,
+    RpcEndpointPool,
+    PooledHTTPProvider,
+    AsyncPooledHTTPProvider,
+    fetch_blocks_async,
 )
 from db import (
-    update_record_logic,
-    get_all_data_logic,
-    get_specific_data_logic,
-    delete_record_db_logic,
+    update_record_logic_async,
+    get_all_data_logic_async,
+    iter_all_data_async,
+    get_specific_data_logic_async,
+    delete_record_db_logic_async,
+    update_records_logic_async,
+    delete_records_db_logic_async,
+    RecordUpdate,
 )
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 from models.models import BlockchainRecord
 from API.tags.tags import tags_metadata
-from typing import Optional, List, Union
-import psycopg2
+from typing import Optional, List, Union, AsyncIterator
 import json
 
 app = FastAPI(
@@ -31,35 +53,209 @@ app = FastAPI(
 
 # Blockchain connection setup
 account, w3 = None, None  # Global variables for simplicity
+# Async client used by the request handlers; `w3` serves the background follower
+async_w3 = None
+# Health and latency of the RPC endpoints behind `w3` and `async_w3`
+rpc_pool = None
+# Nonces of `account` are handed out locally so writes can be sent concurrently
+nonce_manager = None
+# Upper bound on records per /blockchain/append-batch call
+MAX_APPEND_BATCH = 10000
+# Serialization of written records; readers detect every codec and legacy JSON
+RECORD_CODEC = "msgpack"
+record_index, record_view, chain_follower = None, None, None
+# Postgres key -> transaction hash table written by every writer, see RecordLocator
+record_locator = None
+
+# Segment files of the decoded chain records; the view is loaded from them at startup
+# and only syncs the blocks after the last sealed segment
+SEGMENT_STORE_PATH = "../Data/Index/segments"
+segment_store = None
+# Persistent key_field -> transaction index, relative to Src/ like the ETL data paths
+RECORD_INDEX_PATH = "../Data/Index/record_index.sqlite"
+# JSON-RPC endpoints; reads go to the fastest healthy one, writes to the first. Nodes
+# on another chain than the first (e.g. separate --dev chains) are left unused.
+RPC_ENDPOINTS = [
+    "http://127.0.0.1:8545",
+    "http://127.0.0.1:8547",
+    "http://127.0.0.1:8549",
+]
+# WebSocket endpoint of node1 used for newHeads; the follower polls if it is unreachable
+WS_NODE_URL = "ws://127.0.0.1:8546"
+# Blocks requested per JSON-RPC batch when scanning the chain
+BLOCK_BATCH_SIZE = 100
+# Block ranges fetched concurrently while scanning, through the RPC endpoint pool so
+# scans get its health checks, routing and failover
+SCAN_WORKERS = 4
+SCAN_RANGE_SIZE = 500
+block_fetcher = None
+# JSON-RPC batches of BLOCK_BATCH_SIZE blocks in flight at once per async chain scan
+ASYNC_SCAN_CONCURRENCY = SCAN_WORKERS
+async_block_fetcher = partial(
+    fetch_blocks_async,
+    concurrency=ASYNC_SCAN_CONCURRENCY,
+    batch_size=BLOCK_BATCH_SIZE,
+)
+# Decoded records of the most recently read blocks, so repeated scans skip the node.
+# The SQLite tier keeps them across restarts; set the path to None for memory only.
+BLOCK_CACHE_SIZE = 10000
+BLOCK_CACHE_PATH = "../Data/Index/block_cache.sqlite"
+block_cache = None
+# Bloom filters over the keys of every 1024 blocks, letting key scans skip ranges.
+# The record index answers vin and license_plate lookups before any scan, so the
+# filters cover the fields that are left to scans.
+KEY_FILTERS_PATH = "../Data/Index/key_filters.sqlite"
+KEY_FILTER_FIELDS = ("vehicle_make_model", "vehicle_year_make_model")
+key_filters = None
+# "calldata" stores records as contract-creation input; "registry" sends them to a
+# RecordRegistry contract whose indexed logs answer key lookups via eth_getLogs
+RECORD_STORAGE = "calldata"
+# Address of the deployed registry, redeployed when the chain no longer has it
+REGISTRY_PATH = "../Data/Index/record_registry.json"
+record_registry = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
 DB_NAME = "testdb"
 DB_USER = "admin"
 DB_PASSWORD = "your_password"
 DB_HOST = "localhost"
 DB_PORT = "6432"
+DB_CONNINFO = (
+    f"dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD} "
+    f"host={DB_HOST} port={DB_PORT}"
+)
+# Connections shared by the DB endpoints and the record locator; each is checked with
+# a round trip when it is checked out, so one the server dropped is replaced first
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 20
+DB_ACQUIRE_TIMEOUT = 5.0
+# Connections of the record locator, which runs in worker threads
+db_pool = None
+# Async psycopg connections of the /db endpoints, so queries do not block the event loop
+async_db_pool = None
+# Upper bound on keys per /db/update-batch/ and /db/delete-batch/ call
+MAX_DB_BATCH = 10000
 
 # =================================================================================================================================
 # Connections
 # =================================================================================================================================
 
 
-def create_connection(node_ip: str = "http://127.0.0.1:8545") -> None:
-    global account, w3
-    w3 = Web3(Web3.HTTPProvider(node_ip))
+def create_connection(endpoints: List[str] = RPC_ENDPOINTS) -> None:
+    global account, w3, async_w3, rpc_pool, nonce_manager
+    rpc_pool = RpcEndpointPool(endpoints)
+    rpc_pool.start()
+    w3 = Web3(PooledHTTPProvider(rpc_pool))
     if not w3.is_connected():
         raise Exception("Failed to connect to the Ethereum node.")
     account = w3.eth.accounts[0]
+    async_w3 = AsyncWeb3(AsyncPooledHTTPProvider(rpc_pool))
+    nonce_manager = NonceManager(account)
+
+
+def create_block_fetcher() -> None:
+    global block_fetcher, async_block_fetcher
+    # Without endpoints of their own the fetchers read through the pooled w3/async_w3
+    # the routes pass in
+    block_fetcher = ParallelBlockFetcher(
+        workers=SCAN_WORKERS,
+        range_size=SCAN_RANGE_SIZE,
+        batch_size=BLOCK_BATCH_SIZE,
+    )
+    async_block_fetcher = partial(
+        fetch_blocks_async,
+        concurrency=ASYNC_SCAN_CONCURRENCY,
+        batch_size=BLOCK_BATCH_SIZE,
+    )
+
+
+def create_block_cache(
+    max_blocks: int = BLOCK_CACHE_SIZE, path: Optional[str] = BLOCK_CACHE_PATH
+) -> None:
+    global block_cache
+    block_cache = DecodedBlockCache(max_blocks, path)
+
+
+def create_key_filters(
+    path: str = KEY_FILTERS_PATH, key_fields: tuple = KEY_FILTER_FIELDS
+) -> None:
+    global key_filters
+    key_filters = KeyRangeFilters(path, key_fields)
 
 
-def get_db_connection() -> psycopg2._psycopg.connection:
-    """Create and return a new database connection."""
-    return psycopg2.connect(
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT,
+def create_record_index(path: str = RECORD_INDEX_PATH) -> None:
+    global record_index
+    record_index = RecordIndex(path)
+
+
+def create_record_registry(
+    storage: str = RECORD_STORAGE, path: str = REGISTRY_PATH
+) -> None:
+    global record_registry
+    if storage == "registry":
+        record_registry = RecordRegistry.load_or_deploy(w3, account, path)
+    else:
+        # Records sent to a registry before are still decoded by the chain readers
+        RecordRegistry.load(path)
+
+
+def create_record_locator() -> None:
+    global record_locator
+    record_locator = RecordLocator(db_pool.connection)
+    try:
+        record_locator.create_table()
+    except Exception as e:
+        # Reads fall back to the index and chain scans without the database
+        print(f"Record locator disabled: {e}")
+        record_locator = None
+
+
+def create_segment_store(path: str = SEGMENT_STORE_PATH) -> None:
+    global segment_store
+    segment_store = RecordSegmentStore(path)
+
+
+def start_chain_follower(ws_url: str = WS_NODE_URL) -> None:
+    global record_view, chain_follower
+    record_view = RecordView()
+    restored = segment_store.restore(record_view)
+    print(f"Restored {restored} records up to block {segment_store.last_block}")
+    chain_follower = ChainFollower(
+        w3,
+        [record_view, record_index, segment_store],
+        ws_url=ws_url,
+        block_fetcher=block_fetcher,
+    )
+    chain_follower.start()
+
+
+def create_db_pool() -> None:
+    global db_pool
+    db_pool = ConnectionPool(
+        DB_CONNINFO,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_ACQUIRE_TIMEOUT,
+        check=ConnectionPool.check_connection,
+        open=False,
     )
+    # Connections are opened in the background, startup does not wait for the database
+    db_pool.open(wait=False)
+
+
+async def create_async_db_pool() -> None:
+    global async_db_pool
+    async_db_pool = AsyncConnectionPool(
+        DB_CONNINFO,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_ACQUIRE_TIMEOUT,
+        check=AsyncConnectionPool.check_connection,
+        open=False,
+    )
+    # Connections are opened in the background, startup does not wait for the database
+    await async_db_pool.open(wait=False)
 
 
 # =================================================================================================================================
@@ -71,12 +267,52 @@ def get_db_connection() -> psycopg2._psycopg.connection:
 def setup() -> None:
     try:
         create_connection()
+        create_block_fetcher()
+        create_block_cache()
+        create_key_filters()
+        create_record_index()
+        create_db_pool()
+        create_record_locator()
+        create_record_registry()
+        create_segment_store()
+        start_chain_follower()
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Blockchain connection error: {str(e)}"
         )
 
 
+@app.on_event("startup")
+async def setup_async() -> None:
+    await create_async_db_pool()
+
+
+@app.on_event("shutdown")
+async def teardown_async() -> None:
+    if async_db_pool is not None:
+        await async_db_pool.close()
+
+
+@app.on_event("shutdown")
+def teardown() -> None:
+    if rpc_pool is not None:
+        rpc_pool.stop()
+    if chain_follower is not None:
+        chain_follower.stop()
+    if segment_store is not None:
+        # Sealing the tail lets the next start skip the blocks synced since the last segment
+        segment_store.flush()
+        segment_store.close()
+    if block_fetcher is not None:
+        block_fetcher.close()
+    if block_cache is not None:
+        block_cache.close()
+    if key_filters is not None:
+        key_filters.close()
+    if db_pool is not None:
+        db_pool.close()
+
+
 @app.get("/", tags=["General"])
 def root() -> dict:
     return {
@@ -100,38 +336,172 @@ def favicon() -> dict:
 
 
 @app.get("/blockchain/test-connection", tags=["Blockchain Operations"])
-def get_connection() -> dict:
-    return get_connection_logic(w3)
+async def get_connection() -> dict:
+    return await get_connection_logic_async(async_w3)
 
 
 @app.get("/blockchain/test-account", tags=["Blockchain Operations"])
-def get_account() -> dict:
+async def get_account() -> dict:
     return get_account_logic(account)
 
 
-@app.get("/blockchain/all-records", tags=["Blockchain Operations"])
-def get_all_records() -> list:
-    return get_all_records_logic(w3)
+async def ndjson_stream(records: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Serialize records as newline-delimited JSON, one line per record."""
+    try:
+        async for record in records:
+            yield json.dumps(record, default=str) + "\n"
+    except Exception as e:
+        # Headers are already sent, so the failure is reported as the last line
+        yield json.dumps({"error": f"Error retrieving record: {str(e)}"}) + "\n"
+
+
+@app.get("/blockchain/all-records", tags=["Blockchain Operations"], response_model=None)
+async def get_all_records(
+    request: Request,
+    stream: bool = False,
+    from_block: Optional[int] = Query(None, ge=0),
+    to_block: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+) -> Union[list, dict, StreamingResponse]:
+    """
+    Return every record, or stream them as NDJSON with ?stream=true or Accept: application/x-ndjson.
+
+    With `limit` or `cursor` a page {"records", "next_cursor"} is returned; pass
+    `next_cursor` back as `cursor` to continue.
+    """
+    if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            ndjson_stream(
+                iter_all_records_async(
+                    async_w3,
+                    record_view,
+                    async_block_fetcher,
+                    from_block,
+                    to_block,
+                    limit,
+                    cursor,
+                    block_cache,
+                )
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    return await get_all_records_logic_async(
+        async_w3,
+        record_view,
+        async_block_fetcher,
+        from_block,
+        to_block,
+        limit,
+        cursor,
+        block_cache,
+    )
 
 
 @app.get("/blockchain/latest-record", tags=["Blockchain Operations"])
-def get_latest_record(key: str, key_field: str = "vin") -> dict:
-    return get_latest_record_logic(w3, key, key_field)
+async def get_latest_record(
+    key: str, key_field: str = "vin", max_depth: Optional[int] = Query(None, ge=1)
+) -> dict:
+    return await get_latest_record_logic_async(
+        async_w3,
+        key,
+        key_field,
+        record_index,
+        record_view,
+        async_block_fetcher,
+        max_depth,
+        block_cache,
+        record_locator,
+        key_filters,
+        record_registry,
+    )
 
 
 @app.post("/blockchain/append-data", tags=["Blockchain Operations"])
-def append_data(record: BlockchainRecord) -> dict:
-    return append_data_logic(w3, account, record)
+async def append_data(record: BlockchainRecord) -> dict:
+    return await append_data_logic_async(
+        async_w3,
+        account,
+        record,
+        nonce_manager,
+        RECORD_CODEC,
+        record_locator,
+        record_registry,
+    )
+
+
+@app.post("/blockchain/append-batch", tags=["Blockchain Operations"])
+async def append_batch(records: List[BlockchainRecord]) -> dict:
+    """Store every record in its own transaction, sent as sequential JSON-RPC batches."""
+    if len(records) > MAX_APPEND_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_APPEND_BATCH} records can be appended per call",
+        )
+    return await append_batch_logic_async(
+        async_w3,
+        account,
+        records,
+        nonce_manager,
+        codec=RECORD_CODEC,
+        locator=record_locator,
+        registry=record_registry,
+    )
 
 
 @app.get("/blockchain/record-history", tags=["Blockchain Operations"])
-def get_record_history(key: str, key_field: str = "vin") -> list:
-    return get_record_history_logic(w3, key, key_field)
+async def get_record_history(
+    key: str,
+    key_field: str = "vin",
+    from_block: Optional[int] = Query(None, ge=0),
+    to_block: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+) -> Union[list, dict]:
+    return await get_record_history_logic_async(
+        async_w3,
+        key,
+        key_field,
+        record_index,
+        record_view,
+        async_block_fetcher,
+        from_block,
+        to_block,
+        limit,
+        cursor,
+        block_cache,
+        record_locator,
+        key_filters,
+        record_registry,
+    )
+
+
+@app.get("/blockchain/cache-stats", tags=["Blockchain Operations"])
+async def get_cache_stats() -> dict:
+    if block_cache is None:
+        raise HTTPException(status_code=503, detail="Block cache is not configured")
+    return block_cache.stats()
+
+
+@app.get("/blockchain/rpc-stats", tags=["Blockchain Operations"])
+async def get_rpc_stats() -> dict:
+    if rpc_pool is None:
+        raise HTTPException(status_code=503, detail="RPC pool is not configured")
+    return rpc_pool.stats()
 
 
 @app.delete("/blockchain/delete-record", tags=["Blockchain Operations"])
-def delete_bc_record(key: str, key_field: str = "vin") -> dict:
-    return delete_record_bc_logic(w3, account, key, key_field)
+async def delete_bc_record(key: str, key_field: str = "vin") -> dict:
+    return await delete_record_bc_logic_async(
+        async_w3,
+        account,
+        key,
+        key_field,
+        nonce_manager,
+        RECORD_CODEC,
+        record_locator,
+        record_registry,
+    )
 
 
 # =================================================================================================================================
@@ -139,10 +509,28 @@ def delete_bc_record(key: str, key_field: str = "vin") -> dict:
 # =================================================================================================================================
 
 
-@app.get("/db/retrieve/all/", tags=["Database Operations"])
-async def get_all_data() -> dict:
-    """Retrieve data from the database."""
-    return {"data": get_all_data_logic(get_db_connection)}
+@app.get("/db/retrieve/all/", tags=["Database Operations"], response_model=None)
+async def get_all_data(
+    request: Request,
+    stream: bool = False,
+    after_vin: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+) -> Union[dict, StreamingResponse]:
+    """
+    Retrieve data from the database, or stream it as NDJSON with ?stream=true or Accept: application/x-ndjson.
+
+    With `limit` or `after_vin` the rows come in vin order as a page
+    {"data", "next_after_vin"}; pass `next_after_vin` back as `after_vin` to continue.
+    """
+    if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            ndjson_stream(
+                iter_all_data_async(async_db_pool.connection, after_vin, limit)
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    result = await get_all_data_logic_async(async_db_pool.connection, after_vin, limit)
+    return result if isinstance(result, dict) else {"data": result}
 
 
 @app.get("/db/retrieve/specific/", tags=["Database Operations"])
@@ -151,8 +539,12 @@ async def get_specific_data(
     key_field: Optional[str] = Query(None),
     params: Optional[List[str]] = Query(None),
 ) -> dict:
-    """Retrieve data from the database."""
-    return {"data": get_specific_data_logic(get_db_connection, key, key_field, params)}
+    """Retrieve data from the database, only the `params` columns when given."""
+    return {
+        "data": await get_specific_data_logic_async(
+            async_db_pool.connection, key, key_field, params
+        )
+    }
 
 
 @app.put("/db/update/", tags=["Database Operations"])
@@ -160,10 +552,49 @@ async def update_record(
     update_values: dict, key: str, key_field: Optional[str] = Query(None)
 ):
     """Update a record in the database."""
-    return update_record_logic(get_db_connection, update_values, key, key_field)
+    return await update_record_logic_async(
+        async_db_pool.connection, update_values, key, key_field
+    )
 
 
 @app.delete("/db/delete/", tags=["Database Operations"])
 async def delete_record(key: str, key_field: Optional[str] = Query(None)) -> dict:
     """Delete a record from the database."""
-    return delete_record_db_logic(get_db_connection, key, key_field)
+    return await delete_record_db_logic_async(async_db_pool.connection, key, key_field)
+
+
+@app.put("/db/update-batch/", tags=["Database Operations"])
+async def update_records(
+    updates: List[RecordUpdate], key_field: Optional[str] = Query(None)
+) -> dict:
+    """Update many records in one transaction, as one statement per set of columns."""
+    if len(updates) > MAX_DB_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_DB_BATCH} records can be updated per call",
+        )
+    return await update_records_logic_async(
+        async_db_pool.connection, updates, key_field
+    )
+
+
+@app.delete("/db/delete-batch/", tags=["Database Operations"])
+async def delete_records(
+    keys: List[str] = Body(...), key_field: Optional[str] = Query(None)
+) -> dict:
+    """Delete the records with any of `keys` in one statement."""
+    if len(keys) > MAX_DB_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_DB_BATCH} records can be deleted per call",
+        )
+    return await delete_records_db_logic_async(
+        async_db_pool.connection, keys, key_field
+    )
+
+
+@app.get("/db/pool-stats", tags=["Database Operations"])
+async def get_pool_stats() -> dict:
+    if db_pool is None or async_db_pool is None:
+        raise HTTPException(status_code=503, detail="Database pool is not configured")
+    return {"locator": db_pool.get_stats(), "requests": async_db_pool.get_stats()}
@@ -1,5 +1,5 @@
 # from dagster import asset
-from dagster import op, job, Out, In, Nothing, String, repository
+from dagster import op, job, Field, Out, In, Int, Nothing, String, repository
 from ETL import (
     create_fake_data,
     transform_data,
@@ -38,12 +38,37 @@ def load_data_op(context) -> None:
     context.log.info(f"Finished loading data of size: {data_size}")
 
 
-@op(config_schema={"data_size": String}, ins={"start": In(Nothing)}, out=Out(Nothing))
+@op(
+    config_schema={
+        "data_size": String,
+        # Records per transaction; above 1 the records are packed into envelopes
+        "pack_size": Field(Int, is_required=False, default_value=1),
+        # Record codec, e.g. "json" (legacy), "msgpack" or "msgpack+zlib"
+        "codec": Field(String, is_required=False, default_value="json"),
+        # Transactions awaiting a receipt at any time
+        "in_flight": Field(Int, is_required=False, default_value=256),
+        # "calldata" (contract-creation input) or "registry" (indexed contract logs)
+        "storage": Field(String, is_required=False, default_value="calldata"),
+    },
+    ins={"start": In(Nothing)},
+    out=Out(Nothing),
+)
 def bc_insert_data_op(context) -> None:
     data_size = context.op_config["data_size"]
     context.log.info(f"Starting to insert blockchain data of size: {data_size}")
-    bc_insert_data(data_size)
-    context.log.info(f"Finished inserting blockchain data of size: {data_size}")
+    report = bc_insert_data(
+        data_size,
+        context.op_config["pack_size"],
+        context.op_config["codec"],
+        context.op_config["in_flight"],
+        context.op_config["storage"],
+    )
+    context.log.info(
+        f"Finished inserting blockchain data of size: {data_size} "
+        f"({report['confirmed_records']}/{report['records']} records confirmed, "
+        f"{report['records_per_second']:.1f} records/s, "
+        f"{len(report['failures'])} failures)"
+    )
 
 
 @op(config_schema={"data_size": String}, ins={"start": In(Nothing)}, out=Out(Nothing))
@@ -2,11 +2,13 @@ from .extract import create_fake_data
 from .transform import transform_data
 from .load import load_data
 from .cleanup import cleanup_data
+from .bc_loader import ChainLoader, LoadCheckpoint
 from .insert_bc import (
     bc_insert_data,
     create_connection,
     read_data,
     store_data_in_blockchain,
+    store_packed_in_blockchain,
     store_data,
 )
 from .insert_db import db_insert_data
@@ -17,9 +19,12 @@ __all__ = [
     "load_data",
     "cleanup_data",
     "bc_insert_data",
+    "ChainLoader",
+    "LoadCheckpoint",
     "create_connection",
     "read_data",
     "store_data_in_blockchain",
+    "store_packed_in_blockchain",
     "store_data",
     "db_insert_data",
 ]
@@ -0,0 +1,419 @@
+import json
+import os
+import time
+from collections import deque
+from typing import Iterable, Optional
+from web3 import Web3
+from web3.types import ChecksumAddress
+from blockchain.appendBatch import rpc_transaction
+from blockchain.recordCodec import encode_record
+from blockchain.recordEnvelope import pack_batches, pack_records
+from blockchain.recordLocator import RecordLocator
+from blockchain.recordRegistry import RecordRegistry
+
+
+def build_data_transaction(
+    data_hex: str,
+    account: ChecksumAddress,
+    w3: Web3,
+    to: Optional[ChecksumAddress] = None,
+) -> dict:
+    return {
+        "from": account,
+        "to": to,  # Null address for data-only transaction, else the registry
+        "value": 0,  # No Ether transfer
+        "gas": 3000000,  # Gas limit
+        "gasPrice": w3.to_wei("20", "gwei"),
+        "data": data_hex,
+    }
+
+
+def row_ranges(rows: Iterable[int]) -> list[list[int]]:
+    """Collapse ascending row numbers into [start, end) ranges of consecutive rows."""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+    return ranges
+
+
+class LoadCheckpoint:
+    """
+    Progress of a chain load persisted as JSON, so a restarted load resumes instead
+    of storing every record again.
+
+    `rows` is the number of leading rows that are confirmed and `tx_hash` the
+    transaction holding the last of them. `confirmed` lists the [start, end) ranges
+    of rows confirmed past `rows` (transactions in flight finish out of order and
+    rows fail) and `failed` the ranges of rows that failed for good. A resumed
+    load skips both; remove the `failed` ranges to retry them. `dataset` identifies
+    the input (e.g. a hash of the data file); a checkpoint written for other data is
+    ignored.
+    """
+
+    def __init__(self, path: str, dataset: str) -> None:
+        self.path = path
+        self.dataset = dataset
+        self.rows = 0
+        self.tx_hash = None
+        self.confirmed = []
+        self.failed = []
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("dataset") == dataset:
+                self.rows = saved["rows"]
+                self.tx_hash = saved["tx_hash"]
+                self.confirmed = saved.get("confirmed", [])
+                self.failed = saved.get("failed", [])
+            else:
+                print(f"Ignoring checkpoint {path} written for other data")
+
+    def settled(self, count: int) -> list[bool]:
+        """Whether each of `count` rows is confirmed or failed for good."""
+        settled = [row < self.rows for row in range(count)]
+        for start, end in self.confirmed + self.failed:
+            settled[start:end] = [True] * (min(end, count) - min(start, count))
+        return settled
+
+    def save(
+        self,
+        rows: int,
+        tx_hash: Optional[str],
+        confirmed: list[list[int]] = (),
+        failed: list[list[int]] = (),
+    ) -> None:
+        self.rows, self.tx_hash = rows, tx_hash
+        self.confirmed, self.failed = list(confirmed), list(failed)
+        # Write then rename, so a crash leaves the old or the new checkpoint intact
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "dataset": self.dataset,
+                    "rows": rows,
+                    "tx_hash": tx_hash,
+                    "confirmed": self.confirmed,
+                    "failed": self.failed,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class ChainLoader:
+    """
+    Loads records onto the chain with many transactions in flight at once.
+
+    Nonces are assigned locally, transactions are submitted as JSON-RPC batches of
+    `batch_size` and at most `in_flight` of them wait for a receipt at any time.
+    Receipts are polled in batches too, so a load costs a few round trips per
+    `batch_size` records instead of one per record.
+
+    A transaction counts as confirmed once it has a receipt: the record is in a block
+    even if the contract creation itself reverted. A send the node keeps rejecting, or
+    a transaction without a receipt after `receipt_timeout`, is reported as failed and
+    its nonce is filled with an empty transfer, so the transactions after it can
+    still be mined.
+
+    With a `LoadCheckpoint` the load skips the rows it already settled and records
+    every row confirmed or failed for good after each receipt poll. With a `RecordLocator`
+    the position of every confirmed record is written to it. With a `RecordRegistry`
+    every record is sent to the registry contract (one record per transaction).
+    """
+
+    def __init__(
+        self,
+        w3: Web3,
+        account: ChecksumAddress,
+        in_flight: int = 256,
+        batch_size: int = 100,
+        pack_size: int = 1,
+        codec: str = "json",
+        poll_interval: float = 0.25,
+        receipt_timeout: float = 300.0,
+        retries: int = 3,
+        locator: Optional[RecordLocator] = None,
+        registry: Optional[RecordRegistry] = None,
+    ) -> None:
+        if registry is not None and pack_size > 1:
+            raise ValueError("Registry loads store one record per transaction")
+        self.w3 = w3
+        self.account = account
+        self.in_flight = in_flight
+        self.batch_size = batch_size
+        self.pack_size = pack_size
+        self.codec = codec
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.retries = retries
+        self.locator = locator
+        self.registry = registry
+        self._data = []  # data_hex of each payload of the running load
+
+    def _payloads(
+        self, records: list[dict], rows: Optional[list[int]] = None
+    ) -> list[tuple]:
+        """(first_row, row_count, data_hex) for each transaction storing `rows`."""
+        rows = range(len(records)) if rows is None else rows
+        if self.registry is not None:
+            return [
+                (row, 1, Web3.to_hex(self.registry.calldata(records[row], self.codec)))
+                for row in rows
+            ]
+        if self.pack_size <= 1:
+            return [
+                (row, 1, Web3.to_hex(encode_record(records[row], self.codec)))
+                for row in rows
+            ]
+        payloads = []
+        for start, end in row_ranges(rows):  # Packed records are consecutive rows
+            row = start
+            for group in pack_batches(
+                records[start:end], self.pack_size, codec=self.codec
+            ):
+                payloads.append(
+                    (row, len(group), Web3.to_hex(pack_records(group, self.codec)))
+                )
+                row += len(group)
+        return payloads
+
+    def _send(self, sends: list) -> list:
+        """Submit (payload_index, nonce, attempt) entries in one batch, return the responses."""
+        responses = self.w3.provider.make_batch_request(
+            [
+                (
+                    "eth_sendTransaction",
+                    [
+                        rpc_transaction(
+                            {
+                                **build_data_transaction(
+                                    self._data[index],
+                                    self.account,
+                                    self.w3,
+                                    self.registry.address if self.registry else None,
+                                ),
+                                "nonce": nonce,
+                            }
+                        )
+                    ],
+                )
+                for index, nonce, _ in sends
+            ]
+        )
+        if not isinstance(responses, list):  # The whole batch was rejected
+            responses = [responses] * len(sends)
+        return responses
+
+    def _fill_nonce(self, nonce: int, replace: bool = False) -> None:
+        """
+        Use up a nonce whose transaction failed so later nonces are not stuck. With
+        `replace` the empty transfer outbids the data transactions' gas price, so it
+        also replaces a transaction still waiting in the node's pool.
+        """
+        transaction = {
+            "from": self.account,
+            "to": self.account,
+            "value": 0,
+            "nonce": nonce,
+        }
+        if replace:
+            transaction["gasPrice"] = 2 * self.w3.to_wei("20", "gwei")
+        try:
+            self.w3.eth.send_transaction(transaction)
+        except Exception as e:  # pragma: no cover
+            print(f"Error filling nonce {nonce}: {e}")
+
+    def _poll(self, pending: dict) -> list:
+        """Return (tx_hash, receipt) for the pending transactions that were mined."""
+        mined = []
+        tx_hashes = list(pending)
+        for offset in range(0, len(tx_hashes), self.batch_size):
+            chunk = tx_hashes[offset : offset + self.batch_size]
+            responses = self.w3.provider.make_batch_request(
+                [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in chunk]
+            )
+            if not isinstance(responses, list):  # pragma: no cover
+                continue
+            mined.extend(
+                (tx_hash, response["result"])
+                for tx_hash, response in zip(chunk, responses)
+                if response.get("result")
+            )
+        return mined
+
+    @staticmethod
+    def _save_checkpoint(
+        checkpoint: LoadCheckpoint,
+        settled: list[bool],
+        positions: list,
+        failed_rows: set,
+        end: int,
+    ) -> None:
+        """Save the rows settled so far, `end` being past the last settled row."""
+        failed_rows = failed_rows.union(
+            *(range(start, stop) for start, stop in checkpoint.failed)
+        )
+        # The prefix stops at a failed row, so removing its range retries it
+        rows, tx_hash = checkpoint.rows, checkpoint.tx_hash
+        while rows < len(settled) and settled[rows] and rows not in failed_rows:
+            if positions[rows] is not None:
+                tx_hash = positions[rows][3]
+            rows += 1
+        confirmed = row_ranges(
+            row for row in range(rows, end) if settled[row] and row not in failed_rows
+        )
+        failed = row_ranges(sorted(failed_rows))
+        checkpoint.save(rows, tx_hash, confirmed, failed)
+
+    def load(
+        self, records: list[dict], checkpoint: Optional[LoadCheckpoint] = None
+    ) -> dict:
+        """
+        Store every record and wait until each transaction is mined.
+
+        Returns:
+            dict: Throughput and failure report. `positions` holds the
+            (block_number, tx_index, slot, tx_hash) of each record stored by this
+            run (None if it failed or was settled by an earlier run).
+        """
+        started = time.monotonic()
+        resumed_from = checkpoint.rows if checkpoint else 0
+        settled = (
+            checkpoint.settled(len(records)) if checkpoint else [False] * len(records)
+        )
+        rows = [row for row in range(len(records)) if not settled[row]]
+        payloads = self._payloads(records, rows)
+        self._data = [data_hex for *_, data_hex in payloads]
+        positions = [None] * len(records)
+        failed_rows = set()
+        end = (
+            max((stop for _, stop in checkpoint.confirmed), default=0)
+            if checkpoint
+            else 0
+        )
+        changed = False
+        failures = []
+        reverted = 0
+        confirmed = 0
+
+        nonce = self.w3.eth.get_transaction_count(self.account, "pending")
+        retry = deque()  # (payload_index, nonce, attempt) rejected by the node
+        pending = {}  # tx_hash -> (payload_index, nonce, sent_at)
+        next_payload = 0
+
+        def fail(index: int, tx_hash: str, error: str) -> None:
+            nonlocal end, changed
+            first_row, row_count, _ = payloads[index]
+            failed_rows.update(range(first_row, first_row + row_count))
+            settled[first_row : first_row + row_count] = [True] * row_count
+            end, changed = max(end, first_row + row_count), True
+            failures.append(
+                {
+                    "rows": [first_row, first_row + row_count],
+                    "tx_hash": tx_hash,
+                    "error": error,
+                }
+            )
+
+        while next_payload < len(payloads) or retry or pending:
+            room = min(self.in_flight - len(pending), self.batch_size)
+            sends = []
+            while retry and len(sends) < room:
+                sends.append(retry.popleft())
+            while next_payload < len(payloads) and len(sends) < room:
+                sends.append((next_payload, nonce, 1))
+                next_payload += 1
+                nonce += 1
+
+            if sends:
+                now = time.monotonic()
+                for (index, tx_nonce, attempt), response in zip(
+                    sends, self._send(sends)
+                ):
+                    if "error" not in response:
+                        pending[response["result"]] = (index, tx_nonce, now)
+                    elif attempt < self.retries:
+                        retry.append((index, tx_nonce, attempt + 1))
+                    else:
+                        fail(index, None, str(response["error"]))
+                        self._fill_nonce(tx_nonce)
+                if len(pending) < self.in_flight and (
+                    next_payload < len(payloads) or retry
+                ):
+                    continue  # Keep filling the window before polling
+
+            mined = self._poll(pending)
+            located = []
+            for tx_hash, receipt in mined:
+                index, *_ = pending.pop(tx_hash)
+                first_row, row_count, _ = payloads[index]
+                block_number = int(receipt["blockNumber"], 16)
+                tx_index = int(receipt["transactionIndex"], 16)
+                for slot in range(row_count):
+                    positions[first_row + slot] = (
+                        block_number,
+                        tx_index,
+                        slot,
+                        tx_hash,
+                    )
+                    located.append(
+                        (
+                            records[first_row + slot],
+                            tx_hash,
+                            slot,
+                            block_number,
+                            tx_index,
+                        )
+                    )
+                settled[first_row : first_row + row_count] = [True] * row_count
+                end, changed = max(end, first_row + row_count), True
+                confirmed += 1
+                reverted += receipt.get("status") == "0x0"
+            if self.locator is not None and located:
+                try:
+                    self.locator.add(located)
+                except Exception as e:
+                    print(f"Error updating record locator: {e}")
+
+            now = time.monotonic()
+            for tx_hash, (index, tx_nonce, sent_at) in list(pending.items()):
+                if now - sent_at > self.receipt_timeout:
+                    del pending[tx_hash]
+                    fail(index, tx_hash, "Transaction was not mined in time")
+                    # The transaction may have been dropped or may still be waiting
+                    self._fill_nonce(tx_nonce, replace=True)
+            if checkpoint and changed:
+                self._save_checkpoint(checkpoint, settled, positions, failed_rows, end)
+                changed = False
+            if not mined and pending:
+                time.sleep(self.poll_interval)
+
+        seconds = time.monotonic() - started
+        confirmed_records = sum(position is not None for position in positions)
+        remaining = len(rows)
+        report = {
+            "records": len(records),
+            "resumed_from": resumed_from,
+            "transactions": len(payloads),
+            "confirmed_records": confirmed_records,
+            "confirmed_transactions": confirmed,
+            "reverted_transactions": reverted,
+            "failed_records": remaining - confirmed_records,
+            "failures": failures,
+            "seconds": seconds,
+            "tx_per_second": confirmed / seconds if seconds else 0.0,
+            "records_per_second": confirmed_records / seconds if seconds else 0.0,
+            "positions": positions,
+        }
+        print(
+            f"Loaded {confirmed_records}/{remaining} records in {confirmed} transactions "
+            f"in {seconds:.1f}s ({report['tx_per_second']:.1f} tx/s, "
+            f"{report['records_per_second']:.1f} records/s), {len(failures)} failures"
+            + (f", resumed after row {resumed_from}" if resumed_from else "")
+        )
+        return report
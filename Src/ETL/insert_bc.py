@@ -1,14 +1,33 @@
+import hashlib
 from web3 import Web3
 import polars as pl
-import json
+from typing import Optional
 from web3.types import ChecksumAddress
+from blockchain.recordCodec import encode_record
+from blockchain.recordEnvelope import pack_batches, pack_records
+from blockchain.recordLocator import RecordLocator, locate_sent
+from blockchain.recordRegistry import RecordRegistry
+from blockchain.rpcPool import PooledHTTPProvider, RpcEndpointPool
+from psycopg_pool import ConnectionPool
+from .bc_loader import ChainLoader, LoadCheckpoint, build_data_transaction
+from .insert_db import DB_CONNINFO
+
+
+RPC_ENDPOINTS = [
+    "http://127.0.0.1:8545",
+    "http://127.0.0.1:8547",
+    "http://127.0.0.1:8549",
+]
 
 
 def create_connection(
-    node_ip: str = "http://127.0.0.1:8545",
+    endpoints: list[str] = RPC_ENDPOINTS,
 ) -> tuple:  # pragma: no cover
-    # Connect to the local Ethereum node
-    w3 = Web3(Web3.HTTPProvider(node_ip))
+    # Connect to the local Ethereum nodes; transactions go to the first, receipt
+    # polls to the fastest node on the same chain
+    pool = RpcEndpointPool(endpoints)
+    pool.check()
+    w3 = Web3(PooledHTTPProvider(pool))
 
     # Check connection
     if not w3.is_connected():
@@ -37,37 +56,123 @@ def read_data(data_path: str = "data.parquet") -> list[dict]:
     return df.to_dicts()
 
 
-def store_data_in_blockchain(
-    data_to_store: dict, account: ChecksumAddress, w3: Web3
-) -> str:
-    # Convert the data to hexadecimal (Ethereum stores data in hex)
-    data_hex = Web3.to_hex(text=json.dumps(data_to_store))
-
+def send_data_transaction(data_hex: str, account: ChecksumAddress, w3: Web3) -> str:
     # Create and send a transaction
-    tx = {
-        "from": account,
-        "to": None,  # Null address for data-only transaction
-        "value": 0,  # No Ether transfer
-        "gas": 3000000,  # Gas limit
-        "gasPrice": w3.to_wei("20", "gwei"),
-        "data": data_hex,
-    }
+    tx = build_data_transaction(data_hex, account, w3)
     tx_hash = w3.eth.send_transaction(tx)
     return tx_hash
 
 
-def store_data(data: list, account: ChecksumAddress, w3: Web3, tx_hashes: list) -> list:
-    for record in data:
-        tx_hash = store_data_in_blockchain(record, account, w3)
-        # print(f"Stored record with transaction hash: {tx_hash.hex()}")
-        tx_hashes.append(tx_hash)
+def store_data_in_blockchain(
+    data_to_store: dict, account: ChecksumAddress, w3: Web3, codec: str = "json"
+) -> str:
+    # Serialize with the record codec and convert to hexadecimal (Ethereum stores data in hex)
+    data_hex = Web3.to_hex(encode_record(data_to_store, codec))
+    return send_data_transaction(data_hex, account, w3)
+
+
+def store_packed_in_blockchain(
+    records: list[dict], account: ChecksumAddress, w3: Web3, codec: str = "json"
+) -> str:
+    """Store several records in one transaction as a packed envelope."""
+    return send_data_transaction(Web3.to_hex(pack_records(records, codec)), account, w3)
+
+
+def store_data(
+    data: list,
+    account: ChecksumAddress,
+    w3: Web3,
+    tx_hashes: list,
+    pack_size: int = 1,
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+) -> list:
+    """
+    Store every record on the chain, serialized with `codec` (e.g. "msgpack").
+
+    With `pack_size` > 1, up to `pack_size` records share one transaction and
+    `tx_hashes` receives a (tx_hash, slot) position per record instead of a hash.
+    With a `locator` every record's transaction is recorded in it as it is sent.
+    """
+    if pack_size <= 1:
+        for record in data:
+            tx_hash = store_data_in_blockchain(record, account, w3, codec)
+            # print(f"Stored record with transaction hash: {tx_hash.hex()}")
+            tx_hashes.append(tx_hash)
+            locate_sent(locator, [(record, tx_hash, 0)])
+        return tx_hashes
+
+    for records in pack_batches(data, pack_size, codec=codec):
+        tx_hash = store_packed_in_blockchain(records, account, w3, codec)
+        tx_hashes.extend((tx_hash, slot) for slot in range(len(records)))
+        locate_sent(
+            locator, ((record, tx_hash, slot) for slot, record in enumerate(records))
+        )
     return tx_hashes
 
 
-def bc_insert_data(size: str) -> None:
-    tx_hashes = []
-    account, w3 = create_connection()
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
 
-    data = read_data(f"../Data/Transform/{size}/data.parquet")
+REGISTRY_PATH = "../Data/Index/record_registry.json"
 
-    store_data(data, account, w3, tx_hashes)
+
+def bc_insert_data(
+    size: str,
+    pack_size: int = 1,
+    codec: str = "json",
+    in_flight: int = 256,
+    storage: str = "calldata",
+) -> dict:
+    """
+    Load the transformed data of `size` onto the chain with up to `in_flight`
+    transactions awaiting a receipt, and return the loader report.
+
+    Progress is checkpointed next to the data, so rerunning after a crash only
+    stores the rows that were not confirmed yet. Confirmed records are added to the
+    record locator table when the database is reachable. With `storage="registry"`
+    the records are emitted as indexed logs of the registry contract the API uses.
+    """
+    account, w3 = create_connection()
+    registry = None
+    if storage == "registry":
+        registry = RecordRegistry.load_or_deploy(w3, account, REGISTRY_PATH)
+
+    data_path = f"../Data/Transform/{size}/data.parquet"
+    data = read_data(data_path)
+    checkpoint = LoadCheckpoint(
+        f"../Data/Transform/{size}/bc_checkpoint.json", file_digest(data_path)
+    )
+
+    # The loader writes to the locator after every receipt poll
+    db_pool = ConnectionPool(
+        DB_CONNINFO,
+        min_size=0,
+        max_size=2,
+        timeout=5.0,
+        # Checked out connections are tested first, a dropped one is replaced
+        check=ConnectionPool.check_connection,
+        open=True,
+    )
+    locator = RecordLocator(db_pool.connection)
+    try:
+        locator.create_table()
+    except Exception as e:
+        print(f"Loading without the record locator: {e}")
+        locator = None
+
+    loader = ChainLoader(
+        w3,
+        account,
+        in_flight=in_flight,
+        pack_size=pack_size,
+        codec=codec,
+        locator=locator,
+        registry=registry,
+    )
+    try:
+        return loader.load(data, checkpoint)
+    finally:
+        db_pool.close()
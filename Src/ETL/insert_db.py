@@ -7,6 +7,30 @@ DB_USER = "admin"
 DB_PASSWORD = "your_password"
 DB_HOST = "localhost"
 DB_PORT = "6432"
+DB_CONNINFO = (
+    f"dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD} "
+    f"host={DB_HOST} port={DB_PORT}"
+)
+
+# Added after the bulk load, so rows are inserted without maintaining any index
+PRIMARY_KEY = "vin"
+# Missing or repeated keys listed when the primary key cannot be added
+REPORTED_KEYS = 20
+# Index name suffix -> columns; indexes whose columns the table lacks are skipped
+LOOKUP_INDEXES = {
+    "license_plate": ("license_plate",),
+    "make_model_year": ("vehicle_make", "vehicle_model", "vehicle_year"),
+}
+
+
+def get_db_connection() -> psycopg2.extensions.connection:
+    return psycopg2.connect(
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
 
 
 def load_and_prepare_data(parquet_file_path: str) -> pl.DataFrame:  # pragma: no cover
@@ -61,13 +85,7 @@ def create_table_from_df(table_name: str, df: pl.DataFrame) -> None:
     # Connect to PostgreSQL and execute the query
     conn = None
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
+        conn = get_db_connection()
         with conn.cursor() as cur:
             cur.execute(create_table_query)
             conn.commit()
@@ -93,16 +111,14 @@ def insert_data_into_db(df: pl.DataFrame, table_name: str) -> None:  # pragma: n
     # Database connection
     conn = None
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT,
-        )
+        conn = get_db_connection()
         with conn.cursor() as cur:
             # Create an insert query dynamically
-            insert_query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s"
+            # Rows already loaded are kept once the table has its primary key
+            insert_query = (
+                f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s "
+                "ON CONFLICT DO NOTHING"
+            )
             execute_values(cur, insert_query, rows)
             conn.commit()
             print(f"{len(rows)} records successfully inserted into {table_name}.")
@@ -113,6 +129,58 @@ def insert_data_into_db(df: pl.DataFrame, table_name: str) -> None:  # pragma: n
             conn.close()
 
 
+def create_indexes(table_name: str, columns: list) -> None:
+    """
+    Declare the primary key and the lookup indexes of a loaded table.
+
+    The key and `LOOKUP_INDEXES` are created if they do not exist yet and the table is
+    analyzed, so key lookups become index scans. Rows with a missing or repeated
+    `PRIMARY_KEY` are never dropped here: a `ValueError` listing them is raised and
+    the data has to be fixed before loading.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass "
+                "AND contype = 'p'",
+                (table_name,),
+            )
+            if cur.fetchone() is None:
+                cur.execute(
+                    f"SELECT {PRIMARY_KEY}, count(*) FROM {table_name} "
+                    f"GROUP BY {PRIMARY_KEY} "
+                    f"HAVING {PRIMARY_KEY} IS NULL OR count(*) > 1 "
+                    f"ORDER BY count(*) DESC LIMIT {REPORTED_KEYS}"
+                )
+                offending = cur.fetchall()
+                if offending:
+                    raise ValueError(
+                        f"Cannot add the primary key to {table_name}, "
+                        f"{PRIMARY_KEY} values missing or repeated "
+                        f"(value, rows): {offending}"
+                    )
+                cur.execute(f"ALTER TABLE {table_name} ADD PRIMARY KEY ({PRIMARY_KEY})")
+            for suffix, index_columns in LOOKUP_INDEXES.items():
+                if not set(index_columns) <= set(columns):
+                    continue
+                cur.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table_name}_{suffix}_idx "
+                    f"ON {table_name} ({', '.join(index_columns)})"
+                )
+            cur.execute(f"ANALYZE {table_name}")
+            conn.commit()
+            print(f"Primary key and indexes created on {table_name}.")
+    except ValueError:
+        raise  # Bad keys are fixed in the data, not skipped
+    except Exception as e:  # pragma: no cover
+        print(f"An error occurred while creating indexes: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
 def db_insert_data(size: str) -> None:
     table_name = "vehicles"
 
@@ -121,3 +189,5 @@ def db_insert_data(size: str) -> None:
     create_table_from_df(table_name, df)
 
     insert_data_into_db(df, table_name)
+
+    create_indexes(table_name, df.columns)
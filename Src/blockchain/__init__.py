@@ -1,17 +1,58 @@
-from .getLatestRecord import get_latest_record_logic
-from .getAllRecords import get_all_records_logic
-from .getConnection import get_connection_logic
+from .getLatestRecord import get_latest_record_logic, get_latest_record_logic_async
+from .getAllRecords import (
+    get_all_records_logic,
+    get_all_records_logic_async,
+    iter_all_records,
+    iter_all_records_async,
+)
+from .getConnection import get_connection_logic, get_connection_logic_async
 from .getAccount import get_account_logic
-from .appendData import append_data_logic
-from .getRecordHistory import get_record_history_logic
-from .deleteRecord import delete_record_bc_logic
+from .appendData import append_data_logic, append_data_logic_async
+from .getRecordHistory import get_record_history_logic, get_record_history_logic_async
+from .appendBatch import append_batch_logic_async
+from .nonceManager import NonceManager
+from .deleteRecord import delete_record_bc_logic, delete_record_bc_logic_async
+from .recordIndex import RecordIndex
+from .recordLocator import RecordLocator
+from .recordRegistry import RecordRegistry
+from .recordView import RecordView
+from .segmentStore import RecordSegmentStore
+from .chainFollower import ChainFollower
+from .blockFetcher import fetch_blocks, fetch_blocks_async, ParallelBlockFetcher
+from .blockCache import DecodedBlockCache
+from .keyFilters import KeyRangeFilters
+from .rpcPool import RpcEndpointPool, PooledHTTPProvider, AsyncPooledHTTPProvider
 
 __all__ = [
     "get_latest_record_logic",
+    "get_latest_record_logic_async",
     "get_all_records_logic",
+    "get_all_records_logic_async",
+    "iter_all_records",
+    "iter_all_records_async",
     "get_connection_logic",
+    "get_connection_logic_async",
     "get_account_logic",
     "append_data_logic",
+    "append_data_logic_async",
+    "append_batch_logic_async",
+    "NonceManager",
     "get_record_history_logic",
+    "get_record_history_logic_async",
     "delete_record_bc_logic",
+    "delete_record_bc_logic_async",
+    "RecordIndex",
+    "RecordLocator",
+    "RecordRegistry",
+    "RecordView",
+    "RecordSegmentStore",
+    "ChainFollower",
+    "fetch_blocks",
+    "fetch_blocks_async",
+    "ParallelBlockFetcher",
+    "DecodedBlockCache",
+    "KeyRangeFilters",
+    "RpcEndpointPool",
+    "PooledHTTPProvider",
+    "AsyncPooledHTTPProvider",
 ]
@@ -0,0 +1,148 @@
+import asyncio
+from fastapi import HTTPException
+from typing import List, Optional
+from web3 import AsyncWeb3
+from web3.types import ChecksumAddress
+from .appendData import BlockchainRecord, data_transaction
+from .nonceManager import NonceManager
+from .recordLocator import RecordLocator, locate_sent
+from .recordRegistry import RecordRegistry
+
+
+async def fill_nonce(w3: AsyncWeb3, account: ChecksumAddress, nonce: int) -> bool:
+    """Use up a nonce whose send failed with an empty self-transfer."""
+    try:
+        await w3.eth.send_transaction(
+            {"from": account, "to": account, "value": 0, "nonce": nonce}
+        )
+        return True
+    except Exception as e:
+        print(f"Error filling nonce {nonce}: {e}")
+        return False
+
+
+def rpc_transaction(transaction: dict) -> dict:
+    """Encode a transaction dict as `eth_sendTransaction` expects it on the wire."""
+    return {
+        field: hex(value) if isinstance(value, int) else value
+        for field, value in transaction.items()
+        if value is not None
+    }
+
+
+async def append_batch_logic_async(
+    w3: AsyncWeb3,
+    account: ChecksumAddress,
+    records: List[BlockchainRecord],
+    nonces: Optional[NonceManager] = None,
+    batch_size: int = 100,
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    """
+    Store many records, one transaction each, in a single call.
+
+    Nonces are assigned locally up front and the `eth_sendTransaction` calls are sent
+    as JSON-RPC batches of `batch_size`, one batch after the other, so a batch costs
+    one round trip instead of one per record. Nodes process a batch in order, so the
+    nonces arrive in sequence. The nonce of a failed send is used up by an empty
+    transaction, so the sends after it are still mined. When that fails too, the
+    sends after it are reported as `queued`: they keep their hashes and are mined
+    once a later call uses the nonce.
+
+    Returns:
+        dict: {"transaction_hashes": [...]} in the order of `records`.
+    """
+    if not records:
+        raise HTTPException(status_code=400, detail="Records to append cannot be empty")
+    empty = [position for position, record in enumerate(records) if not record.data]
+    if empty:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Data to append cannot be empty (records {empty})",
+        )
+
+    try:
+        transactions = [
+            data_transaction(w3, account, record.data, codec, registry)
+            for record in records
+        ]
+    except ValueError as ve:
+        print(f"ValueError: {ve}")
+        raise HTTPException(status_code=400, detail=f"Invalid data format: {ve}")
+
+    nonces = nonces or NonceManager(account)
+    hashes, errors, queued = [], {}, {}
+    try:
+        first_nonce = await nonces.reserve(w3, len(records))
+        for offset in range(0, len(records), batch_size):
+            chunk = transactions[offset : offset + batch_size]
+            responses = await w3.provider.make_batch_request(
+                [
+                    (
+                        "eth_sendTransaction",
+                        [
+                            rpc_transaction(
+                                {
+                                    **transaction,
+                                    "nonce": first_nonce + offset + position,
+                                }
+                            )
+                        ],
+                    )
+                    for position, transaction in enumerate(chunk)
+                ]
+            )
+            if not isinstance(responses, list):  # The whole batch was rejected
+                responses = [responses] * len(chunk)
+            failed = []
+            for position, response in enumerate(responses):
+                if "error" in response:
+                    errors[offset + position] = str(response["error"])
+                    failed.append(offset + position)
+                    hashes.append(None)
+                else:
+                    hashes.append(response["result"])
+            # Later sends were accepted with nonces past the failed ones; use the
+            # failed nonces up so they are mined and the next chunks are not stuck
+            unfilled = None
+            for position in failed:
+                if not await fill_nonce(w3, account, first_nonce + position):
+                    unfilled = position
+                    break
+            if unfilled is not None:
+                # Sends after the gap stay queued until its nonce is used. The next
+                # reservation asks the node again, which hands out the gap first
+                queued = {
+                    position: f"Queued behind unused nonce {first_nonce + unfilled}"
+                    for position in range(unfilled + 1, len(hashes))
+                    if hashes[position] is not None
+                }
+                nonces.reset()
+                break
+    except Exception as e:  # pragma: no cover
+        nonces.reset()
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error appending batch: {str(e)}")
+
+    if locator is not None:
+        await asyncio.to_thread(
+            locate_sent,
+            locator,
+            ((record.data, tx_hash, 0) for record, tx_hash in zip(records, hashes)),
+        )
+    if errors:
+        missing = len(records) - len(hashes) + len(errors)
+        print(f"Error: {missing} of {len(records)} records were not stored")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "message": f"Error appending batch: {missing} of {len(records)} "
+                "records were not stored",
+                "errors": errors,
+                "queued": queued,
+                "transaction_hashes": hashes + [None] * (len(records) - len(hashes)),
+            },
+        )
+    return {"transaction_hashes": hashes}
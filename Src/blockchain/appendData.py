@@ -1,9 +1,15 @@
+import asyncio
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import TYPE_CHECKING, Optional, Dict, Union
 from fastapi import HTTPException
-import json
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
 from web3.types import ChecksumAddress
+from .recordCodec import encode_record
+from .recordLocator import RecordLocator, locate_sent
+from .recordRegistry import RecordRegistry
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .nonceManager import NonceManager
 
 
 # Tmp: Remove after fixing git test action
@@ -13,8 +19,58 @@ class BlockchainRecord(BaseModel):
     data: Optional[Dict] = None
 
 
+def data_transaction(
+    w3: Union[Web3, AsyncWeb3],
+    account: ChecksumAddress,
+    data: dict,
+    codec: str = "json",
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    """
+    Build the data-only transaction (no recipient) that stores `data` on chain,
+    serialized with `codec` (see `encode_record`). With a `registry` the transaction
+    calls it instead, so the record is emitted as an indexed log.
+    """
+    if registry is not None:
+        return {
+            "from": account,
+            "to": registry.address,
+            "value": 0,
+            "gas": 3000000,
+            "gasPrice": w3.to_wei("20", "gwei"),
+            "data": w3.to_hex(registry.calldata(data, codec)),
+        }
+    return {
+        "from": account,
+        "to": None,
+        "value": 0,
+        "gas": 3000000,
+        "gasPrice": w3.to_wei("20", "gwei"),  # Use `w3` instance here
+        "data": w3.to_hex(encode_record(data, codec)),  # Use `w3` instance here
+    }
+
+
+async def send_data_transaction(
+    w3: AsyncWeb3, transaction: dict, nonces: Optional["NonceManager"] = None
+) -> bytes:
+    """Send a transaction, taking its nonce from `nonces` when one is shared."""
+    if nonces is None:
+        return await w3.eth.send_transaction(transaction)
+    transaction["nonce"] = await nonces.reserve(w3)
+    try:
+        return await w3.eth.send_transaction(transaction)
+    except Exception:
+        nonces.reset()
+        raise
+
+
 def append_data_logic(
-    w3: Web3, account: ChecksumAddress, record: BlockchainRecord
+    w3: Web3,
+    account: ChecksumAddress,
+    record: BlockchainRecord,
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+    registry: Optional[RecordRegistry] = None,
 ) -> dict:
     try:
         if not record.data:
@@ -22,20 +78,43 @@ def append_data_logic(
                 status_code=400, detail="Data to append cannot be empty"
             )
 
-        data_hex = w3.to_hex(text=json.dumps(record.data))  # Use `w3` instance here
+        # Send the transaction
+        tx_hash = w3.eth.send_transaction(
+            data_transaction(w3, account, record.data, codec, registry)
+        )
+        locate_sent(locator, [(record.data, tx_hash, 0)])
 
-        # Construct the transaction
-        tx = {
-            "from": account,
-            "to": None,
-            "value": 0,
-            "gas": 3000000,
-            "gasPrice": w3.to_wei("20", "gwei"),  # Use `w3` instance here
-            "data": data_hex,
-        }
+        return {"transaction_hash": tx_hash.hex()}
+    except HTTPException:  # Allow HTTPExceptions to propagate as-is
+        raise
+    except ValueError as ve:  # pragma: no cover
+        print(f"ValueError: {ve}")
+        raise HTTPException(status_code=400, detail=f"Invalid data format: {ve}")
+    except Exception as e:  # pragma: no cover
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error appending data: {str(e)}")
 
-        # Send the transaction
-        tx_hash = w3.eth.send_transaction(tx)  # Use `w3` instance here
+
+async def append_data_logic_async(
+    w3: AsyncWeb3,
+    account: ChecksumAddress,
+    record: BlockchainRecord,
+    nonces: Optional["NonceManager"] = None,
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    try:
+        if not record.data:
+            raise HTTPException(
+                status_code=400, detail="Data to append cannot be empty"
+            )
+
+        tx_hash = await send_data_transaction(
+            w3, data_transaction(w3, account, record.data, codec, registry), nonces
+        )
+        if locator is not None:
+            await asyncio.to_thread(locate_sent, locator, [(record.data, tx_hash, 0)])
 
         return {"transaction_hash": tx_hash.hex()}
     except HTTPException:  # Allow HTTPExceptions to propagate as-is
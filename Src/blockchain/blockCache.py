@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import AsyncIterator, Callable, Iterator, Optional
+from web3 import AsyncWeb3, Web3
+
+from .decodeRecord import decode_block
+
+# Missing blocks are fetched in runs of at most this many blocks, so a cold cache
+# still hands out the first records quickly
+MAX_FETCH_RUN = 1000
+# Blocks read, decoded or written per worker-thread call of `decoded_blocks_async`
+STORE_BATCH = 100
+# Bumped whenever the stored entry layout changes; older cache files are emptied
+CACHE_FORMAT = 2
+
+
+class DecodedBlockCache:
+    """
+    Bounded cache of decoded data records per block, keyed by block hash.
+
+    Mined blocks never change, so the decoded (tx_index, slot, tx_hash, record) list
+    of a block can be reused by every later scan. The newest `max_blocks` blocks are
+    kept in an in-memory LRU; with `disk_path` every decoded block is also written to
+    a SQLite file that backs the LRU and survives restarts.
+
+    Block numbers are mapped to hashes so cached blocks are not even downloaded; the
+    mapping covers the blocks in memory (older ones are looked up by number on disk)
+    and is checked against the node once per scan and dropped if the chain was
+    replaced. Disk writes are committed once per downloaded run of blocks.
+    """
+
+    def __init__(
+        self, max_blocks: int = 10000, disk_path: Optional[str] = None
+    ) -> None:
+        self.max_blocks = max_blocks
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()  # block hash -> (block number, decoded records)
+        self._hash_by_number = {}  # Of the blocks in `_memory`
+        self._disk = None
+        if disk_path:
+            if os.path.dirname(disk_path):
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            with self._disk:
+                if (
+                    self._disk.execute("PRAGMA user_version").fetchone()[0]
+                    != CACHE_FORMAT
+                ):
+                    self._disk.execute("DROP TABLE IF EXISTS blocks")
+                    self._disk.execute(f"PRAGMA user_version = {CACHE_FORMAT}")
+                self._disk.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS blocks (
+                        hash TEXT PRIMARY KEY,
+                        number INTEGER NOT NULL,
+                        records TEXT NOT NULL
+                    )
+                    """
+                )
+                self._disk.execute(
+                    "CREATE INDEX IF NOT EXISTS blocks_number ON blocks (number)"
+                )
+
+    def _remember(self, block_number: int, block_hash: str, records: list) -> None:
+        self._memory[block_hash] = (block_number, records)
+        self._memory.move_to_end(block_hash)
+        self._hash_by_number[block_number] = block_hash
+        while len(self._memory) > self.max_blocks:
+            evicted, (evicted_number, _) = self._memory.popitem(last=False)
+            if self._hash_by_number.get(evicted_number) == evicted:
+                del self._hash_by_number[evicted_number]
+
+    def _load(self, column: str, value: object) -> Optional[tuple]:
+        """(block_number, block_hash, records) of a block stored on disk."""
+        if self._disk is None:
+            return None
+        row = self._disk.execute(
+            f"SELECT number, hash, records FROM blocks WHERE {column} = ? "
+            "ORDER BY rowid DESC LIMIT 1",
+            (value,),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], [tuple(entry) for entry in json.loads(row[2])]
+
+    def get(self, block_hash: str) -> Optional[list]:
+        """Return the decoded records of a block, counting a hit or a miss."""
+        with self._lock:
+            entry = self._memory.get(block_hash)
+            if entry is None:
+                stored = self._load("hash", block_hash)
+                entry = stored and (stored[0], stored[2])
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(entry[0], block_hash, entry[1])
+            return entry[1]
+
+    def put(self, block_number: int, block_hash: str, records: list) -> None:
+        """Cache a decoded block; its disk write is committed by `flush`."""
+        with self._lock:
+            self._remember(block_number, block_hash, records)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)",
+                    (block_hash, block_number, json.dumps(records)),
+                )
+
+    def flush(self) -> None:
+        """Commit the blocks written to disk since the last flush."""
+        with self._lock:
+            if self._disk is not None and self._disk.in_transaction:
+                self._disk.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._hash_by_number = {}
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute("DELETE FROM blocks")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_blocks": len(self._memory),
+                "max_blocks": self.max_blocks,
+                # Every block in memory is also on disk, when there is a disk tier
+                "known_blocks": (
+                    self._disk.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+                    if self._disk is not None
+                    else len(self._hash_by_number)
+                ),
+                "disk": self._disk is not None,
+            }
+
+    def _newest(self) -> Optional[tuple]:
+        """(block_number, block_hash) of the newest cached block, or None."""
+        with self._lock:
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT number, hash FROM blocks ORDER BY number DESC, rowid DESC "
+                    "LIMIT 1"
+                ).fetchone()
+                return tuple(row) if row else None
+            if not self._hash_by_number:
+                return None
+            newest = max(self._hash_by_number)
+            return newest, self._hash_by_number[newest]
+
+    @staticmethod
+    def _is_stale(newest: tuple, head: int, node_hash: Optional[str]) -> bool:
+        """True if the node is behind the newest known block or has another block there."""
+        return newest[0] > head or node_hash != newest[1]
+
+    def _check_chain(self, w3: Web3) -> None:
+        """Forget the cached blocks if the node no longer has them."""
+        with self._lock:
+            newest = self._newest()
+            if newest is None:
+                return
+            head = w3.eth.block_number
+            block_hash = None
+            if newest[0] <= head:
+                block_hash = Web3.to_hex(w3.eth.get_block(newest[0]).hash)
+            if self._is_stale(newest, head, block_hash):
+                self.clear()
+
+    async def _check_chain_async(self, w3: AsyncWeb3) -> None:
+        newest = await asyncio.to_thread(self._newest)
+        if newest is None:
+            return
+        head = await w3.eth.block_number
+        block_hash = None
+        if newest[0] <= head:
+            block_hash = Web3.to_hex((await w3.eth.get_block(newest[0])).hash)
+        if self._is_stale(newest, head, block_hash):
+            await asyncio.to_thread(self._clear_if_newest, newest)
+
+    def _clear_if_newest(self, newest: tuple) -> None:
+        with self._lock:
+            if self._newest() == newest:
+                self.clear()
+
+    def _cached(self, block_number: int) -> Optional[list]:
+        with self._lock:
+            block_hash = self._hash_by_number.get(block_number)
+            if block_hash is not None:
+                return self.get(block_hash)
+            stored = self._load("number", block_number)
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(*stored)
+            return stored[2]
+
+    def _plan(self, start: int, stop: int, reverse: bool) -> Iterator[tuple]:
+        """
+        Walk [start, stop) yielding (block_number, records) for cached blocks and
+        (None, run) for each run of consecutive blocks that must be downloaded.
+        """
+        block_numbers = (
+            range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+        )
+        run = []
+        for block_number in block_numbers:
+            records = self._cached(block_number)
+            if records is None:
+                run.append(block_number)
+                if len(run) < MAX_FETCH_RUN:
+                    continue
+            if run:
+                yield None, run
+                run = []
+            if records is not None:
+                yield block_number, records
+        if run:
+            yield None, run
+
+    def _store(self, w3: Web3, block_number: int, block: dict) -> list:
+        records = decode_block(w3, block)
+        self.put(block_number, Web3.to_hex(block.hash), records)
+        return records
+
+    def decoded_blocks(
+        self,
+        w3: Web3,
+        start: int,
+        stop: int,
+        block_fetcher: Callable,
+        reverse: bool = False,
+    ) -> Iterator[tuple]:
+        """
+        Yield (block_number, decoded records) for blocks [start, stop) in block order
+        (or reverse block order), downloading only the blocks that are not cached.
+        """
+        self._check_chain(w3)
+        try:
+            for block_number, entry in self._plan(start, stop, reverse):
+                if block_number is not None:
+                    yield block_number, entry
+                    continue
+                run_start, run_stop = min(entry), max(entry) + 1
+                blocks = (
+                    block_fetcher(w3, run_start, run_stop, reverse=True)
+                    if reverse
+                    else block_fetcher(w3, run_start, run_stop)
+                )
+                for fetched_number, block in blocks:
+                    yield fetched_number, self._store(w3, fetched_number, block)
+                self.flush()  # One commit per downloaded run
+        finally:
+            self.flush()  # Also when the caller stops early
+
+    def _store_many(self, w3: AsyncWeb3, blocks: list) -> list:
+        return [
+            (block_number, self._store(w3, block_number, block))
+            for block_number, block in blocks
+        ]
+
+    async def decoded_blocks_async(
+        self,
+        w3: AsyncWeb3,
+        start: int,
+        stop: int,
+        block_fetcher: Callable,
+        reverse: bool = False,
+    ) -> AsyncIterator[tuple]:
+        """
+        Async counterpart of `decoded_blocks`; `block_fetcher` is an async generator.
+
+        Cache reads, decoding and disk writes run in a worker thread, `STORE_BATCH`
+        blocks at a time, so they do not block the event loop.
+        """
+        await self._check_chain_async(w3)
+        plan = self._plan(start, stop, reverse)
+        try:
+            while steps := await asyncio.to_thread(list, islice(plan, STORE_BATCH)):
+                for block_number, entry in steps:
+                    if block_number is not None:
+                        yield block_number, entry
+                        continue
+                    run_start, run_stop = min(entry), max(entry) + 1
+                    blocks = (
+                        block_fetcher(w3, run_start, run_stop, reverse=True)
+                        if reverse
+                        else block_fetcher(w3, run_start, run_stop)
+                    )
+                    fetched = []
+                    async for fetched_block in blocks:
+                        fetched.append(fetched_block)
+                        if len(fetched) < STORE_BATCH:
+                            continue
+                        for decoded in await asyncio.to_thread(
+                            self._store_many, w3, fetched
+                        ):
+                            yield decoded
+                        fetched = []
+                    for decoded in await asyncio.to_thread(
+                        self._store_many, w3, fetched
+                    ):
+                        yield decoded
+                    await asyncio.to_thread(self.flush)  # One commit per downloaded run
+        finally:
+            self.flush()  # Also when the caller stops early
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self.flush()
+            self._disk.close()
@@ -0,0 +1,185 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, Optional
+from web3 import AsyncWeb3, Web3
+
+
+def _chunks(start: int, stop: int, size: int, reverse: bool = False) -> list:
+    """Split [start, stop) into ranges of `size` blocks, last range first if `reverse`."""
+    chunks = [
+        range(chunk_start, min(chunk_start + size, stop))
+        for chunk_start in range(start, stop, size)
+    ]
+    return [chunk[::-1] for chunk in reversed(chunks)] if reverse else chunks
+
+
+def fetch_blocks(
+    w3: Web3, start: int, stop: int, batch_size: int = 1, reverse: bool = False
+) -> Iterator[tuple]:
+    """
+    Fetch the blocks in [start, stop) with their full transactions, in block order
+    (highest block first with `reverse`).
+
+    With `batch_size` > 1, `eth_getBlockByNumber` calls are sent as JSON-RPC batches
+    of up to `batch_size` blocks, so a full scan costs one HTTP round trip per batch
+    instead of one per block.
+
+    Args:
+        w3 (Web3): Web3 instance connected to the node.
+        start (int): First block number to fetch.
+        stop (int): Block number to stop before.
+        batch_size (int): Number of blocks requested per JSON-RPC batch.
+        reverse (bool): Walk from `stop - 1` down to `start`.
+
+    Yields:
+        tuple: (block_number, block) pairs.
+    """
+    if batch_size <= 1:
+        block_numbers = (
+            range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+        )
+        for block_number in block_numbers:
+            yield block_number, w3.eth.get_block(block_number, full_transactions=True)
+        return
+
+    for block_numbers in _chunks(start, stop, batch_size, reverse):
+        with w3.batch_requests() as batch:
+            for block_number in block_numbers:
+                batch.add(w3.eth.get_block(block_number, full_transactions=True))
+            blocks = batch.execute()
+        yield from zip(block_numbers, blocks)
+
+
+class ParallelBlockFetcher:
+    """
+    Block fetcher that splits a block range into chunks fetched concurrently.
+
+    Chunks are spread round-robin over the configured RPC endpoints (or the caller's
+    Web3 instance when none are given) and fetched on a bounded thread pool. Blocks
+    are still yielded strictly in block order (or reverse block order), so callers
+    see the same sequence as with `fetch_blocks`.
+
+    All endpoints must serve the same chain.
+    """
+
+    def __init__(
+        self,
+        endpoints: Optional[list] = None,
+        workers: int = 4,
+        range_size: int = 500,
+        batch_size: int = 100,
+    ) -> None:
+        self.clients = [
+            Web3(Web3.HTTPProvider(endpoint)) if isinstance(endpoint, str) else endpoint
+            for endpoint in endpoints or []
+        ]
+        self.workers = workers
+        self.range_size = range_size
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="block-scan")
+
+    def _fetch_range(self, w3: Web3, block_numbers: range, reverse: bool) -> list:
+        start, stop = min(block_numbers), max(block_numbers) + 1
+        return list(fetch_blocks(w3, start, stop, self.batch_size, reverse))
+
+    def __call__(
+        self, w3: Web3, start: int, stop: int, reverse: bool = False
+    ) -> Iterator[tuple]:
+        clients = self.clients or [w3]
+        pending = deque()
+        try:
+            for position, chunk in enumerate(
+                _chunks(start, stop, self.range_size, reverse)
+            ):
+                # Keep at most two chunks per worker in memory ahead of the consumer
+                if len(pending) >= 2 * self.workers:
+                    yield from pending.popleft().result()
+                client = clients[position % len(clients)]
+                pending.append(
+                    self._executor.submit(self._fetch_range, client, chunk, reverse)
+                )
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _fetch_batch(w3: AsyncWeb3, block_numbers: range) -> list:
+    if len(block_numbers) == 1:
+        return [await w3.eth.get_block(block_numbers[0], full_transactions=True)]
+    async with w3.batch_requests() as batch:
+        for block_number in block_numbers:
+            batch.add(w3.eth.get_block(block_number, full_transactions=True))
+        return await batch.async_execute()
+
+
+async def _fetch_window(
+    clients: list, block_numbers: range, batch_size: int, first_client: int
+) -> list:
+    batches = [
+        block_numbers[offset : offset + batch_size]
+        for offset in range(0, len(block_numbers), batch_size)
+    ]
+    results = await asyncio.gather(
+        *(
+            _fetch_batch(clients[(first_client + position) % len(clients)], batch)
+            for position, batch in enumerate(batches)
+        )
+    )
+    return [
+        entry for batch, blocks in zip(batches, results) for entry in zip(batch, blocks)
+    ]
+
+
+async def fetch_blocks_async(
+    w3: AsyncWeb3,
+    start: int,
+    stop: int,
+    concurrency: int = 20,
+    reverse: bool = False,
+    batch_size: int = 1,
+    clients: Optional[list] = None,
+) -> AsyncIterator[tuple]:
+    """
+    Async counterpart of `fetch_blocks` and `ParallelBlockFetcher`.
+
+    Up to `concurrency` requests are in flight at once, each a JSON-RPC batch of
+    `batch_size` blocks (a plain `eth_getBlockByNumber` when 1), spread round-robin
+    over `clients` (AsyncWeb3 instances of nodes serving the same chain, `w3` when
+    none are given). The next window is requested while the caller consumes the
+    current one. Blocks are yielded in block order (highest block first with
+    `reverse`).
+    """
+    clients = clients or [w3]
+    batch_size = max(batch_size, 1)
+    window_size = max(concurrency, 1) * batch_size
+    block_numbers = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+    windows = [
+        block_numbers[offset : offset + window_size]
+        for offset in range(0, len(block_numbers), window_size)
+    ]
+
+    def fetch(position: int) -> asyncio.Future:
+        return asyncio.ensure_future(
+            _fetch_window(
+                clients, windows[position], batch_size, position * max(concurrency, 1)
+            )
+        )
+
+    pending = None
+    try:
+        for position in range(len(windows)):
+            current = pending or fetch(position)
+            pending = None
+            if position + 1 < len(windows):
+                pending = fetch(position + 1)
+            for entry in await current:
+                yield entry
+    finally:
+        if pending is not None:
+            pending.cancel()
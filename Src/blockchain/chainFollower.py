@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from typing import Callable, Optional
+from web3 import AsyncWeb3, Web3, WebSocketProvider
+
+from .blockFetcher import fetch_blocks
+from .chainSink import sync_sinks
+
+
+class ChainFollower:
+    """
+    Background thread that keeps chain sinks (view, index) at the chain head.
+
+    New heads are received over a WebSocket `newHeads` subscription. If the node
+    cannot be reached over WebSocket, the follower falls back to polling
+    `eth.block_number` every `poll_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        w3: Web3,
+        sinks: list,
+        ws_url: Optional[str] = None,
+        poll_interval: float = 1.0,
+        block_fetcher: Callable = fetch_blocks,
+    ) -> None:
+        self.w3 = w3
+        self.sinks = sinks
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.block_fetcher = block_fetcher
+        self.mode = None  # "websocket" or "polling" once running
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="chain-follower", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def catch_up(self) -> int:
+        """Ingest every block mined since the last catch-up into all sinks."""
+        try:
+            return sync_sinks(self.w3, self.sinks, self.block_fetcher)
+        except Exception as e:
+            print(f"Chain follower error: {e}")
+            return 0
+
+    def _run(self) -> None:
+        self.catch_up()
+        if self.ws_url:
+            try:
+                asyncio.run(self._follow_new_heads())
+            except Exception as e:  # pragma: no cover
+                print(f"WebSocket subscription failed, polling instead: {e}")
+        if not self._stop.is_set():
+            self.mode = "polling"
+            self._poll()
+
+    async def _follow_new_heads(self) -> None:  # pragma: no cover
+        async with AsyncWeb3(
+            WebSocketProvider(self.ws_url, max_connection_retries=1)
+        ) as aw3:
+            await aw3.eth.subscribe("newHeads")
+            self.mode = "websocket"
+            async for _ in aw3.socket.process_subscriptions():
+                if self._stop.is_set():
+                    break
+                self.catch_up()
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self.catch_up()
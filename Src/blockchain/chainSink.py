@@ -0,0 +1,194 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Optional
+from web3 import AsyncWeb3, Web3
+
+from .blockFetcher import fetch_blocks, fetch_blocks_async
+from .decodeRecord import decode_block
+
+# Blocks handed to the sinks per worker-thread call by `sync_sinks_async`
+INGEST_BATCH = 100
+
+
+class ChainSink(ABC):
+    """
+    Base class for local structures that ingest decoded blocks in chain order.
+
+    Subclasses store the decoded records of each block and remember the number
+    and hash of the last block they ingested. Blocks are only accepted in order,
+    so concurrent syncs of the same sink never ingest a block twice.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        # Set once a sync has reached the chain head at least once
+        self.synced = False
+
+    @property
+    @abstractmethod
+    def last_block(self) -> int:
+        """Number of the last block ingested, or -1 when empty."""
+
+    @property
+    @abstractmethod
+    def last_hash(self) -> Optional[str]:
+        """Hash of the last block ingested, or None when empty or unknown."""
+
+    @abstractmethod
+    def _store_block(self, block_number: int, block_hash: str, records: list) -> None:
+        """Store the decoded records of a block; called with the lock held."""
+
+    @abstractmethod
+    def _clear(self) -> None:
+        """Drop every stored block; called with the lock held."""
+
+    def _commit(self) -> None:
+        """Make the blocks stored so far durable; called with the lock held."""
+
+    def commit(self) -> None:
+        """Commit the blocks ingested since the last commit, once per synced batch."""
+        with self._lock:
+            self._commit()
+
+    def reset(self) -> None:
+        """Drop everything ingested so far (e.g. after the dev chain was wiped)."""
+        with self._lock:
+            self._clear()
+
+    def add_block(self, block_number: int, block_hash: str, records: list) -> bool:
+        """Ingest the decoded records of the block following `last_block`."""
+        with self._lock:
+            if block_number != self.last_block + 1:
+                return False
+            self._store_block(block_number, block_hash, records)
+            return True
+
+    def load_blocks(
+        self, blocks: Iterable[tuple], last_block: int, last_hash: Optional[str]
+    ) -> int:
+        """
+        Ingest (block_number, records) pairs saved by an earlier run into an empty
+        sink. Blocks left out held no records; `last_block` is the last block they
+        cover and `last_hash` its hash. Returns the number of records ingested.
+        """
+        with self._lock:
+            if self.last_block >= 0:
+                return 0
+            ingested, stored = 0, -1
+            for block_number, records in blocks:
+                block_hash = last_hash if block_number == last_block else None
+                self._store_block(block_number, block_hash, records)
+                ingested += len(records)
+                stored = block_number
+            if last_block >= 0 and stored != last_block:
+                self._store_block(last_block, last_hash, [])
+            self._commit()
+            return ingested
+
+    def check_reset(self, w3: Web3, head: int) -> bool:
+        """Clear the sink if the chain no longer contains the last ingested block."""
+        with self._lock:
+            last_block = self.last_block
+            if last_block < 0:
+                return False
+            if head < last_block or (
+                self.last_hash is not None
+                and Web3.to_hex(w3.eth.get_block(last_block).hash) != self.last_hash
+            ):
+                self._clear()
+                return True
+            return False
+
+    async def check_reset_async(self, w3: AsyncWeb3, head: int) -> bool:
+        """Async counterpart of `check_reset`; the sink is read and cleared in a thread."""
+        last_block, last_hash = await asyncio.to_thread(self._position)
+        if last_block < 0:
+            return False
+        block_hash = None
+        if head >= last_block and last_hash is not None:
+            block_hash = Web3.to_hex((await w3.eth.get_block(last_block)).hash)
+        return await asyncio.to_thread(self._reset_if, last_block, head, block_hash)
+
+    def _position(self) -> tuple:
+        with self._lock:
+            return self.last_block, self.last_hash
+
+    def _reset_if(self, last_block: int, head: int, block_hash: Optional[str]) -> bool:
+        with self._lock:
+            # Another sync may have moved the sink on while the block was requested
+            if self.last_block != last_block:
+                return False
+            if head < last_block or (
+                block_hash is not None and block_hash != self.last_hash
+            ):
+                self._clear()
+                return True
+            return False
+
+    def sync(self, w3: Web3, block_fetcher: Callable = fetch_blocks) -> int:
+        """Ingest every block mined since the last sync. Returns the number of blocks read."""
+        return sync_sinks(w3, [self], block_fetcher)
+
+
+def sync_sinks(w3: Web3, sinks: list, block_fetcher: Callable = fetch_blocks) -> int:
+    """
+    Bring several sinks up to the chain head, fetching and decoding each block once.
+
+    Returns:
+        int: Number of blocks read from the node.
+    """
+    head = w3.eth.block_number
+    for sink in sinks:
+        sink.check_reset(w3, head)
+    start = min(sink.last_block for sink in sinks) + 1
+    try:
+        for block_number, block in block_fetcher(w3, start, head + 1):
+            records = decode_block(w3, block)
+            block_hash = Web3.to_hex(block.hash)
+            for sink in sinks:
+                sink.add_block(block_number, block_hash, records)
+    finally:
+        # One commit for the whole run, keeping what was ingested before a failure
+        for sink in sinks:
+            sink.commit()
+    for sink in sinks:
+        sink.synced = True
+    return max(head + 1 - start, 0)
+
+
+def _ingest(w3: object, sinks: list, blocks: list) -> None:
+    for block_number, block in blocks:
+        records = decode_block(w3, block)
+        block_hash = Web3.to_hex(block.hash)
+        for sink in sinks:
+            sink.add_block(block_number, block_hash, records)
+    for sink in sinks:
+        sink.commit()
+
+
+async def sync_sinks_async(
+    w3: AsyncWeb3, sinks: list, block_fetcher: Callable = fetch_blocks_async
+) -> int:
+    """
+    Async counterpart of `sync_sinks`; `block_fetcher` is an async generator.
+
+    Blocks are decoded and handed to the sinks in a worker thread, `INGEST_BATCH` at
+    a time, so sink writes (SQLite commits, waits on a lock held by the follower)
+    never block the event loop.
+    """
+    head = await w3.eth.block_number
+    for sink in sinks:
+        await sink.check_reset_async(w3, head)
+    start = min([(await asyncio.to_thread(sink._position))[0] for sink in sinks]) + 1
+    blocks = []
+    async for entry in block_fetcher(w3, start, head + 1):
+        blocks.append(entry)
+        if len(blocks) >= INGEST_BATCH:
+            await asyncio.to_thread(_ingest, w3, sinks, blocks)
+            blocks = []
+    if blocks:
+        await asyncio.to_thread(_ingest, w3, sinks, blocks)
+    for sink in sinks:
+        sink.synced = True
+    return max(head + 1 - start, 0)
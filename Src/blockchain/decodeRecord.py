@@ -0,0 +1,148 @@
+import json
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterator, Optional
+from web3 import AsyncWeb3, Web3
+from .recordCodec import RECORD_MAGIC, decode_record
+from .recordEnvelope import (
+    PACK_MAGIC,
+    REGISTRY_RECORD_OFFSET,
+    REGISTRY_SELECTOR,
+    unpack_records,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .blockCache import DecodedBlockCache
+
+ENVELOPE_PREFIX = PACK_MAGIC.hex()
+RECORD_PREFIX = RECORD_MAGIC.hex()
+REGISTRY_PREFIX = REGISTRY_SELECTOR.hex()
+# Lowercase addresses of the RecordRegistry contracts in use. Only calls to them are
+# decoded, any other contract can take input that starts with the selector
+REGISTRY_ADDRESSES = set()
+
+
+def register_registry(address: str) -> None:
+    """Decode the calls to the registry at `address` as records."""
+    REGISTRY_ADDRESSES.add(str(address).lower())
+
+
+def decode_transaction(w3: Web3, tx: dict) -> Optional[list]:
+    """
+    Decode a data-only transaction or registry call into the records in its input.
+
+    Args:
+        w3 (Web3): Web3 instance used for hex decoding.
+        tx (dict): Transaction as returned by `get_block(..., full_transactions=True)`.
+
+    Returns:
+        Optional[list]: The records in slot order (a single record unless the input is
+        a packed envelope), or None for transactions that are neither data-only nor
+        calls to a registered `RecordRegistry`. Binary codec payloads are detected by their prefix,
+        anything else is legacy JSON.
+    """
+    data_hex = tx.input if isinstance(tx.input, str) else tx.input.hex()
+    payload_hex = data_hex.removeprefix("0x")
+    if tx.to is not None:
+        if str(tx.to).lower() not in REGISTRY_ADDRESSES or not payload_hex.startswith(
+            REGISTRY_PREFIX
+        ):
+            return None
+        # The record follows the selector and the key topics
+        payload_hex = payload_hex[REGISTRY_RECORD_OFFSET * 2 :]
+        data_hex = "0x" + payload_hex
+    if payload_hex.startswith(ENVELOPE_PREFIX):
+        return unpack_records(bytes.fromhex(payload_hex))
+    if payload_hex.startswith(RECORD_PREFIX):
+        return [decode_record(bytes.fromhex(payload_hex))]
+    return [json.loads(w3.to_text(hexstr=data_hex))]
+
+
+def _block_records(w3: Web3, block: dict) -> Iterator[tuple]:
+    """Yield (tx_index, slot, tx, record) for every decodable record of a block."""
+    for tx_index, tx in enumerate(block.transactions):
+        try:
+            records = decode_transaction(w3, tx)
+        except Exception as e:
+            print(f"Error decoding transaction: {e}")
+            continue
+        for slot, record in enumerate(records or []):
+            if isinstance(record, dict):
+                yield tx_index, slot, tx, record
+
+
+def decode_block(w3: Web3, block: dict) -> list:
+    """
+    Decode every data-only transaction of a block.
+
+    Transactions that cannot be decoded, and payloads that are not JSON objects, are
+    skipped.
+
+    Returns:
+        list: (tx_index, slot, tx_hash, record) tuples in chain order.
+    """
+    return [
+        (tx_index, slot, Web3.to_hex(tx.hash), record)
+        for tx_index, slot, tx, record in _block_records(w3, block)
+    ]
+
+
+def scan_records(
+    w3: Web3,
+    start: int,
+    stop: int,
+    block_fetcher: Callable,
+    reverse: bool = False,
+    cache: Optional["DecodedBlockCache"] = None,
+) -> Iterator[tuple]:
+    """
+    Yield (block_number, tx_index, slot, record) for every data record in blocks
+    [start, stop).
+
+    With `reverse` the newest record comes first. Transactions that cannot be decoded
+    are reported and skipped. With a `cache` only blocks it has not decoded yet are
+    downloaded.
+    """
+    if cache is not None:
+        blocks = cache.decoded_blocks(w3, start, stop, block_fetcher, reverse)
+    else:
+        blocks = (
+            (block_number, list(_block_records(w3, block)))
+            for block_number, block in (
+                block_fetcher(w3, start, stop, reverse=True)
+                if reverse
+                else block_fetcher(w3, start, stop)
+            )
+        )
+    for block_number, decoded in blocks:
+        for tx_index, slot, _, record in reversed(decoded) if reverse else decoded:
+            yield block_number, tx_index, slot, record
+
+
+async def scan_records_async(
+    w3: AsyncWeb3,
+    start: int,
+    stop: int,
+    block_fetcher: Callable,
+    reverse: bool = False,
+    cache: Optional["DecodedBlockCache"] = None,
+) -> AsyncIterator[tuple]:
+    """Async counterpart of `scan_records`; `block_fetcher` is an async generator."""
+    blocks = (
+        cache.decoded_blocks_async(w3, start, stop, block_fetcher, reverse)
+        if cache is not None
+        else _decoded_blocks_async(w3, start, stop, block_fetcher, reverse)
+    )
+    async for block_number, decoded in blocks:
+        for tx_index, slot, _, record in reversed(decoded) if reverse else decoded:
+            yield block_number, tx_index, slot, record
+
+
+async def _decoded_blocks_async(
+    w3: AsyncWeb3, start: int, stop: int, block_fetcher: Callable, reverse: bool
+) -> AsyncIterator[tuple]:
+    blocks = (
+        block_fetcher(w3, start, stop, reverse=True)
+        if reverse
+        else block_fetcher(w3, start, stop)
+    )
+    async for block_number, block in blocks:
+        yield block_number, decode_block(w3, block)
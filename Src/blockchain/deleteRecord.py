@@ -1,11 +1,22 @@
-import json
+import asyncio
 from fastapi import HTTPException
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
 from web3.types import ChecksumAddress
+from typing import Optional
+from .appendData import data_transaction, send_data_transaction
+from .nonceManager import NonceManager
+from .recordLocator import RecordLocator, locate_sent
+from .recordRegistry import RecordRegistry
 
 
 def delete_record_bc_logic(
-    w3: Web3, account: ChecksumAddress, key: str, key_field: str = "vin"
+    w3: Web3,
+    account: ChecksumAddress,
+    key: str,
+    key_field: str = "vin",
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+    registry: Optional[RecordRegistry] = None,
 ) -> dict:
     try:
         if not key:  # pragma: no cover
@@ -14,21 +25,45 @@ def delete_record_bc_logic(
         # Create the deletion record
         deletion_record = {key_field: key, "deleted": True}
 
-        # Serialize the data
-        data_hex = w3.to_hex(text=json.dumps(deletion_record))
+        # Send the transaction
+        tx_hash = w3.eth.send_transaction(
+            data_transaction(w3, account, deletion_record, codec, registry)
+        )
+        locate_sent(locator, [(deletion_record, tx_hash, 0)])
+
+        return {"transaction_hash": tx_hash.hex()}
+    except HTTPException:  # pragma: no cover
+        raise  # Allow HTTPExceptions to propagate as-is
+    except ValueError as ve:  # pragma: no cover
+        print(f"ValueError: {ve}")
+        raise HTTPException(status_code=400, detail=f"Invalid key or key_field: {ve}")
+    except Exception as e:  # pragma: no cover
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=f"Error deleting record: {str(e)}")
 
-        # Construct the transaction
-        tx = {
-            "from": account,
-            "to": None,
-            "value": 0,
-            "gas": 3000000,
-            "gasPrice": w3.to_wei("20", "gwei"),  # Use `w3` instance here
-            "data": data_hex,
-        }
 
-        # Send the transaction
-        tx_hash = w3.eth.send_transaction(tx)
+async def delete_record_bc_logic_async(
+    w3: AsyncWeb3,
+    account: ChecksumAddress,
+    key: str,
+    key_field: str = "vin",
+    nonces: Optional[NonceManager] = None,
+    codec: str = "json",
+    locator: Optional[RecordLocator] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    try:
+        if not key:  # pragma: no cover
+            raise HTTPException(status_code=400, detail="Key cannot be empty")
+
+        deletion_record = {key_field: key, "deleted": True}
+        tx_hash = await send_data_transaction(
+            w3, data_transaction(w3, account, deletion_record, codec, registry), nonces
+        )
+        if locator is not None:
+            await asyncio.to_thread(
+                locate_sent, locator, [(deletion_record, tx_hash, 0)]
+            )
 
         return {"transaction_hash": tx_hash.hex()}
     except HTTPException:  # pragma: no cover
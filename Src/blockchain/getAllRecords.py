@@ -1,28 +1,150 @@
 from fastapi import HTTPException
-import json
-from web3 import Web3
+from typing import AsyncIterator, Callable, Iterator, Optional, Union
+from web3 import AsyncWeb3, Web3
+from .blockCache import DecodedBlockCache
+from .blockFetcher import fetch_blocks, fetch_blocks_async
+from .chainSink import sync_sinks_async
+from .decodeRecord import scan_records, scan_records_async
+from .pagination import (
+    iter_page,
+    iter_page_async,
+    resolve_range,
+    take_page,
+    take_page_async,
+)
+from .recordView import RecordView
+
+
+def _positioned_records(
+    w3: Web3,
+    view: Optional[RecordView],
+    block_fetcher: Callable,
+    start: int,
+    stop: int,
+    cache: Optional[DecodedBlockCache] = None,
+) -> Iterator[tuple]:
+    if view is not None and view.synced:
+        view.sync(w3, block_fetcher)
+        return iter(view.records_between(start, stop))
+    # Iterate through the blockchain's transactions
+    return scan_records(w3, start, stop, block_fetcher, cache=cache)
+
+
+def iter_all_records(
+    w3: Web3,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+) -> Iterator[dict]:
+    """Yield every data record on the chain, each as soon as its block is decoded."""
+    start, stop, after = resolve_range(
+        w3.eth.block_number, from_block, to_block, cursor
+    )
+    positioned = _positioned_records(w3, view, block_fetcher, start, stop, cache)
+    for *_, record in iter_page(positioned, after, limit):
+        yield record
 
 
 # Function to fetch and decode the latest transaction for a specific key
-def get_all_records_logic(w3: Web3) -> list:
-    latest_record = []
+def get_all_records_logic(
+    w3: Web3,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+) -> Union[list, dict]:
+    """
+    Return the data records in [from_block, to_block].
+
+    With `limit` or `cursor` a page is returned instead of a list:
+    {"records": [...], "next_cursor": ...}; pass `next_cursor` back to continue.
+    """
     try:
-        # Iterate through the blockchain's transactions
-        for block_number in range(w3.eth.block_number + 1):
-            block = w3.eth.get_block(block_number, full_transactions=True)
-            for tx in block.transactions:
-                if tx.to is None:  # Data-only transactions
-                    # Decode the transaction input (data field)
-                    data_hex = tx.input.hex()  # Convert HexBytes to a hex string
-                    try:
-                        record = json.loads(w3.to_text(hexstr=data_hex))
-                        latest_record.append(record)
-                    except Exception as e:
-                        print(f"Error decoding transaction: {e}")
+        start, stop, after = resolve_range(
+            w3.eth.block_number, from_block, to_block, cursor
+        )
+        positioned = _positioned_records(w3, view, block_fetcher, start, stop, cache)
+        return take_page(
+            positioned, after, limit, paged=limit is not None or cursor is not None
+        )
+    except HTTPException:  # pragma: no cover
+        raise  # Keep HTTPExceptions as-is
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error retrieving record: {str(e)}"
+        )
+
+
+async def _positioned_records_async(
+    w3: AsyncWeb3,
+    view: Optional[RecordView],
+    block_fetcher: Callable,
+    start: int,
+    stop: int,
+    cache: Optional[DecodedBlockCache] = None,
+) -> Union[list, AsyncIterator[tuple]]:
+    if view is not None and view.synced:
+        await sync_sinks_async(w3, [view], block_fetcher)
+        return view.records_between(start, stop)
+    return scan_records_async(w3, start, stop, block_fetcher, cache=cache)
+
+
+async def iter_all_records_async(
+    w3: AsyncWeb3,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks_async,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+) -> AsyncIterator[dict]:
+    """Async counterpart of `iter_all_records`."""
+    start, stop, after = resolve_range(
+        await w3.eth.block_number, from_block, to_block, cursor
+    )
+    positioned = await _positioned_records_async(
+        w3, view, block_fetcher, start, stop, cache
+    )
+    if isinstance(positioned, list):
+        for *_, record in iter_page(positioned, after, limit):
+            yield record
+        return
+    async for *_, record in iter_page_async(positioned, after, limit):
+        yield record
+
+
+async def get_all_records_logic_async(
+    w3: AsyncWeb3,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks_async,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+) -> Union[list, dict]:
+    """Async counterpart of `get_all_records_logic`."""
+    try:
+        start, stop, after = resolve_range(
+            await w3.eth.block_number, from_block, to_block, cursor
+        )
+        positioned = await _positioned_records_async(
+            w3, view, block_fetcher, start, stop, cache
+        )
+        return await take_page_async(
+            positioned, after, limit, paged=limit is not None or cursor is not None
+        )
     except HTTPException:  # pragma: no cover
         raise  # Keep HTTPExceptions as-is
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error retrieving record: {str(e)}"
         )
-    return latest_record
@@ -1,5 +1,5 @@
 from fastapi import HTTPException
-from web3 import Web3
+from web3 import AsyncWeb3, Web3
 
 
 def get_connection_logic(w3: Web3) -> dict:
@@ -8,3 +8,11 @@ def get_connection_logic(w3: Web3) -> dict:
             status_code=500, detail="Blockchain connection is not active."
         )
     return {"message": "Connected to blockchain"}
+
+
+async def get_connection_logic_async(w3: AsyncWeb3) -> dict:
+    if not w3 or not await w3.is_connected():
+        raise HTTPException(
+            status_code=500, detail="Blockchain connection is not active."
+        )
+    return {"message": "Connected to blockchain"}
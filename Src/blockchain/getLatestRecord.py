@@ -1,19 +1,214 @@
+import asyncio
+from contextlib import aclosing
 from fastapi import HTTPException
-import json
-from web3 import Web3
+from typing import Callable, Optional
+from web3 import AsyncWeb3, Web3
+from .blockCache import DecodedBlockCache
+from .blockFetcher import fetch_blocks, fetch_blocks_async
+from .chainSink import sync_sinks_async
+from .decodeRecord import scan_records, scan_records_async
+from .keyFilters import KeyRangeFilters, key_matches
+from .recordIndex import RecordIndex
+from .recordLocator import RecordLocator, latest_candidates
+from .recordRegistry import RecordRegistry
+from .recordView import RecordView
 
 
-def get_latest_record_logic(w3: Web3, key: str, key_field: str = "vin") -> dict:
+def _latest_from(
+    w3: Web3,
+    key: str,
+    key_field: str,
+    start: int,
+    index: Optional[RecordIndex],
+    block_fetcher: Callable,
+    max_depth: Optional[int],
+    cache: Optional[DecodedBlockCache],
+    filters: Optional[KeyRangeFilters],
+) -> Optional[dict]:
+    """Newest version of the record stored from block `start` on, or None."""
+    if index is not None and index.covers(key_field):
+        # Only blocks mined since the last sync are read, the rest comes from the index
+        index.sync(w3, block_fetcher)
+        locations = [
+            location
+            for location in index.lookup(key_field, key)[-1:]
+            if location[0] >= start
+        ]
+        records = index.fetch_records(w3, locations)
+        return records[-1] if records else None
+    head = w3.eth.block_number
+    if max_depth is not None:
+        start = max(start, head + 1 - max_depth)
+    records = (
+        filters.scan(w3, start, head + 1, block_fetcher, key_field, key, True, cache)
+        if filters is not None
+        else scan_records(w3, start, head + 1, block_fetcher, reverse=True, cache=cache)
+    )
+    return next(
+        (record for *_, record in records if key_matches(record, key_field, key)),
+        None,
+    )
+
+
+async def _latest_from_async(
+    w3: AsyncWeb3,
+    key: str,
+    key_field: str,
+    start: int,
+    index: Optional[RecordIndex],
+    block_fetcher: Callable,
+    max_depth: Optional[int],
+    cache: Optional[DecodedBlockCache],
+    filters: Optional[KeyRangeFilters],
+) -> Optional[dict]:
+    """Async counterpart of `_latest_from`."""
+    if index is not None and index.covers(key_field):
+        await sync_sinks_async(w3, [index], block_fetcher)
+        locations = [
+            location
+            for location in index.lookup(key_field, key)[-1:]
+            if location[0] >= start
+        ]
+        positioned = await index.fetch_positioned_async(w3, locations)
+        return positioned[-1][-1] if positioned else None
+    head = await w3.eth.block_number
+    if max_depth is not None:
+        start = max(start, head + 1 - max_depth)
+    # Closing the scan cancels the block requests still in flight
+    async with aclosing(
+        filters.scan_async(
+            w3, start, head + 1, block_fetcher, key_field, key, True, cache
+        )
+        if filters is not None
+        else scan_records_async(
+            w3, start, head + 1, block_fetcher, reverse=True, cache=cache
+        )
+    ) as records:
+        async for *_, record in records:
+            if key_matches(record, key_field, key):
+                return record
+    return None
+
+
+def get_latest_record_logic(
+    w3: Web3,
+    key: str,
+    key_field: str = "vin",
+    index: Optional[RecordIndex] = None,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks,
+    max_depth: Optional[int] = None,
+    cache: Optional[DecodedBlockCache] = None,
+    locator: Optional[RecordLocator] = None,
+    filters: Optional[KeyRangeFilters] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    """
+    Return the newest version of a record.
+
+    Without a synced view, a registry or locator that knows the key or an index
+    covering `key_field`, the chain is walked from the head towards genesis and the scan stops
+    at the first match. `max_depth` limits that walk to the newest `max_depth` blocks
+    and `filters` lets it skip block ranges that cannot contain the key.
+
+    A locator only knows the writes that recorded themselves, so the blocks after its
+    newest record are still read through the index or the scan.
+    """
+    try:
+        latest_record = None
+        if view is not None and view.synced:
+            # The follower keeps the view at the head, this only tops up a lagging block
+            view.sync(w3, block_fetcher)
+            latest_record = view.latest(key_field, key)
+        elif (
+            registry is not None
+            and registry.covers(key_field)
+            and (positioned := registry.lookup(w3, key_field, key))
+        ):
+            latest_record = positioned[-1][-1]
+        elif (
+            locator is not None
+            and locator.covers(key_field)
+            and (locations := locator.lookup(key_field, key))
+        ):
+            # Only the newest located transaction and those still unplaced are fetched
+            positioned = locator.fetch_positioned(
+                w3, latest_candidates(locations)
+            ) or locator.fetch_positioned(w3, locations)
+            latest_record = _latest_from(
+                w3,
+                key,
+                key_field,
+                positioned[-1][0] + 1 if positioned else 0,
+                index,
+                block_fetcher,
+                max_depth,
+                cache,
+                filters,
+            ) or (positioned[-1][-1] if positioned else None)
+        else:
+            latest_record = _latest_from(
+                w3, key, key_field, 0, index, block_fetcher, max_depth, cache, filters
+            )
+        if not latest_record:
+            raise HTTPException(status_code=404, detail="Record not found")
+        return latest_record
+    except HTTPException:  # pragma: no cover
+        raise  # Keep HTTPExceptions as-is
+    except Exception as e:  # pragma: no cover
+        raise HTTPException(
+            status_code=500, detail=f"Error retrieving record: {str(e)}"
+        )
+
+
+async def get_latest_record_logic_async(
+    w3: AsyncWeb3,
+    key: str,
+    key_field: str = "vin",
+    index: Optional[RecordIndex] = None,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks_async,
+    max_depth: Optional[int] = None,
+    cache: Optional[DecodedBlockCache] = None,
+    locator: Optional[RecordLocator] = None,
+    filters: Optional[KeyRangeFilters] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> dict:
+    """Async counterpart of `get_latest_record_logic`."""
     try:
         latest_record = None
-        for block_number in range(w3.eth.block_number + 1):
-            block = w3.eth.get_block(block_number, full_transactions=True)
-            for tx in block.transactions:
-                if tx.to is None:
-                    data_hex = tx.input if isinstance(tx.input, str) else tx.input.hex()
-                    record = json.loads(w3.to_text(hexstr=data_hex))
-                    if record.get(key_field) == key:
-                        latest_record = record
+        if view is not None and view.synced:
+            await sync_sinks_async(w3, [view], block_fetcher)
+            latest_record = view.latest(key_field, key)
+        elif (
+            registry is not None
+            and registry.covers(key_field)
+            and (positioned := await registry.lookup_async(w3, key_field, key))
+        ):
+            latest_record = positioned[-1][-1]
+        elif (
+            locator is not None
+            and locator.covers(key_field)
+            and (locations := await asyncio.to_thread(locator.lookup, key_field, key))
+        ):
+            positioned = await locator.fetch_positioned_async(
+                w3, latest_candidates(locations)
+            ) or await locator.fetch_positioned_async(w3, locations)
+            latest_record = await _latest_from_async(
+                w3,
+                key,
+                key_field,
+                positioned[-1][0] + 1 if positioned else 0,
+                index,
+                block_fetcher,
+                max_depth,
+                cache,
+                filters,
+            ) or (positioned[-1][-1] if positioned else None)
+        else:
+            latest_record = await _latest_from_async(
+                w3, key, key_field, 0, index, block_fetcher, max_depth, cache, filters
+            )
         if not latest_record:
             raise HTTPException(status_code=404, detail="Record not found")
         return latest_record
@@ -1,20 +1,348 @@
+import asyncio
 from fastapi import HTTPException
-import json
-from web3 import Web3
+from itertools import chain
+from typing import AsyncIterator, Callable, Iterable, Optional, Union
+from web3 import AsyncWeb3, Web3
+from .blockCache import DecodedBlockCache
+from .blockFetcher import fetch_blocks, fetch_blocks_async
+from .chainSink import sync_sinks_async
+from .decodeRecord import scan_records, scan_records_async
+from .keyFilters import KeyRangeFilters, key_matches
+from .pagination import iter_page, resolve_range, take_page, take_page_async
+from .recordIndex import RecordIndex
+from .recordLocator import RecordLocator
+from .recordRegistry import RecordRegistry
+from .recordView import RecordView
 
 
-def get_record_history_logic(w3: Web3, key: str, key_field: str = "vin") -> list:
+def _history_between(
+    w3: Web3,
+    key: str,
+    key_field: str,
+    start: int,
+    stop: int,
+    after: Optional[tuple],
+    limit: Optional[int],
+    index: Optional[RecordIndex],
+    block_fetcher: Callable,
+    cache: Optional[DecodedBlockCache],
+    filters: Optional[KeyRangeFilters],
+) -> tuple:
+    """
+    Versions of the record in [start, stop) from the index or a scan of the chain.
+
+    Returns:
+        tuple: (positioned, after), `after` being None once the index applied it.
+    """
+    if index is not None and index.covers(key_field):
+        # Only blocks mined since the last sync are read, the rest comes from the index
+        index.sync(w3, block_fetcher)
+        locations = [
+            location
+            for location in index.lookup(key_field, key)
+            if start <= location[0] < stop
+        ]
+        # Only the transactions of the requested page are fetched
+        return (
+            index.fetch_positioned(w3, list(iter_page(locations, after, limit))),
+            None,
+        )
+    records = (
+        filters.scan(w3, start, stop, block_fetcher, key_field, key, cache=cache)
+        if filters is not None
+        else scan_records(w3, start, stop, block_fetcher, cache=cache)
+    )
+    return (entry for entry in records if key_matches(entry[-1], key_field, key)), after
+
+
+async def _history_between_async(
+    w3: AsyncWeb3,
+    key: str,
+    key_field: str,
+    start: int,
+    stop: int,
+    after: Optional[tuple],
+    limit: Optional[int],
+    index: Optional[RecordIndex],
+    block_fetcher: Callable,
+    cache: Optional[DecodedBlockCache],
+    filters: Optional[KeyRangeFilters],
+) -> tuple:
+    """Async counterpart of `_history_between`; the scan comes back as an async source."""
+    if index is not None and index.covers(key_field):
+        await sync_sinks_async(w3, [index], block_fetcher)
+        locations = [
+            location
+            for location in index.lookup(key_field, key)
+            if start <= location[0] < stop
+        ]
+        positioned = await index.fetch_positioned_async(
+            w3, list(iter_page(locations, after, limit))
+        )
+        return positioned, None
+    records = (
+        filters.scan_async(w3, start, stop, block_fetcher, key_field, key, cache=cache)
+        if filters is not None
+        else scan_records_async(w3, start, stop, block_fetcher, cache=cache)
+    )
+    return (
+        entry async for entry in records if key_matches(entry[-1], key_field, key)
+    ), after
+
+
+async def _chain_async(*sources: Iterable) -> AsyncIterator[tuple]:
+    """Yield the entries of plain and async sources one source after the other."""
+    for source in sources:
+        if hasattr(source, "__aiter__"):
+            async for entry in source:
+                yield entry
+        else:
+            for entry in source:
+                yield entry
+
+
+def get_record_history_logic(
+    w3: Web3,
+    key: str,
+    key_field: str = "vin",
+    index: Optional[RecordIndex] = None,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+    locator: Optional[RecordLocator] = None,
+    filters: Optional[KeyRangeFilters] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> Union[list, dict]:
+    """
+    Return every version of a record in [from_block, to_block], oldest first.
+
+    A synced view, then a registry or locator that knows the key, then an index
+    covering `key_field` are used before falling back to scanning the chain; `filters` lets
+    that scan skip block ranges that cannot contain the key. A locator only knows the
+    writes that recorded themselves, so the blocks before its oldest and after its
+    newest record are still read through the index or the scan, as are the blocks
+    before the registry was deployed.
+
+    With `limit` or `cursor` a page is returned instead of a list:
+    {"records": [...], "next_cursor": ...}; pass `next_cursor` back to continue.
+    """
+    try:
+        paged = limit is not None or cursor is not None
+        start, stop, after = resolve_range(
+            w3.eth.block_number, from_block, to_block, cursor
+        )
+        if view is not None and view.synced:
+            # The follower keeps the view at the head, this only tops up a lagging block
+            view.sync(w3, block_fetcher)
+            positioned = view.history_between(key_field, key, start, stop)
+        elif (
+            registry is not None
+            and registry.covers(key_field)
+            and (stored := registry.lookup(w3, key_field, key))
+        ):
+            earlier = []
+            if start < min(registry.deployed_at, stop):
+                # Versions stored as calldata before the registry was deployed
+                earlier, _ = _history_between(
+                    w3,
+                    key,
+                    key_field,
+                    start,
+                    min(registry.deployed_at, stop),
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            positioned = chain(
+                earlier, (entry for entry in stored if start <= entry[0] < stop)
+            )
+        elif (
+            locator is not None
+            and locator.covers(key_field)
+            and (locations := locator.lookup(key_field, key))
+        ):
+            located = locator.fetch_positioned(w3, locations)
+            # Versions the locator missed, written before it existed or whose locator
+            # write failed, are read from the blocks before and after the located ones
+            head_stop = min(stop, located[0][0]) if located else start
+            tail_start = max(start, located[-1][0] + 1) if located else start
+            earlier, tail = [], []
+            if start < head_stop:
+                earlier, _ = _history_between(
+                    w3,
+                    key,
+                    key_field,
+                    start,
+                    head_stop,
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            if tail_start < stop:
+                tail, _ = _history_between(
+                    w3,
+                    key,
+                    key_field,
+                    tail_start,
+                    stop,
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            positioned = chain(
+                earlier,
+                (entry for entry in located if start <= entry[0] < stop),
+                tail,
+            )
+        else:
+            positioned, after = _history_between(
+                w3,
+                key,
+                key_field,
+                start,
+                stop,
+                after,
+                limit,
+                index,
+                block_fetcher,
+                cache,
+                filters,
+            )
+        history = take_page(positioned, after, limit, paged)
+        if not paged and not history:
+            raise HTTPException(
+                status_code=404, detail="No history found for the record"
+            )
+        return history
+    except HTTPException:  # Allow HTTPExceptions to propagate as-is
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error retrieving history: {str(e)}"
+        )
+
+
+async def get_record_history_logic_async(
+    w3: AsyncWeb3,
+    key: str,
+    key_field: str = "vin",
+    index: Optional[RecordIndex] = None,
+    view: Optional[RecordView] = None,
+    block_fetcher: Callable = fetch_blocks_async,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[DecodedBlockCache] = None,
+    locator: Optional[RecordLocator] = None,
+    filters: Optional[KeyRangeFilters] = None,
+    registry: Optional[RecordRegistry] = None,
+) -> Union[list, dict]:
+    """Async counterpart of `get_record_history_logic`."""
     try:
-        history = []
-        for block_number in range(w3.eth.block_number + 1):
-            block = w3.eth.get_block(block_number, full_transactions=True)
-            for tx in block.transactions:
-                if tx.to is None:
-                    data_hex = tx.input if isinstance(tx.input, str) else tx.input.hex()
-                    record = json.loads(w3.to_text(hexstr=data_hex))
-                    if record.get(key_field) == key:
-                        history.append(record)
-        if not history:
+        paged = limit is not None or cursor is not None
+        start, stop, after = resolve_range(
+            await w3.eth.block_number, from_block, to_block, cursor
+        )
+        if view is not None and view.synced:
+            await sync_sinks_async(w3, [view], block_fetcher)
+            positioned = view.history_between(key_field, key, start, stop)
+        elif (
+            registry is not None
+            and registry.covers(key_field)
+            and (stored := await registry.lookup_async(w3, key_field, key))
+        ):
+            earlier = []
+            if start < min(registry.deployed_at, stop):
+                earlier, _ = await _history_between_async(
+                    w3,
+                    key,
+                    key_field,
+                    start,
+                    min(registry.deployed_at, stop),
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            positioned = _chain_async(
+                earlier, [entry for entry in stored if start <= entry[0] < stop]
+            )
+        elif (
+            locator is not None
+            and locator.covers(key_field)
+            and (locations := await asyncio.to_thread(locator.lookup, key_field, key))
+        ):
+            located = await locator.fetch_positioned_async(w3, locations)
+            # Versions the locator missed, written before it existed or whose locator
+            # write failed, are read from the blocks before and after the located ones
+            head_stop = min(stop, located[0][0]) if located else start
+            tail_start = max(start, located[-1][0] + 1) if located else start
+            earlier, tail = [], []
+            if start < head_stop:
+                earlier, _ = await _history_between_async(
+                    w3,
+                    key,
+                    key_field,
+                    start,
+                    head_stop,
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            if tail_start < stop:
+                tail, _ = await _history_between_async(
+                    w3,
+                    key,
+                    key_field,
+                    tail_start,
+                    stop,
+                    None,
+                    None,
+                    index,
+                    block_fetcher,
+                    cache,
+                    filters,
+                )
+            positioned = _chain_async(
+                earlier,
+                [entry for entry in located if start <= entry[0] < stop],
+                tail,
+            )
+        else:
+            positioned, after = await _history_between_async(
+                w3,
+                key,
+                key_field,
+                start,
+                stop,
+                after,
+                limit,
+                index,
+                block_fetcher,
+                cache,
+                filters,
+            )
+        history = await take_page_async(positioned, after, limit, paged)
+        if not paged and not history:
             raise HTTPException(
                 status_code=404, detail="No history found for the record"
             )
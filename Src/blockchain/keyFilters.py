@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional, Tuple
+from web3 import AsyncWeb3, Web3
+
+from .blockCache import DecodedBlockCache
+from .decodeRecord import scan_records, scan_records_async
+from .recordIndex import DEFAULT_INDEX_FIELDS
+
+# Blocks summarized by one filter; ranges are aligned to multiples of this
+RANGE_BLOCKS = 1024
+FALSE_POSITIVE_RATE = 0.01
+# Bumped whenever the stored filter layout changes; older files are emptied
+FILTER_FORMAT = 1
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives."""
+
+    def __init__(self, bits: bytes, hashes: int) -> None:
+        self.bits = bytes(bits)
+        self.hashes = hashes
+
+    @classmethod
+    def from_keys(
+        cls, keys: Iterable[str], false_positive_rate: float = FALSE_POSITIVE_RATE
+    ) -> "BloomFilter":
+        """Size the filter for `keys` so lookups of other keys hit at the given rate."""
+        keys = set(keys)
+        size = max(
+            64,
+            math.ceil(-len(keys) * math.log(false_positive_rate) / math.log(2) ** 2),
+        )
+        size += -size % 8
+        hashes = max(1, round(size / max(len(keys), 1) * math.log(2)))
+        bits = bytearray(size // 8)
+        bloom = cls(bits, hashes)
+        for key in keys:
+            for position in bloom._positions(key):
+                bits[position // 8] |= 1 << position % 8
+        bloom.bits = bytes(bits)
+        return bloom
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+        size = len(self.bits) * 8
+        return ((first + i * second) % size for i in range(self.hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position // 8] >> position % 8 & 1
+            for position in self._positions(key)
+        )
+
+
+def _element(key_field: str, key: object) -> str:
+    return f"{key_field}\x00{key}"
+
+
+def key_matches(record: object, key_field: str, key: object) -> bool:
+    """
+    Whether `record` holds `key` in `key_field`. Keys compare as strings, the way the
+    index, view, filters and registry topics store them, so a numeric field such as
+    `vehicle_year` matches its query string on every lookup path.
+    """
+    if not isinstance(record, dict) or record.get(key_field) is None:
+        return False
+    return str(record[key_field]) == str(key)
+
+
+class _RangeBuilder:
+    """Collects the keys of ranges being scanned and hands out each finished range."""
+
+    def __init__(self, range_starts: list, range_blocks: int, reverse: bool) -> None:
+        self.pending = deque(range_starts)  # In scan order
+        self.keys = {range_start: set() for range_start in range_starts}
+        self.range_blocks = range_blocks
+        self.reverse = reverse
+
+    def observe(self, block_number: int, elements: list) -> list:
+        """Add a record's keys; return (range_start, keys) of the ranges scanned past."""
+        range_start = block_number - block_number % self.range_blocks
+        done = []
+        while self.pending and (
+            self.pending[0] > range_start
+            if self.reverse
+            else self.pending[0] < range_start
+        ):
+            done.append(self._pop())
+        if range_start in self.keys:
+            self.keys[range_start].update(elements)
+        return done
+
+    def finish(self) -> list:
+        return [self._pop() for _ in range(len(self.pending))]
+
+    def _pop(self) -> tuple:
+        range_start = self.pending.popleft()
+        return range_start, self.keys.pop(range_start)
+
+
+class KeyRangeFilters:
+    """
+    Bloom filters over the `key_fields` values of every `range_blocks` blocks.
+
+    Scans through `scan` skip each range whose filter rules the requested key out
+    and build the filters of complete ranges they read in full, so repeated lookups
+    of rare keys decode only the ranges that may contain them. Filters are kept in a
+    SQLite file with the hash of each range's last block; they are dropped when the
+    node no longer has that block.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+        range_blocks: int = RANGE_BLOCKS,
+    ) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.key_fields = tuple(key_fields)
+        self.range_blocks = range_blocks
+        self.skipped_ranges = 0
+        self.scanned_ranges = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        settings = f"{range_blocks}:{','.join(self.key_fields)}"
+        with self._conn:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != FILTER_FORMAT:
+                self._conn.execute("DROP TABLE IF EXISTS filters")
+                self._conn.execute("DROP TABLE IF EXISTS meta")
+                self._conn.execute(f"PRAGMA user_version = {FILTER_FORMAT}")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS filters (
+                    range_start INTEGER PRIMARY KEY,
+                    last_hash TEXT NOT NULL,
+                    hashes INTEGER NOT NULL,
+                    bits BLOB NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+            )
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name = 'settings'"
+            ).fetchone()
+            if row is None or row[0] != settings:
+                # Filters built for other fields or range sizes cannot be reused
+                self._conn.execute("DELETE FROM filters")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('settings', ?)", (settings,)
+                )
+        self._filters = {
+            range_start: (last_hash, BloomFilter(bits, hashes))
+            for range_start, last_hash, hashes, bits in self._conn.execute(
+                "SELECT range_start, last_hash, hashes, bits FROM filters"
+            )
+        }
+
+    def covers(self, key_field: str) -> bool:
+        return key_field in self.key_fields
+
+    def _elements(self, record: dict) -> list:
+        return [
+            _element(key_field, record[key_field])
+            for key_field in self.key_fields
+            if record.get(key_field) is not None
+        ]
+
+    def _store(self, range_start: int, last_hash: str, keys: set) -> None:
+        bloom = BloomFilter.from_keys(keys)
+        with self._lock:
+            self._filters[range_start] = (last_hash, bloom)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO filters VALUES (?, ?, ?, ?)",
+                    (range_start, last_hash, bloom.hashes, bloom.bits),
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filters = {}
+            with self._conn:
+                self._conn.execute("DELETE FROM filters")
+
+    def stats(self) -> dict:
+        return {
+            "filters": len(self._filters),
+            "range_blocks": self.range_blocks,
+            "skipped_ranges": self.skipped_ranges,
+            "scanned_ranges": self.scanned_ranges,
+        }
+
+    def _newest(self) -> Optional[int]:
+        """Last block of the newest filtered range."""
+        if not self._filters:
+            return None
+        return max(self._filters) + self.range_blocks - 1
+
+    def _drop_if_stale(self, newest: int, head: int, block_hash: Optional[str]) -> None:
+        with self._lock:
+            range_start = newest - self.range_blocks + 1
+            if range_start in self._filters and (
+                newest > head or block_hash != self._filters[range_start][0]
+            ):
+                self.clear()
+
+    def _plan(
+        self, start: int, stop: int, head: int, key_field: str, key: str, reverse: bool
+    ) -> list:
+        """
+        Split [start, stop) into runs of blocks to scan, leaving out the ranges whose
+        filter rules `key` out. Returns (run_start, run_stop, ranges to build) tuples
+        in scan order.
+        """
+        element = _element(key_field, key)
+        ranges = range(start - start % self.range_blocks, stop, self.range_blocks)
+        runs, run = [], None
+        for range_start in reversed(ranges) if reverse else ranges:
+            range_stop = range_start + self.range_blocks
+            low, high = max(range_start, start), min(range_stop, stop)
+            stored = self._filters.get(range_start)
+            if stored is not None and element not in stored[1]:
+                self.skipped_ranges += 1
+                run = None
+                continue
+            self.scanned_ranges += 1
+            if run is None:
+                run = [low, high, []]
+                runs.append(run)
+            elif reverse:
+                run[0] = low
+            else:
+                run[1] = high
+            if (
+                stored is None
+                and (low, high) == (range_start, range_stop)
+                and range_stop <= head + 1
+            ):
+                run[2].append(range_start)
+        return [tuple(run) for run in runs]
+
+    def scan(
+        self,
+        w3: Web3,
+        start: int,
+        stop: int,
+        block_fetcher: Callable,
+        key_field: str,
+        key: str,
+        reverse: bool = False,
+        cache: Optional[DecodedBlockCache] = None,
+    ) -> Iterator[tuple]:
+        """
+        `scan_records` over [start, stop) without the ranges that cannot contain
+        `key`. Callers still have to match `key_field` against the yielded records.
+        """
+        if not self.covers(key_field):
+            yield from scan_records(w3, start, stop, block_fetcher, reverse, cache)
+            return
+        head = w3.eth.block_number
+        newest = self._newest()
+        if newest is not None:
+            block_hash = None
+            if newest <= head:
+                block_hash = Web3.to_hex(w3.eth.get_block(newest).hash)
+            self._drop_if_stale(newest, head, block_hash)
+
+        def store(finished: list) -> None:
+            for range_start, keys in finished:
+                last_block = w3.eth.get_block(range_start + self.range_blocks - 1)
+                self._store(range_start, Web3.to_hex(last_block.hash), keys)
+
+        for run_start, run_stop, building in self._plan(
+            start, stop, head, key_field, key, reverse
+        ):
+            builder = _RangeBuilder(building, self.range_blocks, reverse)
+            for entry in scan_records(
+                w3, run_start, run_stop, block_fetcher, reverse, cache
+            ):
+                store(builder.observe(entry[0], self._elements(entry[-1])))
+                yield entry
+            store(builder.finish())
+
+    async def scan_async(
+        self,
+        w3: AsyncWeb3,
+        start: int,
+        stop: int,
+        block_fetcher: Callable,
+        key_field: str,
+        key: str,
+        reverse: bool = False,
+        cache: Optional[DecodedBlockCache] = None,
+    ) -> AsyncIterator[tuple]:
+        """Async counterpart of `scan`; `block_fetcher` is an async generator."""
+        if not self.covers(key_field):
+            async with aclosing(
+                scan_records_async(w3, start, stop, block_fetcher, reverse, cache)
+            ) as entries:
+                async for entry in entries:
+                    yield entry
+            return
+        head = await w3.eth.block_number
+        newest = self._newest()
+        if newest is not None:
+            block_hash = None
+            if newest <= head:
+                block_hash = Web3.to_hex((await w3.eth.get_block(newest)).hash)
+            await asyncio.to_thread(self._drop_if_stale, newest, head, block_hash)
+
+        async def store(finished: list) -> None:
+            for range_start, keys in finished:
+                last_block = await w3.eth.get_block(range_start + self.range_blocks - 1)
+                # Building the filter and the SQLite write stay off the event loop
+                await asyncio.to_thread(
+                    self._store, range_start, Web3.to_hex(last_block.hash), keys
+                )
+
+        for run_start, run_stop, building in self._plan(
+            start, stop, head, key_field, key, reverse
+        ):
+            builder = _RangeBuilder(building, self.range_blocks, reverse)
+            # Closing the scan cancels the block requests still in flight
+            async with aclosing(
+                scan_records_async(
+                    w3, run_start, run_stop, block_fetcher, reverse, cache
+                )
+            ) as entries:
+                async for entry in entries:
+                    await store(builder.observe(entry[0], self._elements(entry[-1])))
+                    yield entry
+            await store(builder.finish())
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Optional
+from web3 import AsyncWeb3
+from web3.types import ChecksumAddress
+
+
+class NonceManager:
+    """
+    Hands out transaction nonces for one account from a local counter.
+
+    Nonces are reserved in blocks, so a whole batch of transactions can be sent with
+    explicit nonces without waiting on each other. Each reservation also asks the
+    node for its pending transaction count, so nonces used by other clients are
+    skipped.
+    """
+
+    def __init__(self, account: ChecksumAddress) -> None:
+        self.account = account
+        self._next: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def reserve(self, w3: AsyncWeb3, count: int = 1) -> int:
+        """Reserve `count` consecutive nonces and return the first one."""
+        async with self._lock:
+            pending = await w3.eth.get_transaction_count(self.account, "pending")
+            first = pending if self._next is None else max(self._next, pending)
+            self._next = first + count
+            return first
+
+    def reset(self) -> None:
+        """Forget the local counter after a failed send; the next reservation asks the node."""
+        self._next = None
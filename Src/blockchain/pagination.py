@@ -0,0 +1,121 @@
+import base64
+from fastapi import HTTPException
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
+
+
+def encode_cursor(block_number: int, tx_index: int, slot: int = 0) -> str:
+    """Build an opaque continuation cursor pointing at a record position."""
+    return base64.urlsafe_b64encode(
+        f"{block_number}:{tx_index}:{slot}".encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Return the (block_number, tx_index, slot) position encoded in a cursor."""
+    try:
+        parts = [
+            int(part) for part in base64.urlsafe_b64decode(cursor.encode()).split(b":")
+        ]
+        if len(parts) == 2:
+            # Cursors issued before packed transactions point at a whole transaction
+            return parts[0], parts[1], float("inf")
+        block_number, tx_index, slot = parts
+        return block_number, tx_index, slot
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def resolve_range(
+    head: int,
+    from_block: Optional[int] = None,
+    to_block: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> tuple:
+    """
+    Turn the pagination parameters into a block range to read.
+
+    Returns:
+        tuple: (start, stop, after) where [start, stop) is the block range and `after`
+        is the cursor position records must come after (or None).
+    """
+    start = from_block or 0
+    stop = head + 1 if to_block is None else min(to_block, head) + 1
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None:
+        start = max(start, after[0])
+    return start, stop, after
+
+
+def iter_page(
+    positioned: Iterable[tuple], after: Optional[tuple], limit: Optional[int]
+) -> Iterator[tuple]:
+    """
+    Yield (block_number, tx_index, slot, ...) entries that come after `after`, up to
+    `limit`.
+
+    The source is not read past the last entry returned.
+    """
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+    for entry in positioned:
+        if after is not None and entry[:3] <= after:
+            continue
+        yield entry
+        count += 1
+        if limit is not None and count >= limit:
+            return
+
+
+def take_page(
+    positioned: Iterable[tuple],
+    after: Optional[tuple] = None,
+    limit: Optional[int] = None,
+    paged: bool = False,
+) -> Union[list, dict]:
+    """
+    Collect a page of records.
+
+    Returns the plain list of records, or with `paged` a dict with the records and the
+    cursor of the next page (None once a page comes back short).
+    """
+    return _page_result(list(iter_page(positioned, after, limit)), limit, paged)
+
+
+def _page_result(page: list, limit: Optional[int], paged: bool) -> Union[list, dict]:
+    records = [record for *_, record in page]
+    if not paged:
+        return records
+    next_cursor = None
+    if limit is not None and page and len(page) == limit:
+        next_cursor = encode_cursor(*page[-1][:3])
+    return {"records": records, "next_cursor": next_cursor}
+
+
+async def iter_page_async(
+    positioned: AsyncIterable[tuple], after: Optional[tuple], limit: Optional[int]
+) -> AsyncIterator[tuple]:
+    """Async counterpart of `iter_page`."""
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+    async for entry in positioned:
+        if after is not None and entry[:3] <= after:
+            continue
+        yield entry
+        count += 1
+        if limit is not None and count >= limit:
+            return
+
+
+async def take_page_async(
+    positioned: Union[Iterable[tuple], AsyncIterable[tuple]],
+    after: Optional[tuple] = None,
+    limit: Optional[int] = None,
+    paged: bool = False,
+) -> Union[list, dict]:
+    """Like `take_page`, also accepting an async source."""
+    if not hasattr(positioned, "__aiter__"):
+        return take_page(positioned, after, limit, paged)
+    page = [entry async for entry in iter_page_async(positioned, after, limit)]
+    return _page_result(page, limit, paged)
@@ -0,0 +1,121 @@
+import json
+import struct
+import zlib
+from typing import Any, Callable, Dict, NamedTuple
+
+try:  # Optional binary formats
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Prefixed payloads start with this magic. The leading 0x00 is STOP, so the contract
+# creation carrying the record ends immediately. Legacy JSON records start with "{".
+RECORD_MAGIC = b"\x00RC"
+RECORD_VERSION = 1
+
+_HEADER = struct.Struct(">3sBBB")  # magic, version, codec id, compression id
+
+
+class Codec(NamedTuple):
+    codec_id: int
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+_codecs: Dict[str, Codec] = {}
+_compressions: Dict[str, Codec] = {}
+
+
+def register_codec(name: str, codec_id: int, dumps: Callable, loads: Callable) -> None:
+    """Make a serialization format available as `name` for writing and reading."""
+    _codecs[name] = Codec(codec_id, dumps, loads)
+
+
+def register_compression(
+    name: str, compression_id: int, compress: Callable, decompress: Callable
+) -> None:
+    """Make a compression available as the `+name` suffix of a codec spec."""
+    _compressions[name] = Codec(compression_id, compress, decompress)
+
+
+def available_codecs() -> list:
+    return sorted(_codecs)
+
+
+register_codec(
+    "json",
+    1,
+    lambda record: json.dumps(record, separators=(",", ":")).encode(),
+    json.loads,
+)
+if msgpack is not None:
+    register_codec("msgpack", 2, msgpack.packb, msgpack.unpackb)
+register_compression("zlib", 1, zlib.compress, zlib.decompress)
+if zstandard is not None:  # pragma: no cover
+    register_compression(
+        "zstd",
+        2,
+        lambda data: zstandard.ZstdCompressor().compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+
+def encode_record(record: dict, codec: str = "json") -> bytes:
+    """
+    Serialize a record for the chain.
+
+    `codec` names a registered format, optionally followed by a compression, e.g.
+    "msgpack" or "msgpack+zlib". Plain "json" writes the legacy unprefixed JSON text
+    (without spaces) so existing readers keep working; everything else is prefixed
+    with a header naming the format.
+    """
+    name, _, compression = codec.partition("+")
+    if name not in _codecs:
+        raise ValueError(f"Unknown record codec '{name}'")
+    if compression and compression not in _compressions:
+        raise ValueError(f"Unknown record compression '{compression}'")
+    payload = _codecs[name].dumps(record)
+    if name == "json" and not compression:
+        return payload
+    compression_id = 0
+    if compression:
+        compression_id = _compressions[compression].codec_id
+        payload = _compressions[compression].dumps(payload)
+    return (
+        _HEADER.pack(
+            RECORD_MAGIC, RECORD_VERSION, _codecs[name].codec_id, compression_id
+        )
+        + payload
+    )
+
+
+def is_encoded_record(data: bytes) -> bool:
+    return data.startswith(RECORD_MAGIC)
+
+
+def decode_record(data: bytes) -> object:
+    """Decode a payload written by `encode_record` (any codec, or legacy JSON)."""
+    if not data.startswith(RECORD_MAGIC):
+        return json.loads(data)
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated record header")
+    _, version, codec_id, compression_id = _HEADER.unpack_from(data)
+    if version != RECORD_VERSION:
+        raise ValueError(f"Unsupported record version {version}")
+    payload = data[_HEADER.size :]
+    if compression_id:
+        compression = _by_id(_compressions, compression_id, "compression")
+        payload = compression.loads(payload)
+    return _by_id(_codecs, codec_id, "codec").loads(payload)
+
+
+def _by_id(registry: Dict[str, Codec], codec_id: int, kind: str) -> Codec:
+    for codec in registry.values():
+        if codec.codec_id == codec_id:
+            return codec
+    raise ValueError(f"Unknown record {kind} id {codec_id}")
@@ -0,0 +1,92 @@
+import struct
+from typing import Iterator, List
+from web3 import Web3
+from .recordCodec import decode_record, encode_record
+
+# Packed transactions start with this prefix. The leading 0x00 is STOP, so the
+# contract creation carrying the envelope ends immediately instead of running the
+# payload as code. Legacy single-record transactions start with "{".
+PACK_MAGIC = b"\x00RPK"
+PACK_VERSION = 1
+# EIP-3860 caps contract creation input at 49152 bytes
+MAX_ENVELOPE_BYTES = 49152
+
+# Calls to a `RecordRegistry` start with this selector, followed by KEY_TOPICS
+# 32-byte key topics and the encoded record
+REGISTRY_SELECTOR = Web3.keccak(text="storeRecord(bytes32,bytes32,bytes32)")[:4]
+KEY_TOPICS = 3
+REGISTRY_RECORD_OFFSET = len(REGISTRY_SELECTOR) + 32 * KEY_TOPICS
+
+_HEADER = struct.Struct(">4sBI")  # magic, version, record count
+_OFFSET = struct.Struct(">I")
+
+
+def is_envelope(data: bytes) -> bool:
+    return data.startswith(PACK_MAGIC)
+
+
+def pack_records(records: List[dict], codec: str = "json") -> bytes:
+    """
+    Pack several records into one transaction payload.
+
+    Layout: header (magic, version, count), count + 1 big-endian uint32 offsets into
+    the body, then the records encoded with `codec` back to back. Record `slot` spans
+    body[offsets[slot]:offsets[slot + 1]].
+    """
+    encoded = [encode_record(record, codec) for record in records]
+    offsets = [0]
+    for payload in encoded:
+        offsets.append(offsets[-1] + len(payload))
+    return b"".join(
+        [
+            _HEADER.pack(PACK_MAGIC, PACK_VERSION, len(encoded)),
+            *(_OFFSET.pack(offset) for offset in offsets),
+            *encoded,
+        ]
+    )
+
+
+def unpack_records(data: bytes) -> List[dict]:
+    """Return the records of an envelope in slot order."""
+    if len(data) < _HEADER.size:
+        raise ValueError("Truncated record envelope")
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != PACK_MAGIC:
+        raise ValueError("Not a record envelope")
+    if version != PACK_VERSION:
+        raise ValueError(f"Unsupported record envelope version {version}")
+    body = _HEADER.size + (count + 1) * _OFFSET.size
+    if len(data) < body:
+        raise ValueError("Truncated record envelope")
+    offsets = [
+        _OFFSET.unpack_from(data, _HEADER.size + slot * _OFFSET.size)[0]
+        for slot in range(count + 1)
+    ]
+    if offsets[-1] != len(data) - body:
+        raise ValueError("Record envelope size does not match its offset table")
+    return [
+        decode_record(data[body + offsets[slot] : body + offsets[slot + 1]])
+        for slot in range(count)
+    ]
+
+
+def pack_batches(
+    records: List[dict],
+    pack_size: int,
+    max_bytes: int = MAX_ENVELOPE_BYTES,
+    codec: str = "json",
+) -> Iterator[List[dict]]:
+    """
+    Split records into consecutive groups of at most `pack_size` records whose
+    envelope stays within `max_bytes`. A record too large on its own gets its own group.
+    """
+    group, size = [], _HEADER.size + _OFFSET.size
+    for record in records:
+        record_size = len(encode_record(record, codec)) + _OFFSET.size
+        if group and (len(group) >= pack_size or size + record_size > max_bytes):
+            yield group
+            group, size = [], _HEADER.size + _OFFSET.size
+        group.append(record)
+        size += record_size
+    if group:
+        yield group
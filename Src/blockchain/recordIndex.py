@@ -0,0 +1,146 @@
+import asyncio
+import os
+import sqlite3
+from typing import Optional, Tuple
+from web3 import AsyncWeb3, Web3
+
+from .chainSink import ChainSink
+from .decodeRecord import decode_transaction
+
+DEFAULT_INDEX_FIELDS = ("vin", "license_plate")
+# Bumped whenever the table layout changes; older files are rebuilt from the chain
+INDEX_FORMAT = 2
+
+
+def _positioned(w3: Web3, locations: list, transactions: dict) -> list:
+    """Pick the indexed slot out of each location's decoded transaction."""
+    decoded = {}
+    positioned = []
+    for block_number, tx_index, slot, tx_hash in locations:
+        if tx_hash not in decoded:
+            decoded[tx_hash] = decode_transaction(w3, transactions[tx_hash]) or []
+        if slot < len(decoded[tx_hash]):
+            positioned.append((block_number, tx_index, slot, decoded[tx_hash][slot]))
+    return positioned
+
+
+class RecordIndex(ChainSink):
+    """
+    Persistent index mapping `key_field` values to the transactions that carry them.
+
+    The index is stored in SQLite and remembers the last block it ingested, so
+    `sync` only has to read blocks mined since the previous call.
+    """
+
+    def __init__(
+        self, path: str, key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS
+    ) -> None:
+        super().__init__()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.key_fields = tuple(key_fields)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_FORMAT:
+                self._conn.execute("DROP TABLE IF EXISTS records")
+                self._conn.execute("DROP TABLE IF EXISTS meta")
+                self._conn.execute(f"PRAGMA user_version = {INDEX_FORMAT}")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    key_field TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    block_number INTEGER NOT NULL,
+                    tx_index INTEGER NOT NULL,
+                    slot INTEGER NOT NULL,
+                    tx_hash TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS records_key ON records (key_field, key)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    def _get_meta(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    @property
+    def last_block(self) -> int:
+        value = self._get_meta("last_block")
+        return int(value) if value is not None else -1
+
+    @property
+    def last_hash(self) -> Optional[str]:
+        return self._get_meta("last_hash")
+
+    def covers(self, key_field: str) -> bool:
+        return key_field in self.key_fields
+
+    def _clear(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM records")
+            self._conn.execute("DELETE FROM meta")
+
+    def _store_block(self, block_number: int, block_hash: str, records: list) -> None:
+        rows = [
+            (key_field, str(record[key_field]), block_number, tx_index, slot, tx_hash)
+            for tx_index, slot, tx_hash, record in records
+            for key_field in self.key_fields
+            if record.get(key_field) is not None
+        ]
+        # Committed by `commit`, once per synced batch of blocks
+        self._conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [("last_block", str(block_number)), ("last_hash", block_hash)],
+        )
+
+    def _commit(self) -> None:
+        self._conn.commit()
+
+    def lookup(self, key_field: str, key: str) -> list:
+        """
+        Return (block_number, tx_index, slot, tx_hash) for every indexed match, in chain
+        order.
+        """
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT block_number, tx_index, slot, tx_hash FROM records
+                WHERE key_field = ? AND key = ?
+                ORDER BY block_number, tx_index, slot
+                """,
+                (key_field, str(key)),
+            ).fetchall()
+
+    def fetch_positioned(self, w3: Web3, locations: list) -> list:
+        """Load and decode the transactions at the given index locations."""
+        transactions = {}
+        for *_, tx_hash in locations:
+            if tx_hash not in transactions:
+                transactions[tx_hash] = w3.eth.get_transaction(tx_hash)
+        return _positioned(w3, locations, transactions)
+
+    def fetch_records(self, w3: Web3, locations: list) -> list:
+        """Like `fetch_positioned`, returning only the records."""
+        return [record for *_, record in self.fetch_positioned(w3, locations)]
+
+    async def fetch_positioned_async(self, w3: AsyncWeb3, locations: list) -> list:
+        """Async counterpart of `fetch_positioned`, requesting all transactions at once."""
+        tx_hashes = list(dict.fromkeys(tx_hash for *_, tx_hash in locations))
+        transactions = await asyncio.gather(
+            *(w3.eth.get_transaction(tx_hash) for tx_hash in tx_hashes)
+        )
+        return _positioned(w3, locations, dict(zip(tx_hashes, transactions)))
+
+    def close(self) -> None:
+        self.commit()
+        self._conn.close()
@@ -0,0 +1,211 @@
+import asyncio
+from typing import Callable, Iterable, Optional, Tuple
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TransactionNotFound
+
+from .recordIndex import DEFAULT_INDEX_FIELDS, _positioned
+
+LOCATOR_TABLE = "record_locator"
+
+
+class RecordLocator:
+    """
+    Postgres table mapping `key_field` values to the transactions that store them.
+
+    Unlike `RecordIndex` it is not built from the chain: every writer (the ETL loaders
+    and the append/delete endpoints) adds a row when it sends a record. A row holds
+    (key_field, key, tx_hash, slot) and, once known, the block number and index of the
+    transaction. Rows written before the transaction was mined are completed by the
+    first read that fetches it.
+
+    Reads resolve a key with one query on the primary key plus a
+    `eth_getTransactionByHash` per transaction, so only writes that went through a
+    locator-aware writer can be found this way.
+
+    `get_db_connection` returns a psycopg connection context manager, such as the
+    `connection` method of a `psycopg_pool.ConnectionPool`.
+    """
+
+    def __init__(
+        self,
+        get_db_connection: Callable,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+    ) -> None:
+        self.get_db_connection = get_db_connection
+        self.key_fields = tuple(key_fields)
+
+    def covers(self, key_field: str) -> bool:
+        return key_field in self.key_fields
+
+    def create_table(self) -> None:
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {LOCATOR_TABLE} (
+                        key_field TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        tx_hash TEXT NOT NULL,
+                        slot INTEGER NOT NULL DEFAULT 0,
+                        block_number BIGINT,
+                        tx_index INTEGER,
+                        PRIMARY KEY (key_field, key, tx_hash, slot)
+                    )
+                    """
+                )
+                conn.commit()
+
+    def add(self, entries: Iterable[tuple]) -> int:
+        """
+        Record where records were stored.
+
+        Args:
+            entries: (record, tx_hash, slot, block_number, tx_index) tuples; the block
+                number and index may be None while the transaction is pending.
+
+        Returns:
+            int: Number of locator rows written.
+        """
+        rows = [
+            (key_field, str(record[key_field]), tx_hash, slot, block_number, tx_index)
+            for record, tx_hash, slot, block_number, tx_index in entries
+            for key_field in self.key_fields
+            if isinstance(record, dict) and record.get(key_field) is not None
+        ]
+        if not rows:
+            return 0
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # psycopg pipelines the rows, one round trip for the whole batch
+                cur.executemany(
+                    f"""
+                    INSERT INTO {LOCATOR_TABLE}
+                        (key_field, key, tx_hash, slot, block_number, tx_index)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (key_field, key, tx_hash, slot) DO UPDATE SET
+                        block_number = COALESCE(
+                            EXCLUDED.block_number, {LOCATOR_TABLE}.block_number
+                        ),
+                        tx_index = COALESCE(EXCLUDED.tx_index, {LOCATOR_TABLE}.tx_index)
+                    """,
+                    rows,
+                )
+                conn.commit()
+        return len(rows)
+
+    def lookup(self, key_field: str, key: str) -> list:
+        """
+        Return (block_number, tx_index, slot, tx_hash) for every located record, in
+        chain order with not yet placed transactions last.
+        """
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT block_number, tx_index, slot, tx_hash FROM {LOCATOR_TABLE}
+                    WHERE key_field = %s AND key = %s
+                    ORDER BY block_number NULLS LAST, tx_index, slot
+                    """,
+                    (key_field, str(key)),
+                )
+                return [tuple(row) for row in cur.fetchall()]
+
+    def _place(self, placed: list) -> None:
+        """Store the block positions learned for rows written while pending."""
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    f"""
+                    UPDATE {LOCATOR_TABLE} SET block_number = %s, tx_index = %s
+                    WHERE tx_hash = %s
+                    """,
+                    [
+                        (block_number, tx_index, tx_hash)
+                        for tx_hash, block_number, tx_index in placed
+                    ],
+                )
+                conn.commit()
+
+    def _resolve(self, w3: Web3, locations: list, transactions: dict) -> list:
+        """
+        Position the located records by their mined transactions. Transactions that
+        are still pending or unknown to the node are left out.
+        """
+        mined = {
+            tx_hash: tx
+            for tx_hash, tx in transactions.items()
+            if tx is not None and tx.blockNumber is not None
+        }
+        resolved, placed = [], set()
+        for block_number, tx_index, slot, tx_hash in locations:
+            tx = mined.get(tx_hash)
+            if tx is None:
+                continue
+            resolved.append((tx.blockNumber, tx.transactionIndex, slot, tx_hash))
+            if (block_number, tx_index) != (tx.blockNumber, tx.transactionIndex):
+                placed.add((tx_hash, tx.blockNumber, tx.transactionIndex))
+        if placed:
+            try:
+                self._place(sorted(placed))
+            except Exception as e:  # pragma: no cover
+                print(f"Error updating record locator: {e}")
+        return sorted(_positioned(w3, resolved, mined), key=lambda entry: entry[:3])
+
+    def fetch_positioned(self, w3: Web3, locations: list) -> list:
+        """Load the located transactions and return (block, tx_index, slot, record)."""
+        transactions = {}
+        for *_, tx_hash in locations:
+            if tx_hash not in transactions:
+                try:
+                    transactions[tx_hash] = w3.eth.get_transaction(tx_hash)
+                except TransactionNotFound:
+                    transactions[tx_hash] = None
+        return self._resolve(w3, locations, transactions)
+
+    async def fetch_positioned_async(self, w3: AsyncWeb3, locations: list) -> list:
+        """Async counterpart of `fetch_positioned`, requesting all transactions at once."""
+
+        async def get_transaction(tx_hash: str) -> Optional[dict]:
+            try:
+                return await w3.eth.get_transaction(tx_hash)
+            except TransactionNotFound:
+                return None
+
+        tx_hashes = list(dict.fromkeys(tx_hash for *_, tx_hash in locations))
+        transactions = await asyncio.gather(*map(get_transaction, tx_hashes))
+        return await asyncio.to_thread(
+            self._resolve, w3, locations, dict(zip(tx_hashes, transactions))
+        )
+
+
+def latest_candidates(locations: list) -> list:
+    """
+    The locations that can hold the newest record: the newest placed one and every
+    one written while its transaction was pending.
+    """
+    placed = [location for location in locations if location[0] is not None]
+    return placed[-1:] + [location for location in locations if location[0] is None]
+
+
+def locate_sent(locator: Optional[RecordLocator], entries: Iterable[tuple]) -> None:
+    """
+    Add (record, tx_hash, slot) entries of just sent transactions to `locator`.
+    Failures are reported, not raised: the records are on their way to the chain
+    either way.
+    """
+    if locator is None:
+        return
+    try:
+        locator.add(
+            (
+                record,
+                tx_hash if isinstance(tx_hash, str) else Web3.to_hex(tx_hash),
+                slot,
+                None,
+                None,
+            )
+            for record, tx_hash, slot in entries
+            if tx_hash is not None
+        )
+    except Exception as e:
+        print(f"Error updating record locator: {e}")
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+from typing import Optional, Tuple
+from web3 import AsyncWeb3, Web3
+from web3.types import ChecksumAddress
+from .decodeRecord import register_registry
+from .keyFilters import key_matches
+from .recordCodec import decode_record, encode_record
+from .recordEnvelope import KEY_TOPICS, REGISTRY_SELECTOR
+from .recordIndex import DEFAULT_INDEX_FIELDS
+
+# Topic 0 of the logs; their data is the encoded record as written, not ABI-encoded
+RECORD_STORED_TOPIC = Web3.keccak(text="RecordStored(bytes32,bytes32,bytes32)")
+EMPTY_TOPIC = bytes(32)
+
+# LOG4(memory[0:len], RECORD_STORED_TOPIC, word 1, word 2, word 3) where the words
+# follow the selector in the calldata and memory holds the calldata after them
+RUNTIME_CODE = (
+    bytes.fromhex("604435602435600435")  # CALLDATALOAD key topics 3, 2, 1
+    + b"\x7f"  # PUSH32
+    + bytes(RECORD_STORED_TOPIC)
+    + bytes.fromhex(
+        "606436038060646000376000a400"
+    )  # len = CALLDATASIZE - 0x64; CALLDATACOPY(0, 0x64, len); LOG4(0, len, ...); STOP
+)
+# CODECOPY the runtime code that follows these 11 bytes and RETURN it
+INIT_CODE = bytes.fromhex(f"60{len(RUNTIME_CODE):02x}80600b6000396000f3") + RUNTIME_CODE
+
+
+def key_topic(key_field: str, key: object) -> bytes:
+    return bytes(Web3.keccak(text=f"{key_field}:{key}"))
+
+
+class RecordRegistry:
+    """
+    Minimal contract that stores records as event logs.
+
+    Every record is sent to the contract with the keccak of "key_field:key" for each
+    of the (at most three) `key_fields` as calldata words, which the contract emits
+    as the indexed topics of a log whose data is the encoded record. Lookups are a
+    single `eth_getLogs` with a topic filter, answered from the node's log blooms,
+    instead of a scan of every block.
+
+    Only records written through the registry are found this way; the chain readers
+    decode registry calls like data-only transactions, so scans, the index and the
+    view see them too.
+    """
+
+    def __init__(
+        self,
+        address: ChecksumAddress,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+        deployed_at: int = 0,
+    ) -> None:
+        if len(key_fields) > KEY_TOPICS:
+            raise ValueError(f"At most {KEY_TOPICS} key fields can be indexed")
+        self.address = Web3.to_checksum_address(address)
+        self.key_fields = tuple(key_fields)
+        self.deployed_at = deployed_at
+        register_registry(self.address)
+
+    @classmethod
+    def deploy(
+        cls,
+        w3: Web3,
+        account: ChecksumAddress,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+    ) -> "RecordRegistry":
+        tx_hash = w3.eth.send_transaction(
+            {"from": account, "data": Web3.to_hex(INIT_CODE), "gas": 200000}
+        )
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        if receipt.status != 1 or receipt.contractAddress is None:
+            raise RuntimeError(f"Registry deployment {Web3.to_hex(tx_hash)} failed")
+        return cls(receipt.contractAddress, key_fields, receipt.blockNumber)
+
+    @classmethod
+    def load_or_deploy(
+        cls,
+        w3: Web3,
+        account: ChecksumAddress,
+        path: str,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+    ) -> "RecordRegistry":
+        """
+        Use the registry whose address is saved at `path`, deploying (and saving) a
+        new one when there is none or the node no longer has its code.
+        """
+        saved = cls.load(path, key_fields)
+        if saved is not None:
+            if w3.eth.get_code(saved.address) == RUNTIME_CODE:
+                return saved
+            print(f"Registry {saved.address} is not on this chain, redeploying")
+        registry = cls.deploy(w3, account, key_fields)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(
+                {"address": registry.address, "deployed_at": registry.deployed_at}, f
+            )
+        print(f"Deployed record registry at {registry.address}")
+        return registry
+
+    @classmethod
+    def load(
+        cls, path: str, key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS
+    ) -> Optional["RecordRegistry"]:
+        """The registry saved at `path`, without checking the chain, or None."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(saved["address"], key_fields, saved["deployed_at"])
+
+    def covers(self, key_field: str) -> bool:
+        return key_field in self.key_fields
+
+    def calldata(self, record: dict, codec: str = "json") -> bytes:
+        """Input of the call storing `record`, serialized with `codec`."""
+        topics = [
+            (
+                key_topic(key_field, record[key_field])
+                if record.get(key_field) is not None
+                else EMPTY_TOPIC
+            )
+            for key_field in self.key_fields
+        ]
+        topics += [EMPTY_TOPIC] * (KEY_TOPICS - len(topics))
+        return REGISTRY_SELECTOR + b"".join(topics) + encode_record(record, codec)
+
+    def _log_filter(self, key_field: str, key: str) -> dict:
+        position = self.key_fields.index(key_field)
+        return {
+            "address": self.address,
+            "fromBlock": self.deployed_at,
+            "toBlock": "latest",
+            "topics": [Web3.to_hex(RECORD_STORED_TOPIC)]
+            + [None] * position
+            + [Web3.to_hex(key_topic(key_field, key))],
+        }
+
+    @staticmethod
+    def _positioned(logs: list, key_field: str, key: str) -> list:
+        """(block_number, tx_index, slot, record) of the logs, in chain order."""
+        positioned = []
+        for log in logs:
+            if log.get("removed"):
+                continue
+            try:
+                record = decode_record(bytes(log["data"]))
+            except Exception as e:
+                print(f"Error decoding registry log: {e}")
+                continue
+            # Guards against hash collisions and "field:key" strings that overlap
+            if key_matches(record, key_field, key):
+                positioned.append(
+                    (log["blockNumber"], log["transactionIndex"], 0, record)
+                )
+        return sorted(positioned, key=lambda entry: entry[:3])
+
+    def lookup(self, w3: Web3, key_field: str, key: str) -> list:
+        """Return (block_number, tx_index, slot, record) for every stored version."""
+        return self._positioned(
+            w3.eth.get_logs(self._log_filter(key_field, key)), key_field, key
+        )
+
+    async def lookup_async(self, w3: AsyncWeb3, key_field: str, key: str) -> list:
+        """Async counterpart of `lookup`."""
+        logs = await w3.eth.get_logs(self._log_filter(key_field, key))
+        return await asyncio.to_thread(self._positioned, logs, key_field, key)
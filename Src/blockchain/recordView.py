@@ -0,0 +1,91 @@
+from bisect import bisect_left
+from typing import Optional
+
+from .chainSink import ChainSink
+
+
+class RecordView(ChainSink):
+    """
+    In-memory materialized view of every decoded data record on the chain.
+
+    Records are kept in chain order together with a (key_field, str(value)) ->
+    positions map over their top-level scalar fields, so keyed reads never scan.
+    Values are compared as strings, like `RecordIndex` does, so an int field matches
+    the str key of a route parameter.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._records = []  # (block_number, tx_index, slot, tx_hash, record)
+        self._block_numbers = []  # block number of each record, for range lookups
+        self._by_key = {}
+        self._last_block = -1
+        self._last_hash = None
+
+    @property
+    def last_block(self) -> int:
+        return self._last_block
+
+    @property
+    def last_hash(self) -> Optional[str]:
+        return self._last_hash
+
+    def _clear(self) -> None:
+        self._records = []
+        self._block_numbers = []
+        self._by_key = {}
+        self._last_block = -1
+        self._last_hash = None
+        self.synced = False
+
+    def _store_block(self, block_number: int, block_hash: str, records: list) -> None:
+        for tx_index, slot, tx_hash, record in records:
+            position = len(self._records)
+            self._records.append((block_number, tx_index, slot, tx_hash, record))
+            self._block_numbers.append(block_number)
+            for key_field, value in record.items():
+                if isinstance(value, (str, int, float)):
+                    self._by_key.setdefault((key_field, str(value)), []).append(
+                        position
+                    )
+        self._last_block = block_number
+        self._last_hash = block_hash
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def all_records(self) -> list:
+        with self._lock:
+            return [record for *_, record in self._records]
+
+    def history(self, key_field: str, key: str) -> list:
+        with self._lock:
+            positions = self._by_key.get((key_field, str(key)), [])
+            return [self._records[position][-1] for position in positions]
+
+    def latest(self, key_field: str, key: str) -> Optional[dict]:
+        with self._lock:
+            positions = self._by_key.get((key_field, str(key)))
+            return self._records[positions[-1]][-1] if positions else None
+
+    def records_between(self, start: int, stop: int) -> list:
+        """(block_number, tx_index, slot, record) for every record in blocks [start, stop)."""
+        with self._lock:
+            first = bisect_left(self._block_numbers, start)
+            last = bisect_left(self._block_numbers, stop)
+            return [
+                (b, t, slot, record)
+                for b, t, slot, _, record in self._records[first:last]
+            ]
+
+    def history_between(self, key_field: str, key: str, start: int, stop: int) -> list:
+        """(block_number, tx_index, slot, record) for the key's records in [start, stop)."""
+        with self._lock:
+            return [
+                (b, t, slot, record)
+                for b, t, slot, _, record in (
+                    self._records[position]
+                    for position in self._by_key.get((key_field, str(key)), [])
+                )
+                if start <= b < stop
+            ]
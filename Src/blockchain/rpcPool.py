@@ -0,0 +1,343 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+from aiohttp import ClientError, ClientTimeout
+from web3 import AsyncHTTPProvider, HTTPProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+# Calls that depend on state local to one node (its unlocked accounts, its
+# transaction pool) always go to the primary endpoint
+PRIMARY_METHODS = {
+    "eth_accounts",
+    "eth_coinbase",
+    "eth_sendTransaction",
+    "eth_sendRawTransaction",
+    "eth_sign",
+    "eth_signTransaction",
+    "eth_signTypedData",
+    "personal_sign",
+}
+# Transport failures that make a read move on to the next endpoint
+FAILOVER_ERRORS = (OSError, ClientError)
+# Reads a node answers with null until it has seen the block or transaction; a
+# lagging node does so for blocks another node already has, so they move on too
+NULL_FAILOVER_METHODS = {
+    "eth_getBlockByHash",
+    "eth_getBlockByNumber",
+    "eth_getBlockTransactionCountByNumber",
+    "eth_getTransactionByBlockNumberAndIndex",
+    "eth_getTransactionByHash",
+}
+
+UP, LAGGING, DOWN, FOREIGN = "up", "lagging", "down", "foreign"
+
+
+class RpcEndpointPool:
+    """
+    Health and latency of a set of JSON-RPC endpoints serving the same chain.
+
+    The first endpoint is the primary: writes and calls on node-local state are sent
+    there only. Reads go to the healthy endpoint with the lowest rolling latency and
+    move on to the next one when a request fails or a block or transaction read
+    comes back null, so a head read on one node and block reads on another agree.
+    Block reads by number try the nodes whose last checked head has the block first.
+    A background thread checks every endpoint each `check_interval` seconds: nodes
+    more than `max_lag` blocks behind are only used when no other node answers, and
+    nodes on another chain (a different genesis block) are never used.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        timeout: float = 10.0,
+        latency_window: int = 20,
+        max_lag: int = 2,
+        check_interval: float = 5.0,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("At least one RPC endpoint is required")
+        self.endpoints = list(endpoints)
+        self.primary = self.endpoints[0]
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._state = {
+            endpoint: {
+                "status": UP,
+                "latencies": deque(maxlen=latency_window),
+                "head": None,
+                "genesis": None,
+                "requests": 0,
+                "failures": 0,
+                "error": None,
+            }
+            for endpoint in self.endpoints
+        }
+        self._checkers = {
+            endpoint: HTTPProvider(
+                endpoint,
+                request_kwargs={"timeout": timeout},
+                exception_retry_configuration=None,
+            )
+            for endpoint in self.endpoints
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            state = self._state[endpoint]
+            state["requests"] += 1
+            state["latencies"].append(seconds)
+            if state["status"] == DOWN:
+                state["status"] = UP
+
+    def fail(self, endpoint: str, error: Exception) -> None:
+        with self._lock:
+            state = self._state[endpoint]
+            state["requests"] += 1
+            state["failures"] += 1
+            state["error"] = str(error)
+            if state["status"] != FOREIGN:
+                state["status"] = DOWN
+
+    def latency(self, endpoint: str) -> float:
+        """Mean of the recent request times; untried endpoints count as fastest."""
+        latencies = self._state[endpoint]["latencies"]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def route(self, primary_only: bool, block: Optional[int] = None) -> List[str]:
+        """Endpoints to try for a request, in order; `block` is the newest one read."""
+        if primary_only:
+            return [self.primary]
+        with self._lock:
+            rank = {UP: 0, LAGGING: 1, DOWN: 2}
+            usable = [
+                endpoint
+                for endpoint in self.endpoints
+                if self._state[endpoint]["status"] != FOREIGN
+            ]
+            return sorted(
+                usable,
+                key=lambda endpoint: (
+                    block is not None
+                    and self._state[endpoint]["head"] is not None
+                    and self._state[endpoint]["head"] < block,
+                    rank[self._state[endpoint]["status"]],
+                    self.latency(endpoint),
+                ),
+            )
+
+    @staticmethod
+    def is_primary_only(method: str, params: object) -> bool:
+        return method in PRIMARY_METHODS or (
+            isinstance(params, (list, tuple)) and "pending" in params
+        )
+
+    @staticmethod
+    def requested_block(requests: list) -> Optional[int]:
+        """Newest block number read by (method, params) requests, if any."""
+        blocks = [
+            int(params[0], 16)
+            for method, params in requests
+            if method in NULL_FAILOVER_METHODS
+            and method.endswith(("ByNumber", "ByBlockNumberAndIndex"))
+            and str(params[0]).startswith("0x")  # Not "latest" or "pending"
+        ]
+        return max(blocks, default=None)
+
+    @staticmethod
+    def is_missing(requests: list, response: object) -> bool:
+        """Whether a block or transaction read of `requests` came back null."""
+        responses = response if isinstance(response, list) else [response]
+        return any(
+            method in NULL_FAILOVER_METHODS
+            and isinstance(answer, dict)
+            and "result" in answer
+            and answer["result"] is None
+            for (method, _), answer in zip(requests, responses)
+        )
+
+    def _probe(self, endpoint: str) -> None:
+        """Measure one endpoint: its head, its genesis block and the round trip."""
+        state = self._state[endpoint]
+        checker = self._checkers[endpoint]
+        started = time.monotonic()
+        try:
+            head = int(checker.make_request("eth_blockNumber", [])["result"], 16)
+            if state["genesis"] is None:
+                genesis = checker.make_request("eth_getBlockByNumber", ["0x0", False])
+                state["genesis"] = genesis["result"]["hash"]
+        except Exception as e:
+            self.fail(endpoint, e)
+            return
+        self.record(endpoint, time.monotonic() - started)
+        with self._lock:
+            state["head"] = head
+
+    def check(self) -> None:
+        """Run one round of health checks over every endpoint."""
+        for endpoint in self.endpoints:
+            self._probe(endpoint)
+        with self._lock:
+            reference = self._state[self.primary]["genesis"]
+            heads = [
+                state["head"]
+                for state in self._state.values()
+                if state["status"] != DOWN
+                and state["head"] is not None
+                and state["genesis"] == reference
+            ]
+            best = max(heads, default=None)
+            for state in self._state.values():
+                if state["status"] == DOWN:
+                    continue
+                if reference is not None and state["genesis"] != reference:
+                    state["status"] = FOREIGN
+                elif best is not None and state["head"] < best - self.max_lag:
+                    state["status"] = LAGGING
+                else:
+                    state["status"] = UP
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:  # pragma: no cover
+                print(f"RPC health check failed: {e}")
+
+    def start(self) -> None:
+        """Check every endpoint once, then keep checking in the background."""
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.check_interval)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                endpoint: {
+                    "status": state["status"],
+                    "primary": endpoint == self.primary,
+                    "latency_ms": round(self.latency(endpoint) * 1000, 2),
+                    "head": state["head"],
+                    "requests": state["requests"],
+                    "failures": state["failures"],
+                    "last_error": state["error"],
+                }
+                for endpoint, state in self._state.items()
+            }
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """HTTP provider spreading requests over the endpoints of an `RpcEndpointPool`."""
+
+    def __init__(self, pool: RpcEndpointPool, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.pool = pool
+        self._providers = {
+            endpoint: HTTPProvider(
+                endpoint,
+                request_kwargs={"timeout": pool.timeout},
+                exception_retry_configuration=None,
+            )
+            for endpoint in pool.endpoints
+        }
+
+    def _send(self, requests: list, send: Callable) -> object:
+        primary_only = any(self.pool.is_primary_only(*request) for request in requests)
+        error, missing = None, None
+        for endpoint in self.pool.route(
+            primary_only, self.pool.requested_block(requests)
+        ):
+            started = time.monotonic()
+            try:
+                response = send(self._providers[endpoint])
+            except FAILOVER_ERRORS as e:
+                self.pool.fail(endpoint, e)
+                error = e
+                continue
+            self.pool.record(endpoint, time.monotonic() - started)
+            if self.pool.is_missing(requests, response):
+                missing = response  # This node may not have the block yet
+                continue
+            return response
+        if missing is not None:
+            return missing
+        raise error
+
+    def make_request(self, method: RPCEndpoint, params: object) -> RPCResponse:
+        return self._send(
+            [(method, params)], lambda provider: provider.make_request(method, params)
+        )
+
+    def make_batch_request(self, requests: list) -> object:
+        return self._send(
+            requests, lambda provider: provider.make_batch_request(requests)
+        )
+
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    """Async counterpart of `PooledHTTPProvider`."""
+
+    def __init__(self, pool: RpcEndpointPool, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.pool = pool
+        self._providers = {
+            endpoint: AsyncHTTPProvider(
+                endpoint,
+                request_kwargs={"timeout": ClientTimeout(total=pool.timeout)},
+                exception_retry_configuration=None,
+            )
+            for endpoint in pool.endpoints
+        }
+
+    async def _send(self, requests: list, send: Callable) -> object:
+        primary_only = any(self.pool.is_primary_only(*request) for request in requests)
+        error, missing = None, None
+        for endpoint in self.pool.route(
+            primary_only, self.pool.requested_block(requests)
+        ):
+            started = time.monotonic()
+            try:
+                response = await send(self._providers[endpoint])
+            except FAILOVER_ERRORS as e:
+                self.pool.fail(endpoint, e)
+                error = e
+                continue
+            self.pool.record(endpoint, time.monotonic() - started)
+            if self.pool.is_missing(requests, response):
+                missing = response  # This node may not have the block yet
+                continue
+            return response
+        if missing is not None:
+            return missing
+        raise error
+
+    async def make_request(self, method: RPCEndpoint, params: object) -> RPCResponse:
+        return await self._send(
+            [(method, params)], lambda provider: provider.make_request(method, params)
+        )
+
+    async def make_batch_request(self, requests: list) -> object:
+        return await self._send(
+            requests, lambda provider: provider.make_batch_request(requests)
+        )
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        try:
+            response = await self.make_request("web3_clientVersion", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+        return "result" in response
@@ -0,0 +1,328 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+from itertools import groupby
+from typing import Iterator, Optional, Tuple
+from web3 import Web3
+
+from .chainSink import ChainSink
+from .keyFilters import _element, key_matches
+from .recordCodec import available_codecs, decode_record, encode_record
+from .recordIndex import DEFAULT_INDEX_FIELDS
+
+SEGMENT_MAGIC = b"RSEG"
+# Bumped whenever the file layout changes; segments of other formats are deleted
+SEGMENT_FORMAT = 1
+# Blocks covered by one segment file
+SEGMENT_BLOCKS = 1000
+SEGMENT_CODEC = "msgpack" if "msgpack" in available_codecs() else "json"
+
+_HEADER = struct.Struct(">4sB")  # magic, format
+_ENTRY = struct.Struct(">QII32sI")  # block, tx_index, slot, tx_hash, record length
+_KEY = struct.Struct(">8sQ")  # key digest, entry offset; sorted by digest
+# first block, last block, last block hash, entry count, key count, footer offset,
+# crc32 of everything before the trailer, magic
+_TRAILER = struct.Struct(">QQ32sIIQI4s")
+
+
+def _digest(key_field: str, key: object) -> bytes:
+    return hashlib.blake2b(_element(key_field, key).encode(), digest_size=8).digest()
+
+
+class _Segment:
+    """A sealed, read-only segment file mapped into memory."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except Exception:
+            self._map.close()
+            raise
+
+    def _parse(self) -> None:
+        size = len(self._map)
+        if size < _HEADER.size + _TRAILER.size:
+            raise ValueError("Truncated segment")
+        magic, version = _HEADER.unpack_from(self._map)
+        (
+            self.first_block,
+            self.last_block,
+            last_hash,
+            self.entry_count,
+            self._key_count,
+            self._footer,
+            crc,
+            end_magic,
+        ) = _TRAILER.unpack_from(self._map, size - _TRAILER.size)
+        if SEGMENT_MAGIC != magic or SEGMENT_MAGIC != end_magic:
+            raise ValueError("Not a record segment")
+        if version != SEGMENT_FORMAT:
+            raise ValueError(f"Unsupported segment format {version}")
+        if zlib.crc32(self._map[: size - _TRAILER.size]) != crc:
+            raise ValueError("Segment checksum mismatch")
+        self.last_hash = Web3.to_hex(last_hash)
+        self.size = size
+
+    def _entry(self, offset: int) -> tuple:
+        """Return the entry at `offset` and the offset of the next one."""
+        block_number, tx_index, slot, tx_hash, length = _ENTRY.unpack_from(
+            self._map, offset
+        )
+        start = offset + _ENTRY.size
+        record = decode_record(self._map[start : start + length])
+        return (block_number, tx_index, slot, Web3.to_hex(tx_hash), record), (
+            start + length
+        )
+
+    def entries(self) -> Iterator[tuple]:
+        """(block_number, tx_index, slot, tx_hash, record) in chain order."""
+        offset = _HEADER.size
+        while offset < self._footer:
+            entry, offset = self._entry(offset)
+            yield entry
+
+    def find(self, digest: bytes) -> list:
+        """Entries whose key digest is `digest`, by binary search of the footer."""
+        low, high = 0, self._key_count
+        while low < high:
+            middle = (low + high) // 2
+            found, _ = _KEY.unpack_from(self._map, self._footer + middle * _KEY.size)
+            if found < digest:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for position in range(low, self._key_count):
+            found, offset = _KEY.unpack_from(
+                self._map, self._footer + position * _KEY.size
+            )
+            if found != digest:
+                break
+            entries.append(self._entry(offset)[0])
+        return entries
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class RecordSegmentStore(ChainSink):
+    """
+    Append-only files of the decoded records of the chain, one per `segment_blocks`
+    blocks, so a restarted process gets the chain back without reading it again.
+
+    Blocks are buffered until a segment's range is complete, then written to
+    `<first block>.seg` in `path` with an fsync before it is renamed into place.
+    Segments are memory-mapped for reads; their footer maps key digests of
+    `key_fields` to entries, so `lookup` reads only the matching records. Blocks in
+    the unsealed tail are lost on restart and read from the node again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_blocks: int = SEGMENT_BLOCKS,
+        key_fields: Tuple[str, ...] = DEFAULT_INDEX_FIELDS,
+        codec: str = SEGMENT_CODEC,
+    ) -> None:
+        super().__init__()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_blocks = segment_blocks
+        self.key_fields = tuple(key_fields)
+        self.codec = codec
+        self._segments = []
+        self._tail = []  # (block_number, records) of blocks not sealed yet
+        self._tail_first = None
+        self._last_block = -1
+        self._last_hash = None
+        self._open_segments()
+
+    def _open_segments(self) -> None:
+        """Map the sealed segments, deleting any that do not continue the previous one."""
+        names = sorted(os.listdir(self.path))
+        for name in names:
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.path, name))
+        expected = 0
+        for position, name in enumerate(n for n in names if n.endswith(".seg")):
+            file_path = os.path.join(self.path, name)
+            try:
+                segment = _Segment(file_path)
+                if segment.first_block != expected:
+                    segment.close()
+                    raise ValueError(f"Segment does not start at block {expected}")
+            except Exception as e:
+                print(f"Dropping record segments from {name}: {e}")
+                for stale in [n for n in names if n.endswith(".seg")][position:]:
+                    os.remove(os.path.join(self.path, stale))
+                break
+            self._segments.append(segment)
+            expected = segment.last_block + 1
+        if self._segments:
+            self._last_block = self._segments[-1].last_block
+            self._last_hash = self._segments[-1].last_hash
+
+    @property
+    def last_block(self) -> int:
+        return self._last_block
+
+    @property
+    def last_hash(self) -> Optional[str]:
+        return self._last_hash
+
+    @property
+    def sealed_block(self) -> int:
+        """Last block stored in a segment file, or -1."""
+        return self._segments[-1].last_block if self._segments else -1
+
+    def covers(self, key_field: str) -> bool:
+        return key_field in self.key_fields
+
+    def _store_block(self, block_number: int, block_hash: str, records: list) -> None:
+        if self._tail_first is None:
+            self._tail_first = block_number
+        if records:
+            self._tail.append((block_number, records))
+        self._last_block, self._last_hash = block_number, block_hash
+        if block_number + 1 - self._tail_first >= self.segment_blocks:
+            self._seal()
+
+    def _seal(self) -> None:
+        """Write the buffered blocks to a new segment file."""
+        if self._tail_first is None:
+            return
+        body = bytearray(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_FORMAT))
+        keys = []
+        entry_count = 0
+        for block_number, records in self._tail:
+            for tx_index, slot, tx_hash, record in records:
+                keys.extend(
+                    (_digest(key_field, record[key_field]), len(body))
+                    for key_field in self.key_fields
+                    if record.get(key_field) is not None
+                )
+                payload = encode_record(record, self.codec)
+                body += _ENTRY.pack(
+                    block_number,
+                    tx_index,
+                    slot,
+                    Web3.to_bytes(hexstr=tx_hash),
+                    len(payload),
+                )
+                body += payload
+                entry_count += 1
+        footer = len(body)
+        for digest, offset in sorted(keys):
+            body += _KEY.pack(digest, offset)
+        body += _TRAILER.pack(
+            self._tail_first,
+            self._last_block,
+            Web3.to_bytes(hexstr=self._last_hash),
+            entry_count,
+            len(keys),
+            footer,
+            zlib.crc32(body),
+            SEGMENT_MAGIC,
+        )
+
+        file_path = os.path.join(self.path, f"{self._tail_first:012d}.seg")
+        # Write then rename, so a crash never leaves a partial segment behind
+        with open(f"{file_path}.tmp", "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{file_path}.tmp", file_path)
+        directory = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+        self._segments.append(_Segment(file_path))
+        self._tail = []
+        self._tail_first = None
+
+    def flush(self) -> None:
+        """Seal the buffered blocks now (e.g. at shutdown) instead of on a full segment."""
+        with self._lock:
+            self._seal()
+
+    def _clear(self) -> None:
+        for segment in self._segments:
+            segment.close()
+            os.remove(segment.path)
+        self._segments = []
+        self._tail = []
+        self._tail_first = None
+        self._last_block = -1
+        self._last_hash = None
+        self.synced = False
+
+    def _entries(self) -> Iterator[tuple]:
+        with self._lock:
+            segments = list(self._segments)
+            tail = list(self._tail)
+        for segment in segments:
+            yield from segment.entries()
+        for block_number, records in tail:
+            for tx_index, slot, tx_hash, record in records:
+                yield block_number, tx_index, slot, tx_hash, record
+
+    def blocks(self) -> Iterator[tuple]:
+        """(block_number, [(tx_index, slot, tx_hash, record), ...]) of stored blocks with records."""
+        for block_number, entries in groupby(self._entries(), key=lambda e: e[0]):
+            yield block_number, [tuple(entry[1:]) for entry in entries]
+
+    def restore(self, sink: ChainSink) -> int:
+        """
+        Load everything stored into an empty `sink` (e.g. a fresh `RecordView`), which
+        then only has to sync the blocks after `last_block`. Returns the records loaded.
+        """
+        return sink.load_blocks(self.blocks(), self.last_block, self.last_hash)
+
+    def lookup(self, key_field: str, key: str) -> list:
+        """(block_number, tx_index, slot, record) of every stored record with `key`."""
+        digest = _digest(key_field, key)
+        with self._lock:
+            segments = list(self._segments)
+            tail = list(self._tail)
+        entries = [entry for segment in segments for entry in segment.find(digest)]
+        entries += [
+            (block_number, tx_index, slot, tx_hash, record)
+            for block_number, records in tail
+            for tx_index, slot, tx_hash, record in records
+        ]
+        return sorted(
+            (
+                (block_number, tx_index, slot, record)
+                for block_number, tx_index, slot, _, record in entries
+                if key_matches(record, key_field, key)
+            ),
+            key=lambda entry: entry[:3],
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "sealed_block": self.sealed_block,
+                "last_block": self._last_block,
+                "entries": sum(segment.entry_count for segment in self._segments),
+                "bytes": sum(segment.size for segment in self._segments),
+                "tail_blocks": (
+                    0
+                    if self._tail_first is None
+                    else self._last_block + 1 - self._tail_first
+                ),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
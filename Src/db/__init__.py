@@ -1,11 +1,19 @@
-from .getSpecificData import get_specific_data_logic
-from .getAllData import get_all_data_logic
-from .updateRecord import update_record_logic
-from .deleteRecord import delete_record_db_logic
+from .getSpecificData import get_specific_data_logic_async
+from .getAllData import get_all_data_logic_async, iter_all_data_async
+from .updateRecord import (
+    RecordUpdate,
+    update_record_logic_async,
+    update_records_logic_async,
+)
+from .deleteRecord import delete_record_db_logic_async, delete_records_db_logic_async
 
 __all__ = [
-    "update_record_logic",
-    "get_specific_data_logic",
-    "get_all_data_logic",
-    "delete_record_db_logic",
+    "update_record_logic_async",
+    "update_records_logic_async",
+    "RecordUpdate",
+    "get_specific_data_logic_async",
+    "get_all_data_logic_async",
+    "iter_all_data_async",
+    "delete_record_db_logic_async",
+    "delete_records_db_logic_async",
 ]
@@ -1,22 +1,61 @@
 from fastapi import HTTPException
-import psycopg2
+from psycopg_pool import PoolTimeout
+from typing import AsyncContextManager, Callable, List
+from .statements import check_column, delete_by_key, delete_by_keys
+import psycopg
 
 
-def delete_record_db_logic(
-    get_db_connection: psycopg2._psycopg.connection, key: str, key_field: str = "vin"
+async def delete_record_db_logic_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
+    key: str,
+    key_field: str = "vin",
 ) -> dict:
-    if key_field is None:  # pragma: no cover
-        key_field = "vin"
     """Delete a record from the database."""
+    delete_query = delete_by_key(check_column(key_field))
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                delete_query = f"DELETE FROM vehicles WHERE {key_field} = '{key}'"
-
-                # Execute the DELETE query
-                cur.execute(delete_query)
-                conn.commit()
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(delete_query, (key,), prepare=True)
+                await conn.commit()
 
                 return {"message": "Record deleted successfully"}
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting record: {e}")
+
+
+def _delete_result(keys: List[str], deleted: list) -> dict:
+    found = set(deleted)
+    return {
+        "message": f"{len(deleted)} records deleted successfully",
+        "deleted": len(deleted),
+        "missing": [key for key in dict.fromkeys(keys) if key not in found],
+    }
+
+
+async def delete_records_db_logic_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
+    keys: List[str],
+    key_field: str = "vin",
+) -> dict:
+    """
+    Delete the records with any of `keys` with a single `= ANY(...)` statement.
+
+    Returns:
+        dict: the number of records deleted and the keys that matched no record.
+    """
+    if not keys:
+        raise HTTPException(status_code=400, detail="Keys to delete cannot be empty")
+    delete_query = delete_by_keys(check_column(key_field))
+    try:
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(delete_query, (list(keys),), prepare=True)
+                deleted = [row[0] for row in await cur.fetchall()]
+                await conn.commit()
+                return _delete_result(keys, deleted)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting records: {e}")
@@ -1,15 +1,71 @@
 from fastapi import HTTPException
-from psycopg2.extras import RealDictCursor
-import psycopg2
+from psycopg.rows import dict_row
+from psycopg_pool import PoolTimeout
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional, Union
+import psycopg
 
+# Rows fetched per round trip by the server-side cursor of `iter_all_data_async`
+FETCH_BATCH_SIZE = 1000
 
-def get_all_data_logic(get_db_connection: psycopg2._psycopg.connection) -> dict:
-    """Retrieve data from the database."""
+
+def _vehicles_query(after_vin: Optional[str], limit: Optional[int]) -> tuple:
+    """
+    SELECT of the vehicles after `after_vin`, up to `limit`. Pages are keyed on vin,
+    so only paginated queries pay for the ORDER BY.
+    """
+    query, params = "SELECT * FROM vehicles", []
+    if after_vin is not None:
+        query += " WHERE vin > %s"
+        params.append(after_vin)
+    if after_vin is not None or limit is not None:
+        query += " ORDER BY vin"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, params
+
+
+async def iter_all_data_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
+    after_vin: Optional[str] = None,
+    limit: Optional[int] = None,
+    batch_size: int = FETCH_BATCH_SIZE,
+) -> AsyncIterator[dict]:
+    """
+    Yield the vehicles through a named (server-side) cursor, `batch_size` rows per
+    round trip, so at most one batch is held in memory whatever the table size.
+    """
+    async with get_db_connection() as conn:
+        async with conn.cursor(name="vehicles_stream", row_factory=dict_row) as cur:
+            query, params = _vehicles_query(after_vin, limit)
+            await cur.execute(query, params)
+            while rows := await cur.fetchmany(batch_size):
+                for row in rows:
+                    yield row
+
+
+async def get_all_data_logic_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
+    after_vin: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> Union[list, dict]:
+    """
+    Retrieve the vehicles from the database, on an async psycopg pool.
+
+    With `limit` or `after_vin` a page is returned instead of a list:
+    {"data": [...], "next_after_vin": ...}; pass `next_after_vin` back as `after_vin`
+    to continue.
+    """
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = "SELECT * FROM vehicles;"
-                cur.execute(query)
-                return cur.fetchall()
+        rows = [
+            row
+            async for row in iter_all_data_async(get_db_connection, after_vin, limit)
+        ]
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {e}")
+    if after_vin is None and limit is None:
+        return rows
+    full = limit is not None and len(rows) == limit
+    return {"data": rows, "next_after_vin": rows[-1]["vin"] if full else None}
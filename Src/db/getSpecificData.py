@@ -1,24 +1,28 @@
 from fastapi import HTTPException
-from typing import Optional, List
-from psycopg2.extras import RealDictCursor
-import psycopg2
+from typing import AsyncContextManager, Callable, Optional, List
+from psycopg.rows import dict_row
+from psycopg_pool import PoolTimeout
+from .statements import check_column, check_columns, select_by_key
+import psycopg
 
 
-def get_specific_data_logic(
-    get_db_connection: psycopg2._psycopg.connection,
+async def get_specific_data_logic_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
     key: str,
     key_field: str = "vin",
     params: Optional[List[str]] = None,
 ) -> dict:
-    """Retrieve data from the database."""
-    if key_field is None:  # pragma: no cover
-        key_field = "vin"
+    """
+    Retrieve the rows whose `key_field` is `key`, with only the `params` columns when
+    given.
+    """
+    query = select_by_key(check_column(key_field), check_columns(params))
     try:
-        with get_db_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"SELECT * FROM vehicles WHERE {key_field} = '{key}'"
-                cur.execute(query, params or ())
-                result = cur.fetchall()
-                return result
+        async with get_db_connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(query, (key,), prepare=True)
+                return await cur.fetchall()
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving data: {e}")
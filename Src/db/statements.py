@@ -0,0 +1,89 @@
+from fastapi import HTTPException
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+# Columns of the vehicles table (ETL/insert_db.py), including the unnested
+# full_vehicleInfo fields, with the types the ETL gives them; key fields and updated
+# columns must be one of them
+VEHICLE_COLUMNS = {
+    "vin": "text",
+    "license_plate": "text",
+    "vehicle_make": "text",
+    "vehicle_model": "text",
+    "vehicle_year": "bigint",
+    "vehicle_category": "text",
+    "vehicle_make_model": "text",
+    "vehicle_year_make_model": "text",
+    "vehicle_year_make_model_cat": "text",
+    "year": "bigint",
+    "make": "text",
+    "model": "text",
+    "category": "text",
+}
+
+
+def check_column(column: Optional[str], default: str = "vin") -> str:
+    """Return `column` as the table names it, or raise a 400 for unknown columns."""
+    if column is None:
+        return default
+    name = column.lower()  # Unquoted identifiers are case-insensitive in Postgres
+    if name not in VEHICLE_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown column: {column}")
+    return name
+
+
+def check_columns(columns: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    return tuple(check_column(column) for column in columns or ())
+
+
+# The SQL of a statement only depends on (operation, key_field, columns), so it is
+# built once; the key and the values are always bound as parameters
+
+
+@lru_cache(maxsize=None)
+def select_by_key(key_field: str, columns: Tuple[str, ...] = ()) -> str:
+    """SELECT of `columns` (every column when empty) of the rows with a key."""
+    projection = ", ".join(columns) if columns else "*"
+    return f"SELECT {projection} FROM vehicles WHERE {key_field} = %s"
+
+
+@lru_cache(maxsize=None)
+def update_by_key(key_field: str, columns: Tuple[str, ...]) -> str:
+    set_clause = ", ".join(f"{column} = %s" for column in columns)
+    return f"UPDATE vehicles SET {set_clause} WHERE {key_field} = %s"
+
+
+@lru_cache(maxsize=None)
+def delete_by_key(key_field: str) -> str:
+    return f"DELETE FROM vehicles WHERE {key_field} = %s"
+
+
+def typed_array(column: str) -> str:
+    """Placeholder of an array parameter cast to the array type of `column`."""
+    return f"%s::{VEHICLE_COLUMNS[column]}[]"
+
+
+@lru_cache(maxsize=None)
+def update_from_values(key_field: str, columns: Tuple[str, ...]) -> str:
+    """
+    UPDATE of many rows from one array parameter per column, the keys first, each
+    cast to its column's type: psycopg sends strings untyped, which Postgres would
+    otherwise read as text. The parameters stay one per column whatever the number
+    of rows. Returns the keys of the updated rows.
+    """
+    set_clause = ", ".join(f"{column} = u.{column}" for column in columns)
+    arrays = ", ".join(typed_array(column) for column in (key_field, *columns))
+    return (
+        f"UPDATE vehicles AS v SET {set_clause} "
+        f"FROM unnest({arrays}) AS u(_key, {', '.join(columns)}) "
+        f"WHERE v.{key_field} = u._key RETURNING v.{key_field}"
+    )
+
+
+@lru_cache(maxsize=None)
+def delete_by_keys(key_field: str) -> str:
+    """DELETE of the rows whose key is in an array parameter; returns their keys."""
+    return (
+        f"DELETE FROM vehicles WHERE {key_field} = ANY({typed_array(key_field)}) "
+        f"RETURNING {key_field}"
+    )
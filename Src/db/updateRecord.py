@@ -1,30 +1,105 @@
 from fastapi import HTTPException
-import json
-import psycopg2
+from psycopg_pool import PoolTimeout
+from pydantic import BaseModel
+from typing import AsyncContextManager, Callable, List
+from .statements import (
+    check_column,
+    check_columns,
+    update_by_key,
+    update_from_values,
+)
+import psycopg
 
 
-def update_record_logic(
+class RecordUpdate(BaseModel):
+    key: str
+    update_values: dict
+
+
+def _update_statements(updates: List[RecordUpdate], key_field: str) -> list:
+    """
+    (query, arrays) per distinct set of updated columns, usually just one: the keys
+    and then each column's values, as strings for the statement to cast. A key
+    updated more than once gets its last values.
+    """
+    if not updates:
+        raise HTTPException(status_code=400, detail="Updates cannot be empty")
+    key_field = check_column(key_field)
+    latest = {update.key: update.update_values for update in updates}
+    groups = {}
+    for key, update_values in latest.items():
+        if not update_values:
+            raise HTTPException(
+                status_code=400, detail=f"Update values cannot be empty (key {key})"
+            )
+        columns = check_columns(update_values)
+        groups.setdefault(columns, []).append((key, *update_values.values()))
+    return [
+        (
+            update_from_values(key_field, columns),
+            [[None if v is None else str(v) for v in values] for values in zip(*rows)],
+        )
+        for columns, rows in groups.items()
+    ]
+
+
+def _update_result(updates: List[RecordUpdate], updated: list) -> dict:
+    found = set(updated)
+    missing = list(dict.fromkeys(u.key for u in updates if u.key not in found))
+    return {
+        "message": f"{len(found)} records updated successfully",
+        "updated": len(found),
+        "missing": missing,
+    }
+
+
+async def update_record_logic_async(
     get_db_connection,
     update_values,
     key,
     key_field,
 ):
     """Update a record in the database."""
-    if key_field is None:  # pragma: no cover
-        key_field = "vin"
+    if not update_values:
+        raise HTTPException(status_code=400, detail="Update values cannot be empty")
+    update_query = update_by_key(check_column(key_field), check_columns(update_values))
+    query_params = (*update_values.values(), key)
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                set_clause = ", ".join([f"{col} = %s" for col in update_values.keys()])
-                query_params = tuple(update_values.values())
-                update_query = (
-                    f"UPDATE vehicles SET {set_clause} WHERE {key_field} = '{key}'"
-                )
-                print(update_query)
-                # Execute the update query
-                cur.execute(update_query, query_params)
-                conn.commit()
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(update_query, query_params, prepare=True)
+                await conn.commit()
 
                 return {"message": "Record updated successfully"}
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating record: {e}")
+
+
+async def update_records_logic_async(
+    get_db_connection: Callable[[], AsyncContextManager[psycopg.AsyncConnection]],
+    updates: List[RecordUpdate],
+    key_field: str = "vin",
+) -> dict:
+    """
+    Update many records in one transaction, each set of updated columns with a single
+    `UPDATE ... FROM unnest(...)` statement.
+
+    Returns:
+        dict: the number of records updated and the keys that matched no record.
+    """
+    statements = _update_statements(updates, key_field)
+    try:
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cur:
+                updated = []
+                for query, arrays in statements:
+                    await cur.execute(query, arrays, prepare=True)
+                    updated += await cur.fetchall()
+                await conn.commit()
+                return _update_result(updates, [row[0] for row in updated])
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=f"Database is busy: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating records: {e}")
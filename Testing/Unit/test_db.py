@@ -1,123 +1,264 @@
+import asyncio
 import pytest
-from unittest.mock import MagicMock
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from unittest.mock import AsyncMock, MagicMock
 from fastapi import HTTPException
+from psycopg_pool import AsyncConnectionPool
 from db import (
-    update_record_logic,
-    get_all_data_logic,
-    get_specific_data_logic,
-    delete_record_db_logic,
+    update_record_logic_async,
+    get_all_data_logic_async,
+    iter_all_data_async,
+    get_specific_data_logic_async,
+    delete_record_db_logic_async,
+    delete_records_db_logic_async,
+    update_records_logic_async,
+    RecordUpdate,
 )
-import json
 
 
 # Common fixtures
-@pytest.fixture
-def mock_cursor() -> MagicMock:
+def async_connection() -> tuple:
+    """A mocked async psycopg connection, its cursor and a pool-like `connection()`."""
     cursor = MagicMock()
-    return cursor
-
-
-@pytest.fixture
-def mock_connection(mock_cursor: MagicMock) -> MagicMock:
-    connection = MagicMock()
-    connection.__enter__.return_value = connection
-    connection.cursor.return_value.__enter__.return_value = mock_cursor
-    return connection
-
-
-@pytest.fixture
-def mock_get_db_connection(mock_connection: MagicMock) -> MagicMock:
-    return MagicMock(return_value=mock_connection)
-
-
-# Tests
-def test_get_all_data_logic_success(
-    mock_get_db_connection: MagicMock, mock_cursor: MagicMock
-) -> None:
-    mock_data = [{"id": 1, "name": "Vehicle1"}, {"id": 2, "name": "Vehicle2"}]
-    mock_cursor.fetchall.return_value = mock_data
-
-    result = get_all_data_logic(mock_get_db_connection)
-
-    assert result == mock_data
-    mock_cursor.execute.assert_called_once_with("SELECT * FROM vehicles;")
-
-
-def test_get_all_data_logic_failure(mock_get_db_connection: MagicMock) -> None:
-    mock_get_db_connection.side_effect = Exception("Database connection error")
-
-    with pytest.raises(HTTPException) as exc_info:
-        get_all_data_logic(mock_get_db_connection)
+    cursor.execute = AsyncMock()
+    cursor.fetchall = AsyncMock()
+    cursor.fetchmany = AsyncMock(return_value=[])
+    conn = MagicMock()
+    conn.commit = AsyncMock()
+    conn.cursor.return_value.__aenter__ = AsyncMock(return_value=cursor)
+    conn.cursor.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    @asynccontextmanager
+    async def connection() -> AsyncIterator[MagicMock]:
+        yield conn
+
+    return conn, cursor, connection
+
+
+def test_keyed_logic_rejects_unknown_columns() -> None:
+    _, cursor, connection = async_connection()
+    calls = [
+        get_specific_data_logic_async(connection, "x", "vin; DROP"),
+        get_specific_data_logic_async(connection, "x", "vin", ["1"]),
+        update_record_logic_async(connection, {"owner": 1}, "x", "vin"),
+        delete_record_db_logic_async(connection, "x", "password"),
+        delete_records_db_logic_async(connection, ["x"], "password"),
+    ]
+    for call in calls:
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(call)
+        assert exc_info.value.status_code == 400
+        assert "Unknown column" in exc_info.value.detail
+    assert not cursor.execute.called
+
+
+def test_get_specific_data_logic_binds_key() -> None:
+    _, cursor, connection = async_connection()
+
+    asyncio.run(
+        get_specific_data_logic_async(
+            connection, "x' OR '1'='1", "License_Plate", ["vin", "Year"]
+        )
+    )
 
-    assert exc_info.value.status_code == 500
-    assert "Error retrieving data" in exc_info.value.detail
+    cursor.execute.assert_awaited_once_with(
+        "SELECT vin, year FROM vehicles WHERE license_plate = %s",
+        ("x' OR '1'='1",),
+        prepare=True,
+    )
 
 
-def test_get_specific_data_logic_success(
-    mock_get_db_connection: MagicMock, mock_cursor: MagicMock
-) -> None:
+def test_async_logic_queries() -> None:
+    conn, cursor, connection = async_connection()
     mock_data = [{"id": 1, "vin": "VIN123", "name": "Vehicle1"}]
-    mock_cursor.fetchall.return_value = mock_data
+    cursor.fetchall.return_value = mock_data
 
-    result = get_specific_data_logic(mock_get_db_connection, "VIN123", "vin")
-
-    assert result == mock_data
-    mock_cursor.execute.assert_called_once_with(
-        "SELECT * FROM vehicles WHERE vin = 'VIN123'", ()
+    assert (
+        asyncio.run(get_specific_data_logic_async(connection, "VIN123", "vin"))
+        == mock_data
+    )
+    cursor.execute.assert_awaited_with(
+        "SELECT * FROM vehicles WHERE vin = %s", ("VIN123",), prepare=True
     )
 
-
-def test_get_specific_data_logic_failure(mock_get_db_connection: MagicMock) -> None:
-    mock_get_db_connection.side_effect = Exception("Database error")
-
-    with pytest.raises(HTTPException) as exc_info:
-        get_specific_data_logic(mock_get_db_connection, "VIN123", "vin")
-
-    assert exc_info.value.status_code == 500
-    assert "Error retrieving data" in exc_info.value.detail
-
-
-def test_update_record_logic_success(
-    mock_get_db_connection: MagicMock, mock_cursor: MagicMock
-) -> None:
-    update_values = {"name": "Updated Vehicle", "status": "Active"}
-
-    result = update_record_logic(mock_get_db_connection, update_values, "VIN123", "vin")
-
-    expected_query = "UPDATE vehicles SET name = %s, status = %s WHERE vin = 'VIN123'"
-    mock_cursor.execute.assert_called_once_with(
-        expected_query, ("Updated Vehicle", "Active")
+    result = asyncio.run(
+        update_record_logic_async(connection, {"make": "Ford"}, "VIN123", "vin")
     )
     assert result == {"message": "Record updated successfully"}
+    cursor.execute.assert_awaited_with(
+        "UPDATE vehicles SET make = %s WHERE vin = %s", ("Ford", "VIN123"), prepare=True
+    )
+    result = asyncio.run(delete_record_db_logic_async(connection, "VIN123", "vin"))
+    assert result == {"message": "Record deleted successfully"}
+    cursor.execute.assert_awaited_with(
+        "DELETE FROM vehicles WHERE vin = %s", ("VIN123",), prepare=True
+    )
+    assert conn.commit.await_count == 2
 
 
-def test_update_record_logic_failure(mock_get_db_connection: MagicMock) -> None:
-    mock_get_db_connection.side_effect = Exception("Database error")
+def test_async_bulk_logic() -> None:
+    conn, cursor, connection = async_connection()
+    cursor.fetchall.return_value = [("VIN1",), ("VIN2",)]
+    updates = [
+        RecordUpdate(key="VIN1", update_values={"vehicle_model": "A"}),
+        RecordUpdate(key="VIN2", update_values={"vehicle_model": "B"}),
+    ]
 
-    update_values = json.dumps({"name": "Updated Vehicle", "status": "Active"})
+    result = asyncio.run(update_records_logic_async(connection, updates, None))
 
+    cursor.execute.assert_awaited_once_with(
+        "UPDATE vehicles AS v SET vehicle_model = u.vehicle_model "
+        "FROM unnest(%s::text[], %s::text[]) AS u(_key, vehicle_model) "
+        "WHERE v.vin = u._key RETURNING v.vin",
+        [["VIN1", "VIN2"], ["A", "B"]],
+        prepare=True,
+    )
+    assert result["updated"] == 2 and result["missing"] == []
+
+    result = asyncio.run(
+        delete_records_db_logic_async(connection, ["VIN1", "VIN2", "VIN3"])
+    )
+    cursor.execute.assert_awaited_with(
+        "DELETE FROM vehicles WHERE vin = ANY(%s::text[]) RETURNING vin",
+        (["VIN1", "VIN2", "VIN3"],),
+        prepare=True,
+    )
+    assert result["deleted"] == 2 and result["missing"] == ["VIN3"]
+    assert conn.commit.await_count == 2
+
+
+def test_update_records_logic_groups_columns() -> None:
+    conn, cursor, connection = async_connection()
+    cursor.fetchall.side_effect = [[("VIN1",), ("VIN2",)], [("VIN3",)]]
+    updates = [
+        RecordUpdate(key="VIN1", update_values={"vehicle_model": "A"}),
+        RecordUpdate(key="VIN2", update_values={"vehicle_model": "B"}),
+        RecordUpdate(key="VIN1", update_values={"vehicle_model": "C"}),
+        RecordUpdate(key="VIN3", update_values={"vehicle_year": 2020}),
+        RecordUpdate(key="VIN9", update_values={"vehicle_model": "D"}),
+    ]
+
+    result = asyncio.run(update_records_logic_async(connection, updates, "vin"))
+
+    # One statement per set of columns, in one transaction; VIN1 gets its last values
+    first, second = cursor.execute.await_args_list
+    assert first.args[1] == [["VIN1", "VIN2", "VIN9"], ["C", "B", "D"]]
+    assert second.args[1] == [["VIN3"], ["2020"]]
+    assert conn.commit.await_count == 1
+    assert result == {
+        "message": "3 records updated successfully",
+        "updated": 3,
+        "missing": ["VIN9"],
+    }
+
+    for updates in ([], [RecordUpdate(key="VIN1", update_values={})]):
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(update_records_logic_async(connection, updates, "vin"))
+        assert exc_info.value.status_code == 400
     with pytest.raises(HTTPException) as exc_info:
-        update_record_logic(mock_get_db_connection, update_values, "VIN123", "vin")
+        asyncio.run(delete_records_db_logic_async(connection, [], "vin"))
+    assert exc_info.value.status_code == 400
+
+
+def test_bulk_logic_casts_to_column_types() -> None:
+    _, cursor, connection = async_connection()
+    cursor.fetchall.return_value = []
+    updates = [
+        RecordUpdate(key="2019", update_values={"year": "2020", "make": None}),
+        RecordUpdate(key="2021", update_values={"year": 2022, "make": None}),
+    ]
+
+    # Strings are sent untyped, so every array is cast to its column's type
+    asyncio.run(update_records_logic_async(connection, updates, "vehicle_year"))
+    cursor.execute.assert_awaited_once_with(
+        "UPDATE vehicles AS v SET year = u.year, make = u.make "
+        "FROM unnest(%s::bigint[], %s::bigint[], %s::text[]) AS u(_key, year, make) "
+        "WHERE v.vehicle_year = u._key RETURNING v.vehicle_year",
+        [["2019", "2021"], ["2020", "2022"], [None, None]],
+        prepare=True,
+    )
 
-    assert exc_info.value.status_code == 500
-    assert "Error updating record" in exc_info.value.detail
+    asyncio.run(delete_records_db_logic_async(connection, ["2019"], "Year"))
+    cursor.execute.assert_awaited_with(
+        "DELETE FROM vehicles WHERE year = ANY(%s::bigint[]) RETURNING year",
+        (["2019"],),
+        prepare=True,
+    )
 
 
-def test_delete_record_db_logic_success(
-    mock_get_db_connection: MagicMock, mock_cursor: MagicMock
-) -> None:
-    result = delete_record_db_logic(mock_get_db_connection, "VIN123", "vin")
+def test_async_get_all_data_streams_pages() -> None:
+    conn, cursor, connection = async_connection()
+    rows = [{"vin": f"VIN{n}"} for n in range(5)]
+    cursor.fetchmany.side_effect = [rows[:2], rows[2:4], rows[4:], []]
 
-    expected_query = "DELETE FROM vehicles WHERE vin = 'VIN123'"
-    mock_cursor.execute.assert_called_once_with(expected_query)
-    assert result == {"message": "Record deleted successfully"}
+    # The whole table is read from a named cursor in batches, unordered
+    assert asyncio.run(get_all_data_logic_async(connection)) == rows
+    assert conn.cursor.call_args.kwargs["name"]
+    cursor.execute.assert_awaited_with("SELECT * FROM vehicles", [])
+    assert cursor.fetchmany.await_count == 4
 
+    cursor.fetchmany.side_effect = [rows[2:4], []]
+    page = asyncio.run(get_all_data_logic_async(connection, "VIN1", 2))
+    assert page == {"data": rows[2:4], "next_after_vin": "VIN3"}
+    cursor.execute.assert_awaited_with(
+        "SELECT * FROM vehicles WHERE vin > %s ORDER BY vin LIMIT %s", ["VIN1", 2]
+    )
 
-def test_delete_record_db_logic_failure(mock_get_db_connection: MagicMock) -> None:
-    mock_get_db_connection.side_effect = Exception("Database error")
+    # A short page is the last one
+    cursor.fetchmany.side_effect = [rows[4:], []]
+    page = asyncio.run(get_all_data_logic_async(connection, "VIN3", 2))
+    assert page == {"data": rows[4:], "next_after_vin": None}
+
+    async def collect() -> list:
+        return [
+            row async for row in iter_all_data_async(connection, limit=3, batch_size=2)
+        ]
+
+    cursor.fetchmany.side_effect = [rows[:2], rows[2:3], []]
+    assert asyncio.run(collect()) == rows[:3]
+    cursor.fetchmany.assert_awaited_with(2)
+
+
+def test_async_logic_failure() -> None:
+    _, cursor, connection = async_connection()
+    cursor.execute.side_effect = Exception("Database error")
+    calls = [
+        (get_all_data_logic_async(connection), "Error retrieving data"),
+        (get_specific_data_logic_async(connection, "VIN123"), "Error retrieving data"),
+        (
+            update_record_logic_async(connection, {"make": "Ford"}, "VIN123", "vin"),
+            "Error updating record",
+        ),
+        (
+            update_records_logic_async(
+                connection, [RecordUpdate(key="VIN1", update_values={"make": "A"})]
+            ),
+            "Error updating records",
+        ),
+        (delete_record_db_logic_async(connection, "VIN123"), "Error deleting record"),
+        (delete_records_db_logic_async(connection, ["VIN1"]), "Error deleting records"),
+    ]
+    for call, detail in calls:
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(call)
+        assert exc_info.value.status_code == 500
+        assert detail in exc_info.value.detail
+
+
+def test_async_logic_reports_busy_pool() -> None:
+    async def query() -> None:
+        # Nothing listens on port 1, so no connection is ever handed out
+        async with AsyncConnectionPool(
+            "host=127.0.0.1 port=1 connect_timeout=1",
+            min_size=0,
+            max_size=1,
+            timeout=0.1,
+            open=False,
+        ) as pool:
+            await get_all_data_logic_async(pool.connection)
 
     with pytest.raises(HTTPException) as exc_info:
-        delete_record_db_logic(mock_get_db_connection, "VIN123", "vin")
+        asyncio.run(query())
 
-    assert exc_info.value.status_code == 500
-    assert "Error deleting record" in exc_info.value.detail
+    assert exc_info.value.status_code == 503
@@ -4,8 +4,11 @@ from unittest.mock import patch, MagicMock
 import polars as pl
 from dagster import build_op_context
 from ETL import create_fake_data, transform_data, load_data, cleanup_data
-from ETL.insert_db import create_table_from_df, db_insert_data
-from ETL import bc_insert_data
+from ETL.insert_db import create_indexes, create_table_from_df, db_insert_data
+from ETL import bc_insert_data, store_data, ChainLoader, LoadCheckpoint
+from blockchain.recordCodec import decode_record
+from blockchain.recordEnvelope import unpack_records
+from blockchain.recordRegistry import RecordRegistry
 
 
 # Fixtures for shared data
@@ -94,31 +97,363 @@ def test_cleanup_data(size: str, file_existence: bool) -> None:
 
 
 # Test blockchain insert
+@patch("ETL.insert_bc.ConnectionPool")
+@patch("ETL.insert_bc.file_digest", return_value="digest")
 @patch("ETL.insert_bc.create_connection")
 @patch("polars.read_parquet")
 @pytest.mark.parametrize("size", ["Small", "Medium", "Large"])
 def test_bc_insert_data(
     mock_read_parquet: MagicMock,
     mock_create_connection: MagicMock,
+    _: MagicMock,
+    mock_pool: MagicMock,
     sample_records: list[dict],
     mock_connection: tuple[str, MagicMock],
     size: str,
+    tmp_path: str,
+    monkeypatch: pytest.MonkeyPatch,
 ) -> None:
     """
     Test bc_insert_data to ensure data is read from Parquet and inserted into the blockchain.
     """
+    os.makedirs(tmp_path / "Src")
+    os.makedirs(tmp_path / "Data" / "Transform" / size)
+    monkeypatch.chdir(tmp_path / "Src")
     account, mock_w3 = mock_connection
     mock_create_connection.return_value = (account, mock_w3)
+    mock_pool.return_value.connection.side_effect = Exception("no database")
     mock_read_parquet.return_value = pl.DataFrame(sample_records)
 
+    sent = fake_node(mock_w3)
+
     # Run the function
-    bc_insert_data(size)
+    report = bc_insert_data(size)
 
     # Assertions
     mock_read_parquet.assert_called_once_with(f"../Data/Transform/{size}/data.parquet")
-    assert mock_w3.eth.send_transaction.call_count == len(
+    assert len(sent) == len(sample_records), "Unexpected number of transactions sent"
+    assert [int(tx["nonce"], 16) for tx in sent] == [7, 8]
+    assert report["confirmed_records"] == report["records"] == len(sample_records)
+    assert report["failures"] == []
+    assert mock_pool.call_args.kwargs["check"] is mock_pool.check_connection
+    mock_pool.return_value.close.assert_called_once()
+    checkpoint = LoadCheckpoint(
+        f"../Data/Transform/{size}/bc_checkpoint.json", "digest"
+    )
+    assert (checkpoint.rows, checkpoint.tx_hash) == (2, f"0x{2:064x}")
+
+    # A rerun over the same data finds everything confirmed and sends nothing
+    report = bc_insert_data(size)
+    assert len(sent) == len(sample_records)
+    assert report["resumed_from"] == len(sample_records)
+
+
+def fake_node(
+    mock_w3: MagicMock, rejections: dict = None, unmined_polls: int = 0
+) -> list:
+    """
+    Answer raw JSON-RPC batches like a node: each accepted transaction is mined in its
+    own block after `unmined_polls` receipt polls, and the send with nonce n is
+    rejected `rejections[n]` times. Returns the accepted transactions.
+    """
+    rejections = dict(rejections or {})
+    sent, polls = [], {}
+
+    def batch(requests: list) -> list:
+        responses = []
+        for method, (param,) in requests:
+            if method == "eth_sendTransaction":
+                nonce = int(param["nonce"], 16)
+                if rejections.get(nonce):
+                    rejections[nonce] -= 1
+                    responses.append({"error": {"message": "rejected"}})
+                    continue
+                sent.append(param)
+                responses.append({"result": f"0x{len(sent):064x}"})
+                continue
+            polls[param] = polls.get(param, 0) + 1
+            if polls[param] <= unmined_polls:
+                responses.append({"result": None})
+                continue
+            responses.append(
+                {
+                    "result": {
+                        "blockNumber": hex(int(param, 16)),
+                        "transactionIndex": "0x0",
+                        "status": "0x1",
+                    }
+                }
+            )
+        return responses
+
+    mock_w3.provider.make_batch_request.side_effect = batch
+    mock_w3.eth.get_transaction_count.return_value = 7
+    return sent
+
+
+def test_chain_loader_window(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    sent = fake_node(mock_w3, unmined_polls=1)
+    records = sample_records * 3
+    loader = ChainLoader(mock_w3, account, in_flight=2, poll_interval=0)
+
+    report = loader.load(records)
+
+    batches = [c.args[0] for c in mock_w3.provider.make_batch_request.call_args_list]
+    sends = [len(b) for b in batches if b[0][0] == "eth_sendTransaction"]
+    assert sends == [2, 2, 2]
+    assert [decode_record(bytes.fromhex(tx["data"][2:])) for tx in sent] == records
+    assert report["positions"] == [
+        (n, 0, 0, f"0x{n:064x}") for n in range(1, len(records) + 1)
+    ]
+    assert report["confirmed_transactions"] == len(records)
+
+
+def test_chain_loader_packed(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    sent = fake_node(mock_w3)
+    records = sample_records * 2 + sample_records[:1]
+
+    report = ChainLoader(mock_w3, account, pack_size=3).load(records)
+
+    assert [unpack_records(bytes.fromhex(tx["data"][2:])) for tx in sent] == [
+        records[:3],
+        records[3:],
+    ]
+    assert [position[:3] for position in report["positions"]] == [
+        (1, 0, 0),
+        (1, 0, 1),
+        (1, 0, 2),
+        (2, 0, 0),
+        (2, 0, 1),
+    ]
+    assert report["transactions"] == 2
+
+
+def test_chain_loader_registry(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    sent = fake_node(mock_w3)
+    registry = RecordRegistry("0x" + "ab" * 20)
+
+    report = ChainLoader(mock_w3, account, registry=registry).load(sample_records)
+
+    assert [tx["to"] for tx in sent] == [registry.address] * len(sample_records)
+    assert [decode_record(bytes.fromhex(tx["data"][2:])[100:]) for tx in sent] == (
         sample_records
-    ), "Unexpected number of transactions sent"
+    )
+    assert report["confirmed_records"] == len(sample_records)
+    with pytest.raises(ValueError):
+        ChainLoader(mock_w3, account, pack_size=10, registry=registry)
+
+
+def test_chain_loader_failures(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    # Nonce 7 is rejected once and then accepted, nonce 8 is rejected every time
+    sent = fake_node(mock_w3, rejections={7: 1, 8: 3})
+
+    report = ChainLoader(mock_w3, account, poll_interval=0).load(sample_records)
+
+    assert [int(tx["nonce"], 16) for tx in sent] == [7]
+    mock_w3.eth.send_transaction.assert_called_once_with(
+        {"from": account, "to": account, "value": 0, "nonce": 8}
+    )
+    assert report["failures"] == [
+        {"rows": [1, 2], "tx_hash": None, "error": str({"message": "rejected"})}
+    ]
+    assert report["confirmed_records"] == 1
+    assert report["failed_records"] == 1
+    assert report["positions"][1] is None
+
+
+def test_chain_loader_resumes_from_checkpoint(
+    sample_records: list[dict],
+    mock_connection: tuple[str, MagicMock],
+    tmp_path: str,
+) -> None:
+    account, mock_w3 = mock_connection
+    records = sample_records * 3
+    path = str(tmp_path / "checkpoint.json")
+    LoadCheckpoint(path, "data-v1").save(4, "0xConfirmed")
+    sent = fake_node(mock_w3)
+
+    # Checkpoints written for other data are ignored
+    assert LoadCheckpoint(path, "data-v2").rows == 0
+
+    checkpoint = LoadCheckpoint(path, "data-v1")
+    report = ChainLoader(mock_w3, account).load(records, checkpoint)
+
+    assert [decode_record(bytes.fromhex(tx["data"][2:])) for tx in sent] == records[4:]
+    assert report["resumed_from"] == 4
+    assert report["confirmed_records"] == 2
+    assert report["failed_records"] == 0
+    assert report["positions"][:4] == [None] * 4
+    assert (LoadCheckpoint(path, "data-v1").rows, checkpoint.tx_hash) == (
+        6,
+        f"0x{2:064x}",
+    )
+
+
+def test_chain_loader_checkpoint_moves_past_failure(
+    sample_records: list[dict],
+    mock_connection: tuple[str, MagicMock],
+    tmp_path: str,
+) -> None:
+    account, mock_w3 = mock_connection
+    sent = fake_node(mock_w3, rejections={8: 3})
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = LoadCheckpoint(path, "data")
+
+    ChainLoader(mock_w3, account).load(sample_records * 2, checkpoint)
+
+    # Row 1 failed for good, it is recorded and the rows after it are confirmed
+    saved = LoadCheckpoint(path, "data")
+    assert (saved.rows, saved.tx_hash) == (1, f"0x{1:064x}")
+    assert (saved.confirmed, saved.failed) == ([[2, 4]], [[1, 2]])
+
+    report = ChainLoader(mock_w3, account).load(sample_records * 2, saved)
+    assert len(sent) == 3
+    assert report["confirmed_records"] == report["failed_records"] == 0
+
+    # Removing the failed range retries the row
+    saved.save(saved.rows, saved.tx_hash, saved.confirmed)
+    report = ChainLoader(mock_w3, account).load(sample_records * 2, saved)
+    assert len(sent) == 4
+    assert report["confirmed_records"] == 1
+    assert (saved.rows, saved.confirmed, saved.failed) == (4, [], [])
+
+
+def test_chain_loader_resume_skips_rows_confirmed_out_of_order(
+    sample_records: list[dict],
+    mock_connection: tuple[str, MagicMock],
+    tmp_path: str,
+) -> None:
+    account, mock_w3 = mock_connection
+    records = sample_records * 3
+    path = str(tmp_path / "checkpoint.json")
+    # A load crashed with rows 2-3 and 5 confirmed behind the unconfirmed row 1
+    LoadCheckpoint(path, "data").save(1, "0xFirst", confirmed=[[2, 4], [5, 6]])
+    sent = fake_node(mock_w3)
+    checkpoint = LoadCheckpoint(path, "data")
+
+    report = ChainLoader(mock_w3, account, pack_size=2).load(records, checkpoint)
+
+    assert [unpack_records(bytes.fromhex(tx["data"][2:])) for tx in sent] == [
+        [records[1]],
+        [records[4]],
+    ]
+    assert report["confirmed_records"] == 2
+    assert (checkpoint.rows, checkpoint.confirmed, checkpoint.failed) == (6, [], [])
+
+
+def test_chain_loader_locates_confirmed_records(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    fake_node(mock_w3)
+    locator = MagicMock()
+    records = sample_records * 2
+
+    ChainLoader(mock_w3, account, pack_size=3, locator=locator).load(records)
+
+    located = [entry for c in locator.add.call_args_list for entry in c.args[0]]
+    assert located == [
+        (records[0], f"0x{1:064x}", 0, 1, 0),
+        (records[1], f"0x{1:064x}", 1, 1, 0),
+        (records[2], f"0x{1:064x}", 2, 1, 0),
+        (records[3], f"0x{2:064x}", 0, 2, 0),
+    ]
+
+
+def test_store_data_locates_sent_records(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    located = []
+    locator = MagicMock()
+    locator.add.side_effect = located.extend
+
+    store_data(sample_records, account, mock_w3, [], pack_size=2, locator=locator)
+
+    assert located == [
+        (record, "0xTransactionHash", slot, None, None)
+        for slot, record in enumerate(sample_records)
+    ]
+
+
+def test_chain_loader_receipt_timeout(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    fake_node(mock_w3, unmined_polls=1)
+    mock_w3.to_wei.return_value = 20000000000
+
+    report = ChainLoader(mock_w3, account, poll_interval=0, receipt_timeout=-1).load(
+        sample_records
+    )
+
+    assert [failure["error"] for failure in report["failures"]] == [
+        "Transaction was not mined in time"
+    ] * len(sample_records)
+    assert report["confirmed_records"] == 0
+    # Each timed out nonce is replaced, so the nonces after it are not stuck
+    assert [c.args[0] for c in mock_w3.eth.send_transaction.call_args_list] == [
+        {
+            "from": account,
+            "to": account,
+            "value": 0,
+            "nonce": nonce,
+            "gasPrice": 40000000000,
+        }
+        for nonce in (7, 8)
+    ]
+
+
+def test_store_data_packed(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    account, mock_w3 = mock_connection
+    mock_w3.eth.send_transaction.side_effect = ["0xPacked1", "0xPacked2"]
+    records = sample_records * 2 + sample_records[:1]
+
+    positions = store_data(records, account, mock_w3, [], pack_size=3)
+
+    assert positions == [
+        ("0xPacked1", 0),
+        ("0xPacked1", 1),
+        ("0xPacked1", 2),
+        ("0xPacked2", 0),
+        ("0xPacked2", 1),
+    ]
+    sent = [c.args[0]["data"] for c in mock_w3.eth.send_transaction.call_args_list]
+    assert [unpack_records(bytes.fromhex(data[2:])) for data in sent] == [
+        records[:3],
+        records[3:],
+    ]
+
+
+def test_store_data_with_codec(
+    sample_records: list[dict], mock_connection: tuple[str, MagicMock]
+) -> None:
+    pytest.importorskip("msgpack")
+    account, mock_w3 = mock_connection
+
+    store_data(sample_records, account, mock_w3, [], codec="msgpack")
+    store_data(sample_records, account, mock_w3, [], pack_size=2, codec="msgpack+zlib")
+
+    sent = [
+        bytes.fromhex(c.args[0]["data"][2:])
+        for c in mock_w3.eth.send_transaction.call_args_list
+    ]
+    assert [decode_record(data) for data in sent[:2]] == sample_records
+    assert unpack_records(sent[2]) == sample_records
 
 
 # Test PostgreSQL insert
@@ -147,13 +482,59 @@ def test_create_table_from_df(mock_connect: MagicMock, sample_df: pl.DataFrame)
     assert "vin TEXT" in create_query, "VIN column missing or incorrect type"
 
 
+@patch("psycopg2.connect")
+def test_create_indexes(mock_connect: MagicMock, sample_df: pl.DataFrame) -> None:
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = None  # No primary key yet
+    mock_cursor.fetchall.return_value = []  # Every vin present and unique
+
+    create_indexes("vehicles", [*sample_df.columns, "license_plate"])
+
+    queries = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert not any(query.startswith("DELETE") for query in queries)
+    assert "ALTER TABLE vehicles ADD PRIMARY KEY (vin)" in queries
+    # vehicle_model is missing, so there is no make/model/year index
+    assert [query for query in queries if query.startswith("CREATE INDEX")] == [
+        "CREATE INDEX IF NOT EXISTS vehicles_license_plate_idx "
+        "ON vehicles (license_plate)"
+    ]
+    assert queries[-1] == "ANALYZE vehicles"
+    assert mock_connect.return_value.commit.called
+
+    # Loading again keeps the existing key
+    mock_cursor.reset_mock()
+    mock_cursor.fetchone.return_value = (1,)
+    create_indexes("vehicles", sample_df.columns)
+    queries = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert not any(query.startswith("ALTER TABLE") for query in queries)
+
+
+@patch("psycopg2.connect")
+def test_create_indexes_reports_bad_keys(
+    mock_connect: MagicMock, sample_df: pl.DataFrame
+) -> None:
+    mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = None
+    mock_cursor.fetchall.return_value = [("1234ABC", 2), (None, 1)]
+
+    with pytest.raises(ValueError, match="1234ABC"):
+        create_indexes("vehicles", sample_df.columns)
+
+    queries = [c.args[0] for c in mock_cursor.execute.call_args_list]
+    assert not any(query.startswith(("DELETE", "ALTER")) for query in queries)
+    assert not mock_connect.return_value.commit.called
+    assert mock_connect.return_value.close.called
+
+
 @patch("ETL.insert_db.load_and_prepare_data")
 @patch("ETL.insert_db.create_table_from_df")
 @patch("ETL.insert_db.insert_data_into_db")
+@patch("ETL.insert_db.create_indexes")
 @patch("psycopg2.connect")
 @pytest.mark.parametrize("size", ["Small", "Medium", "Large"])
 def test_db_insert_data(
     mock_connect: MagicMock,
+    mock_create_indexes: MagicMock,
     mock_insert: MagicMock,
     mock_create_table: MagicMock,
     mock_load_data: MagicMock,
@@ -166,3 +547,4 @@ def test_db_insert_data(
     mock_load_data.assert_called_once()
     mock_create_table.assert_called_once()
     mock_insert.assert_called_once()
+    mock_create_indexes.assert_called_once_with("vehicles", sample_df.columns)